@@ -0,0 +1,14 @@
+"""Background alarm worker, run next to the Streamlit app.
+
+    $ python alarm_worker.py            # check for new data every minute
+    $ python alarm_worker.py --once     # evaluate once and exit
+"""
+from streamlit.logger import set_log_level
+
+# The shared caches work without a Streamlit runtime; silence the warnings about that
+set_log_level("error")
+
+from dashboard.worker import main  # noqa: E402
+
+if __name__ == "__main__":
+    raise SystemExit(main())
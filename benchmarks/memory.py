@@ -0,0 +1,50 @@
+"""In-memory footprint of the raw and canonical tables, before and after compact dtypes.
+
+    $ python -m benchmarks.memory                     # the data in DASHBOARD_DATA_DIR (default data/)
+    $ python -m benchmarks.memory --scale 10          # 10x synthetic data
+
+"before" is each table with its labels as strings and its numbers as
+float64, the layout it had before ``dashboard.schema``; "after" is the
+table as the dashboard holds it. Both include the string data.
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+from streamlit.logger import set_log_level
+
+from benchmarks.run import data_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the memory of the raw and canonical tables.")
+    parser.add_argument("--scale", type=int, help="multiple of the hackathon network size, on synthetic data")
+    parser.add_argument("--work-dir", type=Path, help="where synthetic data is generated and kept")
+    args = parser.parse_args(argv)
+
+    # The dashboard reads its data directory at import
+    if args.scale is not None:
+        work_dir = args.work_dir or Path(tempfile.gettempdir()) / "dashboard-benchmarks"
+        os.environ["DASHBOARD_DATA_DIR"] = str(data_dir(work_dir, args.scale))
+    set_log_level("error")
+
+    import pandas as pd
+
+    from dashboard.data_access import available_sources, load_source
+    from dashboard.normalize import load_canonical
+    from dashboard.schema import footprint_report
+
+    frames = {f"raw {name}": load_source(name) for name in available_sources()}
+    canonical = load_canonical()
+    for source in canonical["source"].cat.categories:
+        frames[f"canonical {source}"] = canonical[canonical["source"] == source]
+    frames["canonical"] = canonical
+
+    report = footprint_report(frames)
+    with pd.option_context("display.float_format", "{:.2f}".format, "display.width", 120):
+        print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
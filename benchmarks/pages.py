@@ -0,0 +1,186 @@
+"""Rerun latency of every dashboard page, driven headlessly with AppTest.
+
+    $ python -m benchmarks.pages                      # pages 1-6 on 1x synthetic data
+    $ python -m benchmarks.pages --scale 10 --budget-factor 10
+    $ python -m benchmarks.pages --pages 1 3          # only some pages
+
+Each page is opened once to warm the shared caches (reported, not
+budgeted), then the interactions below are applied one at a time, the way
+a user moves the site selectbox, the date and threshold sliders or the
+export checkboxes. Every rerun records its wall time, the peak of the
+memory traced by ``tracemalloc`` (Python and numpy allocations; Arrow
+buffers are not traced) and the number of points sent to Plotly charts. An
+interaction slower than its page's budget is reported as OVER BUDGET and
+the command exits with status 1. Tracing memory slows the reruns down, and
+the budgets are set with it on.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.run import data_dir
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Seconds one rerun of the page may take on 1x data, after its first load
+BUDGETS = {
+    "1": 3.0,
+    "2": 2.0,
+    "3": 3.0,
+    "4": 1.0,
+    "5": 1.0,
+    "6": 2.0,
+}
+
+# Plotly trace attributes that hold one entry per point
+POINT_ATTRIBUTES = ["y", "x", "values", "lat", "z"]
+
+
+def _second_option(index):
+    # Selectboxes have no keys on these pages; they are addressed by position
+    def interact(at):
+        selectbox = at.selectbox[index]
+        selectbox.set_value(selectbox.options[1])
+    return interact
+
+
+def _narrow_dates(at):
+    # The most recent quarter of the current date range
+    slider = next(slider for slider in at.slider if slider.label == "Date Range")
+    start, end = slider.value
+    slider.set_range(max(start, end - (end - start) / 4), end)
+
+
+def _slider(label, value):
+    def interact(at):
+        next(slider for slider in at.slider if slider.label == label).set_value(value)
+    return interact
+
+
+def _toggle(label):
+    def interact(at):
+        box = next(box for box in at.checkbox if box.label == label)
+        box.set_value(not box.value)
+    return interact
+
+
+def _click(label):
+    def interact(at):
+        next(button for button in at.button if button.label == label).click()
+    return interact
+
+
+# Page number -> (script, [(interaction name, interaction)])
+PAGES = {
+    "1": ("pages/1_📈_Eco_Detection_Overview.py", [
+        ("site", _second_option(0)),
+        ("date range", _narrow_dates),
+        ("secondary axis", _toggle("Move Chloride Concentration to Secondary Axis")),
+    ]),
+    "2": ("pages/2_🌧️ Rainfall & Streamflow Data.py", [
+        ("site", _second_option(0)),
+        ("storm threshold", _slider("Storm threshold (mm/day)", 20)),
+        ("date range", _narrow_dates),
+    ]),
+    "3": ("pages/3_📊 Eco Detection vs Lab Data Comparison.py", [
+        ("site", _second_option(0)),
+        ("date range", _narrow_dates),
+        ("hide outliers", _toggle("Hide outliers (likely sensor failures)")),
+    ]),
+    "4": ("pages/4_🚨 Alarms & Thresholds.py", [
+        ("site", _second_option(0)),
+        ("turbidity threshold", _slider("Set Turbidity Threshold (NTU)", 20)),
+        ("rainfall threshold", _slider("Set Rainfall Threshold (mm)", 40)),
+        ("matching threshold", _slider("Set Threshold for Eco vs Lab Data Matching (%)", 10)),
+    ]),
+    "5": ("pages/5_🌍 Site Mapping & Data Overview.py", [
+        ("sensor type", _second_option(0)),
+        ("site", _second_option(1)),
+        ("simulate alarms", _toggle("Simulate Alarms")),
+    ]),
+    "6": ("pages/6_📄 Export Reports.py", [
+        ("rainfall off", _toggle("Include Rainfall Data")),
+        ("lab off", _toggle("Include Lab Data")),
+        ("prepare report", _click("Prepare Report")),
+    ]),
+}
+
+
+def _points(trace):
+    # Plotly sends large arrays as base64 typed arrays ({"dtype", "bdata", "shape"})
+    for attribute in POINT_ATTRIBUTES:
+        values = trace.get(attribute)
+        if isinstance(values, list):
+            return len(values)
+        if isinstance(values, dict) and "bdata" in values:
+            if "shape" in values:
+                return int(str(values["shape"]).split(",")[0])
+            return len(base64.b64decode(values["bdata"])) // int(values["dtype"][-1])
+    return 0
+
+
+def plotly_points(at):
+    """Points in all the Plotly charts the last run rendered."""
+    return sum(
+        _points(trace) for chart in at.get("plotly_chart") for trace in json.loads(chart.proto.spec)["data"]
+    )
+
+
+def _timed_run(at):
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    at.run()
+    seconds = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return seconds, tracemalloc.get_traced_memory()[1], plotly_points(at)
+
+
+def run_page(number, budget):
+    """Report rows (page, interaction, seconds, peak bytes, points, status) for one page."""
+    from streamlit.testing.v1 import AppTest
+
+    script, interactions = PAGES[number]
+    at = AppTest.from_file(str(ROOT_DIR / script), default_timeout=600)
+    rows = [(number, "open", *_timed_run(at), "-")]
+    for name, interact in interactions:
+        interact(at)
+        seconds, peak, points = _timed_run(at)
+        rows.append((number, name, seconds, peak, points, "OVER BUDGET" if seconds > budget else "ok"))
+    return rows
+
+
+def _print_report(rows):
+    print(f"{'page':>4}  {'interaction':<22}{'seconds':>9}{'peak MB':>9}{'points':>9}  status")
+    for number, name, seconds, peak, points, status in rows:
+        print(f"{number:>4}  {name:<22}{seconds:>9.3f}{peak / 2**20:>9.1f}{points:>9,}  {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time page reruns with AppTest on synthetic data.")
+    parser.add_argument("--pages", nargs="+", default=list(PAGES), choices=list(PAGES), help="page numbers")
+    parser.add_argument("--scale", type=int, default=1, help="multiple of the hackathon network size")
+    parser.add_argument("--budget-factor", type=float, default=1.0, help="multiplies every budget, e.g. for larger scales")
+    parser.add_argument("--work-dir", type=Path, help="where synthetic data is generated and kept")
+    args = parser.parse_args(argv)
+
+    # The dashboard reads its data directory at import, so it is set before any page runs
+    work_dir = args.work_dir or Path(tempfile.gettempdir()) / "dashboard-benchmarks"
+    os.environ["DASHBOARD_DATA_DIR"] = str(data_dir(work_dir, args.scale))
+
+    tracemalloc.start()
+    rows = []
+    for number in args.pages:
+        rows += run_page(number, BUDGETS[number] * args.budget_factor)
+    _print_report(rows)
+    return 1 if any(row[-1] == "OVER BUDGET" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
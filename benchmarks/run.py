@@ -0,0 +1,114 @@
+"""Run the pipeline benchmarks and compare them with the stored baseline.
+
+    $ python -m benchmarks.run                      # 1x and 10x against benchmarks/baseline.json
+    $ python -m benchmarks.run --scales 1 10 100 1000 --work-dir /data/bench
+    $ python -m benchmarks.run --update-baseline    # record the current timings as the baseline
+
+Synthetic data for each scale is generated once into the work directory
+and reused on later runs. A case regresses when it is more than
+``--tolerance`` slower than its baseline (and by more than a few
+milliseconds, so timer noise on tiny cases is ignored). A scale with a
+regression is run a second time to rule out a noisy run; if the
+regression holds, the command exits with status 1. Baselines are
+machine-specific: record them on the machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.synthetic import generate
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+DEFAULT_SCALES = [1, 10]
+
+# Slowdown (fraction of the baseline) that counts as a regression, and the smallest one that counts at all
+TOLERANCE = 0.5
+MIN_DELTA = 0.1
+
+
+def data_dir(work_dir, scale):
+    """Directory with synthetic data at `scale`, generated on first use."""
+    directory = work_dir / f"scale-{scale}"
+    if not all((directory / name).exists() for name in ["ecodetection_clean_data.csv", "monitoring_stations.xlsx"]):
+        print(f"Generating {scale}x synthetic data in {directory} ...", file=sys.stderr)
+        generate(directory, scale)
+    return directory
+
+
+def run_scale(work_dir, scale, repeat):
+    """Timings of every case at `scale`, measured in a fresh process."""
+    env = dict(os.environ, DASHBOARD_DATA_DIR=str(data_dir(work_dir, scale)))
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--repeat", str(repeat)],
+        cwd=ROOT_DIR, env=env, check=True, capture_output=True, text=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Report rows (scale, case, seconds, baseline, ratio, status) and whether anything regressed."""
+    rows = []
+    regressed = False
+    for scale, timings in results.items():
+        for case, seconds in timings.items():
+            reference = baseline.get("timings", {}).get(scale, {}).get(case)
+            if reference is None:
+                rows.append((scale, case, seconds, None, None, "new"))
+                continue
+            ratio = seconds / reference if reference else float("inf")
+            slower = seconds > reference * (1 + tolerance) and seconds - reference > MIN_DELTA
+            regressed |= slower
+            rows.append((scale, case, seconds, reference, ratio, "REGRESSION" if slower else "ok"))
+    return rows, regressed
+
+
+def _print_report(rows):
+    print(f"{'scale':>6}  {'case':<16}{'seconds':>10}{'baseline':>10}{'ratio':>8}  status")
+    for scale, case, seconds, reference, ratio, status in rows:
+        reference = "-" if reference is None else f"{reference:.3f}"
+        ratio = "-" if ratio is None else f"{ratio:.2f}"
+        print(f"{scale + 'x':>6}  {case:<16}{seconds:>10.3f}{reference:>10}{ratio:>8}  {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="network size multiples")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    parser.add_argument("--work-dir", type=Path, help="where synthetic data is generated and kept")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, e.g. 0.5 = 50%%")
+    parser.add_argument("--update-baseline", action="store_true", help="store these timings as the baseline")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or Path(tempfile.gettempdir()) / "dashboard-benchmarks"
+    results = {str(scale): run_scale(work_dir, scale, args.repeat) for scale in args.scales}
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    rows, regressed = compare(results, baseline, args.tolerance)
+    if regressed and not args.update_baseline:
+        # Confirm: re-run the scales that regressed and keep each case's faster time
+        for scale in sorted({row[0] for row in rows if row[-1] == "REGRESSION"}, key=int):
+            print(f"Re-running {scale}x to confirm the regression ...", file=sys.stderr)
+            again = run_scale(work_dir, int(scale), args.repeat)
+            results[scale] = {case: min(seconds, again[case]) for case, seconds in results[scale].items()}
+        rows, regressed = compare(results, baseline, args.tolerance)
+    _print_report(rows)
+
+    if args.update_baseline:
+        baseline["machine"] = f"{platform.machine()} {platform.system()}, Python {platform.python_version()}"
+        baseline.setdefault("timings", {}).update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
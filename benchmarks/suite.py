@@ -0,0 +1,124 @@
+"""Timed steps of the data pipeline, run against one data directory.
+
+``benchmarks.run`` starts this module in a fresh process with
+DASHBOARD_DATA_DIR pointing at the synthetic data, because the dashboard
+reads that variable at import. Each case is timed ``--repeat`` times after
+its setup and the fastest run is reported, as JSON on stdout.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from streamlit.logger import set_log_level
+
+# The shared caches work without a Streamlit runtime; silence the warnings about that
+set_log_level("error")
+
+import pandas as pd  # noqa: E402
+import streamlit as st  # noqa: E402
+
+from dashboard.data_access import CACHE_DIR, cached_parquet  # noqa: E402
+from dashboard.export import SECTIONS, ExportFilter, write_csv, write_parquet  # noqa: E402
+from dashboard.matching import match_lab_samples  # noqa: E402
+from dashboard.normalize import _canonical_sources, _normalize, load_canonical  # noqa: E402
+from dashboard.outliers import flag_outliers  # noqa: E402
+from dashboard.rollups import rollup_store  # noqa: E402
+from dashboard.schema import concat  # noqa: E402
+from dashboard.store import canonical_store  # noqa: E402
+from dashboard.wide import pivot_wide, wide_view  # noqa: E402
+
+# Window a page typically shows: one week of every measurement at one site
+FILTER_WINDOW = pd.Timedelta(days=7)
+
+
+def _clear_caches():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def _best(case, setup=lambda: None, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        case(state)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _cold():
+    # Nothing cached on disk or in memory, as on a fresh deployment
+    _clear_caches()
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def _load(_):
+    for name in _canonical_sources():
+        cached_parquet(name)
+
+
+def _normalized():
+    _clear_caches()
+    return None
+
+
+def _normalize_all(_):
+    concat([_normalize(name) for name in _canonical_sources()], ignore_index=True)
+
+
+def _filter(store):
+    # Every EcoDetection site, one week each, as page 1 and page 3 read it
+    for site in sorted({site for source, site, _ in store.keys() if source == "ecodetection"}):
+        first, _ = store.time_bounds("ecodetection", site)
+        store.slice("ecodetection", site, start=first, end=first + FILTER_WINDOW)
+
+
+def _warm_store():
+    # The partitions are read from disk once, so the case times the slicing a page rerun does
+    _clear_caches()
+    store = canonical_store()
+    _filter(store)
+    return store
+
+
+def run(repeat=3):
+    """Timings (seconds) of every case against the data in DATA_DIR."""
+    timings = {}
+    timings["load"] = _best(_load, _cold, repeat)
+    timings["normalize"] = _best(_normalize_all, _normalized, repeat)
+
+    canonical = load_canonical()
+    timings["outliers"] = _best(lambda df: flag_outliers(df), lambda: canonical, repeat)
+    timings["filter"] = _best(_filter, _warm_store, repeat)
+
+    store = canonical_store()
+    lab_sites = sorted({site for source, site, _ in store.keys() if source == "lab"})
+    timings["eco_lab_merge"] = _best(lambda _: match_lab_samples("Turbidity", lab_sites), repeat=repeat)
+
+    eco = load_canonical("ecodetection")
+    timings["pivot"] = _best(lambda df: pivot_wide(df), lambda: eco, repeat)
+
+    daily, wide = rollup_store("daily"), wide_view("daily")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp)
+        timings["export_csv"] = _best(
+            lambda _: write_csv(path / "report.csv", list(SECTIONS), store, daily, wide, ExportFilter()), repeat=repeat
+        )
+        timings["export_parquet"] = _best(
+            lambda _: write_parquet(path / "report.parquet", list(SECTIONS), store, daily, wide, ExportFilter()), repeat=repeat
+        )
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the pipeline against DASHBOARD_DATA_DIR.")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
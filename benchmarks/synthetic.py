@@ -0,0 +1,175 @@
+"""Synthetic data in the layout of the files under ``data/``.
+
+Scale 1 is about the size of the hackathon data: the four EcoDetection
+sites with a month of 15-minute readings, three BOM stations with 14 years
+of daily observations, three WIMS gauges with two years of hourly flow and
+fortnightly lab samples at two sites. A larger scale multiplies the number
+of sites and stations, the way the monitoring network grows, and keeps the
+history per series fixed.
+
+    $ python -m benchmarks.synthetic /tmp/bench-data --scale 10
+"""
+import argparse
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ECO_SITES = ["Kangaroo Creek", "Little Coliban River", "Five Mile Creek - Woodend RWP Site 1", "Five Mile Creek - Woodend RWP Site 2"]
+
+ECO_UNITS = {
+    "Chloride Concentration": "ppb",
+    "Fluoride Concentration": "ppb",
+    "Sulphate Concentration": "ppb",
+    "Nitrate Concentration": "ppb",
+    "Nitrite Concentration": "ppb",
+    "Phosphate Concentration": "ppb",
+    "Enclosure Temperature": "°C",
+    "Temperature": "°C",
+    "Conductivity": "uS/cm",
+    "Nephelo Turbidity": "NTU",
+    "Oxygen": "mg/L",
+    "pH": "pH",
+}
+
+LAB_UNITS = {
+    "Turbidity": "NTU",
+    "Nitrate - Nitrogen": "mg N / L",
+    "Nitrite - Nitrogen": "mg N / L",
+    "Phosphate": "mg P / L",
+    "Electrical Conductivity": "uS/cm",
+    "pH": "Units",
+    "Total Nitrogen": "mg/L",
+    "E Coli": "MPN/100mL",
+}
+
+# Lab subsite codes of the two sampled EcoDetection sites
+LAB_SITES = {"SITE17": "Kangaroo Creek", "SITE2": "Little Coliban River"}
+
+BOM_STATIONS = ["088037", "088061", "088051"]
+WIMS_STATIONS = ["406281", "406280", "406266"]
+
+# First EcoDetection reading, as the Excel serial date the export uses (2023-09-01)
+ECO_START = 45170.0
+ECO_DAYS = 30
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+# The station registry is copied as is; synthetic stations are simply not in it
+STATIONS_PATH = Path(__file__).resolve().parent.parent / "data" / "monitoring_stations.xlsx"
+
+
+def _names(base, count, make):
+    # The real names first, then made-up ones for the extra sites of larger scales
+    return base[:count] + [make(i) for i in range(len(base), count)]
+
+
+def _day_first(dates):
+    # 1/01/2010 as in the exports: no leading zero on the day
+    return dates.day.astype(str) + dates.strftime("/%m/%Y")
+
+
+def ecodetection(rng, scale):
+    sites = _names(ECO_SITES, len(ECO_SITES) * scale, lambda i: f"Synthetic Site {i}")
+    readings = ECO_DAYS * 96
+    timestamps = ECO_START + np.arange(readings) / 96
+    frames = []
+    for site in sites:
+        for measurement, unit in ECO_UNITS.items():
+            values = rng.gamma(2, 5, readings)
+            # A few sensor spikes for the outlier detector to find
+            values[rng.random(readings) < 0.002] *= 40
+            frames.append(pd.DataFrame({
+                "timestamp": timestamps, "location": site, "measurement": measurement, "unit": unit, "result": values,
+            }))
+    # The export is not sorted by site or time
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=1), sites
+
+
+def bom(rng, scale):
+    stations = _names(BOM_STATIONS, len(BOM_STATIONS) * scale, lambda i: f"{90000 + i:06d}")
+    days = pd.date_range("2010-01-01", "2023-12-31", freq="D")
+    frames = []
+    for station in stations:
+        wet = rng.random(len(days)) < 0.3
+        frames.append(pd.DataFrame({
+            "date": days,
+            "station_number": station,
+            "rainfall": np.where(wet, rng.gamma(0.8, 8, len(days)).round(1), 0.0),
+            "rain_period": 1,
+            "rain_quality": "Y",
+            "max_temp": rng.normal(20, 6, len(days)).round(1),
+            "max_temp_days": 1,
+            "min_temp": rng.normal(7, 4, len(days)).round(1),
+            "min_temp_days": 1,
+        }))
+    df = pd.concat(frames, ignore_index=True).sort_values("date", kind="stable")
+    df["date"] = _day_first(df["date"].dt) + " 0:00"
+    return df
+
+
+def wims(rng, scale):
+    stations = _names(WIMS_STATIONS, len(WIMS_STATIONS) * scale, lambda i: f"{500000 + i}")
+    hours = pd.date_range("2022-01-01", "2023-12-12", freq="h")
+    return {
+        station: pd.DataFrame({"datetime": hours.strftime("%d/%m/%Y %H:%M"), "discharge_ml_day": rng.gamma(2, 10, len(hours))})
+        for station in stations
+    }
+
+
+def lab(rng, eco_sites):
+    # Sampled sites: the real two, then every other synthetic EcoDetection site (keyed by its name)
+    codes = dict(LAB_SITES)
+    codes.update({site: site for site in eco_sites[len(ECO_SITES)::2]})
+    dates = EXCEL_EPOCH + pd.to_timedelta(ECO_START, unit="D") + pd.to_timedelta(np.arange(0, ECO_DAYS, 14), unit="D")
+    rows = []
+    sample = 8_000_000
+    for code, name in codes.items():
+        for date in dates:
+            sample += 1
+            for measure, unit in LAB_UNITS.items():
+                result = round(float(rng.gamma(2, 5)), 3)
+                rows.append((code, name, "Catchment", "Synthetic", "Synthetic", f"{date.day}/{date:%m/%Y}", sample,
+                             measure, result, "NULL", result, unit))
+    return pd.DataFrame(rows, columns=[
+        "Subsite_Code", "Subsite_Name", "Subsite_Type", "System", "Zone", "date_sampled", "Sample_No",
+        "Measure", "Result", "Result_Qualifier", "Result_Text", "Units",
+    ])
+
+
+def generate(out_dir, scale=1, seed=0):
+    """Write a synthetic data directory at `scale` into `out_dir`; returns rows written per source."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    eco, eco_sites = ecodetection(rng, scale)
+    eco.to_csv(out_dir / "ecodetection_clean_data.csv", index=False)
+    rainfall = bom(rng, scale)
+    rainfall.to_csv(out_dir / "clean_bom_data.csv", index=False, na_rep="NA")
+    flows = wims(rng, scale)
+    for station, flow in flows.items():
+        flow.to_csv(out_dir / f"clean_wims_{station}.csv", index=False)
+    samples = lab(rng, eco_sites)
+    samples.to_csv(out_dir / "cw_catchment_sampling.csv", index=False, encoding="utf-8-sig")
+    shutil.copy(STATIONS_PATH, out_dir)
+    return {
+        "ecodetection": len(eco),
+        "bom": len(rainfall),
+        "wims": sum(len(flow) for flow in flows.values()),
+        "lab": len(samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic dashboard data files.")
+    parser.add_argument("out_dir", help="directory to write the CSV files to")
+    parser.add_argument("--scale", type=int, default=1, help="multiple of the hackathon network size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    rows = generate(args.out_dir, args.scale, args.seed)
+    print(", ".join(f"{source}: {count:,} rows" for source, count in rows.items()))
+
+
+if __name__ == "__main__":
+    main()
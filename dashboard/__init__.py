@@ -0,0 +1 @@
+"""Shared data layer for the Barwon Of A Kind dashboard pages."""
@@ -0,0 +1,79 @@
+"""Threshold alarm indexes.
+
+An AlarmIndex keeps one measurement's readings twice: in time order (most
+recent first) and as a sorted copy of their values. The number of readings
+above a threshold is then one binary search, and the most recent
+exceedances are found without filtering the full table, so moving a
+threshold slider costs the same with thousands or millions of readings.
+"""
+import numpy as np
+import streamlit as st
+
+from dashboard.data_access import ingested_versions
+from dashboard.normalize import canonical_parquet, load_canonical
+
+# Recency-ordered values scanned per step when looking for recent exceedances
+SCAN_BLOCK = 4096
+
+
+class AlarmIndex:
+    """Readings of one measurement indexed by value and by recency."""
+
+    def __init__(self, rows):
+        rows = rows.dropna(subset=["value"]).sort_values("timestamp", ascending=False, kind="stable")
+        self.rows = rows.reset_index(drop=True)
+        self._values = self.rows["value"].to_numpy(dtype="float64")
+
+        # Row pointers in ascending value order, and the values in that order
+        self._order = np.argsort(self._values, kind="stable")
+        self._sorted = self._values[self._order]
+
+    def __len__(self):
+        return len(self._values)
+
+    def _first_above(self, threshold):
+        return int(np.searchsorted(self._sorted, threshold, side="right"))
+
+    def count_above(self, threshold):
+        """Number of readings strictly above `threshold`."""
+        return len(self) - self._first_above(threshold)
+
+    def recent_above(self, threshold, n):
+        """The `n` most recent readings above `threshold`, most recent first."""
+        first = self._first_above(threshold)
+        matches = len(self) - first
+        if matches == 0 or n <= 0:
+            return self.rows.iloc[0:0]
+
+        # Picking from all exceedances costs ~matches; scanning from the most recent
+        # costs ~n * len / matches. Use whichever is cheaper.
+        if matches * matches <= n * len(self):
+            # Few exceedances: take their row pointers straight from the value index
+            positions = self._order[first:]
+            if matches > n:
+                positions = np.partition(positions, n - 1)[:n]
+            positions = np.sort(positions)
+        else:
+            # Many exceedances: a short scan from the most recent finds n
+            found = []
+            for start in range(0, len(self), SCAN_BLOCK):
+                block = self._values[start:start + SCAN_BLOCK]
+                found.append(np.flatnonzero(block > threshold) + start)
+                if sum(len(hits) for hits in found) >= n:
+                    break
+            positions = np.concatenate(found)[:n]
+        return self.rows.iloc[positions]
+
+
+@st.cache_resource(max_entries=16)
+def _alarm_index(path, mtime_ns, source, measurement, batches):
+    # Shared by all sessions; `batches` rebuilds the index after an upload
+    df = load_canonical(source)
+    return AlarmIndex(df[df["measurement"] == measurement])
+
+
+def alarm_index(source, measurement):
+    """Shared AlarmIndex over all sites of one canonical measurement."""
+    path = canonical_parquet()
+    batches = ingested_versions().get(source, ())
+    return _alarm_index(str(path), path.stat().st_mtime_ns, source, measurement, batches)
@@ -0,0 +1,414 @@
+"""Shared data access for the dashboard pages.
+
+Each raw source (CSV / XLSX) is parsed once into a typed Parquet file under
+``data/.cache`` and every page is served from that copy. A cached file is
+reused while the source's mtime and size are unchanged; if they change, the
+source is re-hashed and only re-parsed when its content actually differs.
+Large sources are converted in chunks and read back with column and
+predicate pushdown, so neither step holds the whole file in memory.
+
+Loaded frames are shared: one copy per file for the whole process, held
+with ``st.cache_resource`` instead of being pickled into every caller.
+Each caller gets a shallow copy, and with pandas' copy-on-write its
+filters, column selections and added columns never copy or alter the
+shared data.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from dashboard.schema import CANONICAL_SCHEMA, RAW_SCHEMAS, compact, concat
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(os.environ.get("DASHBOARD_DATA_DIR", ROOT_DIR / "data"))
+CACHE_DIR = DATA_DIR / ".cache"
+# Uploaded data, one append-only batch file per upload (see dashboard.ingest)
+INGEST_DIR = DATA_DIR / "ingested"
+
+# Bump when a reader changes so existing Parquet copies are rebuilt
+CACHE_VERSION = 4
+
+# Rows parsed at a time when converting chunked sources
+CHUNK_ROWS = 100_000
+
+# Text columns of the BOM export, the same type in every chunk
+BOM_TEXT = {"date": "string", "station_number": "string", "rain_quality": "string"}
+
+# Shared frames kept in memory; old ones (of rebuilt files) age out
+SHARED_FRAMES = 32
+
+# Held while a rebuilt dataset directory is swapped in for the live one
+_swap_lock = threading.Lock()
+
+
+def _parse_dates(values, fmt):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    if parsed.isna().all() and values.notna().any():
+        # Not the usual export format (e.g. an uploaded file); fall back to day-first parsing
+        parsed = pd.to_datetime(values, dayfirst=True, format="mixed", errors="coerce")
+    return parsed
+
+
+def _coerce_ecodetection(df):
+    df["timestamp"] = pd.to_numeric(df["timestamp"], errors="coerce")
+    df["result"] = pd.to_numeric(df["result"], errors="coerce")
+    return df
+
+
+def _coerce_bom(df):
+    # Station numbers keep their leading zero (e.g. 088037); dates are DD/MM/YYYY
+    df["station_number"] = df["station_number"].astype("string")
+    df["date"] = _parse_dates(df["date"], "%d/%m/%Y %H:%M")
+    # Uploads may carry only some of the observations
+    for column in ["rainfall", "rain_period", "max_temp", "max_temp_days", "min_temp", "min_temp_days"]:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df
+
+
+def _coerce_lab(df):
+    df["date_sampled"] = _parse_dates(df["date_sampled"], "%d/%m/%Y")
+    df["Result"] = pd.to_numeric(df["Result"], errors="coerce")
+    if "Sample_No" in df:
+        df["Sample_No"] = pd.to_numeric(df["Sample_No"], errors="coerce")
+    return df
+
+
+def _coerce_wims(df):
+    df["datetime"] = _parse_dates(df["datetime"], "%d/%m/%Y %H:%M")
+    df["discharge_ml_day"] = pd.to_numeric(df["discharge_ml_day"], errors="coerce")
+    return df
+
+
+# Raw layout -> coercion of its columns to the cached types
+COERCE = {
+    "ecodetection": _coerce_ecodetection,
+    "bom": _coerce_bom,
+    "lab": _coerce_lab,
+    "wims": _coerce_wims,
+}
+
+
+def coerce_raw(kind, df):
+    """Type the columns of a raw `kind` table, as read from CSV or Excel, compactly (see dashboard.schema)."""
+    return compact(COERCE[kind](df.copy()), RAW_SCHEMAS[kind])
+
+
+def _read_ecodetection(path):
+    return coerce_raw("ecodetection", pd.read_csv(path))
+
+
+def _read_bom(path):
+    # Stream the file; each chunk is written as one row group per station, so
+    # station and date predicates can skip row groups by their statistics.
+    # Text columns are typed up front: a chunk where one is empty would
+    # otherwise be read as float and not match the schema of the others
+    chunks = pd.read_csv(path, dtype=BOM_TEXT, chunksize=CHUNK_ROWS)
+    for chunk in chunks:
+        chunk = coerce_raw("bom", chunk).sort_values(["station_number", "date"], kind="stable")
+        for _, rows in chunk.groupby("station_number", sort=False, dropna=False):
+            yield rows
+
+
+def _read_lab_xlsx(path):
+    return coerce_raw("lab", pd.read_excel(path))
+
+
+def _read_lab_csv(path):
+    return coerce_raw("lab", pd.read_csv(path, encoding="utf-8-sig"))
+
+
+def _read_wims(path):
+    return coerce_raw("wims", pd.read_csv(path))
+
+
+# Source name -> (file name in DATA_DIR, reader)
+SOURCES = {
+    "ecodetection": ("ecodetection_clean_data.csv", _read_ecodetection),
+    "bom": ("clean_bom_data.csv", _read_bom),
+    "lab": ("cw_catchment_sampling_filtered.xlsx", _read_lab_xlsx),
+    "lab_full": ("cw_catchment_sampling.csv", _read_lab_csv),
+}
+
+
+def _source(name):
+    # Streamflow files are one per WIMS station, e.g. wims_406280 -> clean_wims_406280.csv
+    if name.startswith("wims_"):
+        return f"clean_{name}.csv", _read_wims
+    return SOURCES[name]
+
+
+def source_path(name):
+    return DATA_DIR / _source(name)[0]
+
+
+def available_sources():
+    """Names of the sources whose raw files are present in DATA_DIR."""
+    names = [name for name, (filename, _) in SOURCES.items() if (DATA_DIR / filename).exists()]
+    names += sorted(path.stem.removeprefix("clean_") for path in DATA_DIR.glob("clean_wims_*.csv"))
+    return names
+
+
+def _chunk_schema(schema):
+    # Each chunk's categoricals have their own categories, so a later chunk can
+    # need wider dictionary indices than the first; write them all as int32.
+    # Reading the file back unifies the dictionaries and narrows the codes again
+    fields = [
+        field.with_type(pa.dictionary(pa.int32(), field.type.value_type)) if pa.types.is_dictionary(field.type) else field
+        for field in schema
+    ]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _write_parquet(data, path):
+    # Readers return either a DataFrame or an iterator of DataFrame chunks
+    if isinstance(data, pd.DataFrame):
+        data.to_parquet(path, index=False)
+        return
+
+    writer = None
+    try:
+        for frame in data:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, _chunk_schema(table.schema))
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame().to_parquet(path, index=False)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_meta(meta_path):
+    try:
+        return json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _temp_path(directory, suffix):
+    # A file of its own per builder, so concurrent sessions never replace each other's half-written output
+    fd, path = tempfile.mkstemp(dir=directory, suffix=suffix)
+    os.close(fd)
+    return Path(path)
+
+
+def _write_meta(meta_path, meta):
+    tmp = _temp_path(meta_path.parent, ".json")
+    try:
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, meta_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def cached_parquet(name):
+    """Return the path of an up-to-date Parquet copy of source `name`."""
+    filename, reader = _source(name)
+    src = DATA_DIR / filename
+    stat = src.stat()  # Raises FileNotFoundError for missing sources
+    target = CACHE_DIR / f"{name}.parquet"
+    meta_path = CACHE_DIR / f"{name}.json"
+
+    meta = _read_meta(meta_path)
+    fresh = meta is not None and target.exists() and meta.get("version") == CACHE_VERSION
+    if fresh and meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+        return target
+
+    digest = _file_hash(src)
+    if not (fresh and meta["sha256"] == digest):
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = _temp_path(CACHE_DIR, ".parquet")
+        try:
+            _write_parquet(reader(src), tmp)
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    _write_meta(meta_path, {
+        "version": CACHE_VERSION,
+        "source": filename,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+    })
+    return target
+
+
+def source_digest(name):
+    """Content hash of source `name`, refreshing its Parquet copy if needed."""
+    cached_parquet(name)
+    return _read_meta(CACHE_DIR / f"{name}.json")["sha256"]
+
+
+def derived_parquet(name, inputs, version, build):
+    """Return the path of a Parquet table derived from other cached data.
+
+    `inputs` is a JSON-serialisable key (typically source digests); the table
+    is rebuilt with `build()` only when `inputs` or `version` change.
+    """
+    target = CACHE_DIR / f"{name}.parquet"
+    meta_path = CACHE_DIR / f"{name}.json"
+    key = {"version": version, "inputs": inputs}
+
+    meta = _read_meta(meta_path)
+    if meta == key and target.exists():
+        return target
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _temp_path(CACHE_DIR, ".parquet")
+    try:
+        build().to_parquet(tmp, index=False)
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+    _write_meta(meta_path, key)
+    return target
+
+
+def derived_dataset(name, inputs, version, build):
+    """Return the directory of a partitioned dataset derived from other cached data.
+
+    Like `derived_parquet`, but `build(directory)` writes the dataset's files
+    itself, into a directory of its own; the finished directory replaces the
+    old one under a lock, so concurrent builders never swap at the same time.
+    """
+    target = CACHE_DIR / name
+    meta_path = CACHE_DIR / f"{name}.json"
+    key = {"version": version, "inputs": inputs}
+
+    meta = _read_meta(meta_path)
+    if meta == key and target.is_dir():
+        return target
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=f"{name}."))
+    try:
+        build(tmp)
+        with _swap_lock:
+            # Another session may have finished the same build meanwhile; keep its directory
+            if _read_meta(meta_path) == key and target.is_dir():
+                return target
+            old = CACHE_DIR / f"{name}.old"
+            shutil.rmtree(old, ignore_errors=True)
+            if target.exists():
+                os.replace(target, old)
+            os.replace(tmp, target)
+            shutil.rmtree(old, ignore_errors=True)
+            _write_meta(meta_path, key)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def hive_directories(root):
+    """Partition values -> directory, for every leaf directory of a hive-partitioned dataset."""
+    leaves = {}
+
+    def walk(path, values):
+        children = [entry for entry in os.scandir(path) if entry.is_dir() and "=" in entry.name]
+        if not children:
+            leaves[tuple(values)] = Path(path)
+        for entry in children:
+            walk(entry.path, values + [unquote(entry.name.partition("=")[2])])
+
+    walk(root, [])
+    return leaves
+
+
+def _read_frame(path):
+    # One block per column, handed over from Arrow without consolidating (and copying) them
+    return pq.read_table(path).to_pandas(split_blocks=True, self_destruct=True)
+
+
+@st.cache_resource(max_entries=SHARED_FRAMES)
+def _load_parquet(path, mtime_ns):
+    # mtime_ns is part of the cache key so a rebuilt Parquet file is picked up
+    return _read_frame(path)
+
+
+def shared_view(df):
+    """A caller's own view of a shared frame; nothing is copied until one side writes.
+
+    Relies on copy-on-write, which is always on from pandas 3 (see requirements.txt).
+    """
+    return df.copy(deep=False)
+
+
+def load_parquet(path):
+    """The Parquet file at `path` as a view of the frame shared by all sessions."""
+    return shared_view(_load_parquet(str(path), path.stat().st_mtime_ns))
+
+
+def scan_parquet(path, columns=None, filters=None):
+    """Read `columns` of the rows matching `filters` from a Parquet file.
+
+    `filters` uses pyarrow's ``[(column, op, value), ...]`` form; row groups
+    whose statistics rule a predicate out are never read.
+    """
+    return pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+
+
+def scan_dataset(root, partitioning, columns=None, filters=None):
+    """Read `columns` of the rows matching `filters` from a hive-partitioned dataset.
+
+    Directories whose partition values rule a predicate out are never
+    opened; the remaining predicates are pushed down into the files.
+    """
+    return pq.read_table(root, columns=columns, filters=filters or None, partitioning=partitioning).to_pandas()
+
+
+def load_source(name):
+    """Load source `name` from its Parquet cache, converting it first if needed."""
+    return load_parquet(cached_parquet(name))
+
+
+def read_source(name):
+    """Like `load_source`, but a frame of the caller's own that is not kept in memory afterwards.
+
+    For one-off reads such as building derived tables, so whole raw sources
+    do not stay among the shared frames for the life of the process.
+    """
+    return _read_frame(cached_parquet(name))
+
+
+def ingested_versions():
+    """Source -> names of its ingested batches, in ingest order."""
+    if not INGEST_DIR.exists():
+        return {}
+    return {
+        directory.name: tuple(sorted(path.stem for path in directory.glob("*.parquet")))
+        for directory in sorted(INGEST_DIR.iterdir())
+        if directory.is_dir()
+    }
+
+
+def ingested_rows(source, batches=None):
+    """Canonical rows of `source` from the given ingested batches (default: all), oldest first."""
+    if batches is None:
+        batches = ingested_versions().get(source, ())
+    frames = [compact(pd.read_parquet(INGEST_DIR / source / f"{batch}.parquet"), CANONICAL_SCHEMA) for batch in batches]
+    if not frames:
+        return None
+    return concat(frames, ignore_index=True)
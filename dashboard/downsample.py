@@ -0,0 +1,112 @@
+"""Point reduction for Plotly time-series traces.
+
+A chart cannot show more detail than it has pixels, so each trace is capped
+at a few points per pixel of chart width (scaled by how much of the selected
+date window the trace covers). Reduction uses LTTB (Largest-Triangle-Three-
+Buckets) or per-bucket min/max, both of which keep spikes visible. Narrowing
+the date range leaves fewer raw points in the window, so full resolution
+comes back as the user zooms in.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Width of a chart in the default centered page layout
+DEFAULT_WIDTH_PX = 704
+POINTS_PER_PIXEL = 2
+
+# Traces with more points than this are drawn with WebGL (same cut-off as plotly express)
+WEBGL_THRESHOLD = 1000
+
+
+def point_budget(x, window=None, width_px=DEFAULT_WIDTH_PX):
+    """Maximum number of points worth drawing for a trace with x values `x`."""
+    budget = width_px * POINTS_PER_PIXEL
+    if window is not None and len(x):
+        window_span = pd.Timestamp(window[1]) - pd.Timestamp(window[0])
+        trace_span = x.max() - x.min()
+        if window_span > pd.Timedelta(0):
+            budget = int(budget * min(1.0, trace_span / window_span))
+    return max(budget, 3)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the `n_out` points chosen by Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # First and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    # Average point of every bucket (the last "bucket" is the final point)
+    counts = np.diff(np.append(edges, n))
+    avg_x = np.add.reduceat(x, edges) / counts
+    avg_y = np.add.reduceat(y, edges) / counts
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, n_out):
+    """Indices of the minimum and maximum of each bucket, plus both end points."""
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+
+    n_buckets = max((n_out - 2) // 2, 1)
+    bucket = np.arange(n) * n_buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends], [0, n - 1]]))
+
+
+def downsample(df, x, y, max_points=None, method="lttb", window=None):
+    """Rows of `df` (sorted by `x`) reduced to at most `max_points`."""
+    df = df.dropna(subset=[y])
+    if max_points is None:
+        max_points = point_budget(df[x], window)
+    if len(df) <= max_points:
+        return df.sort_values(x)
+
+    if not df[x].is_monotonic_increasing:
+        df = df.sort_values(x)
+    if method == "minmax":
+        indices = minmax_indices(df[y].to_numpy(), max_points)
+    else:
+        # Work relative to the first x value so float64 keeps full precision
+        xs = df[x].to_numpy()
+        xs = (xs - xs[0]).astype("float64") if np.issubdtype(xs.dtype, np.datetime64) else xs.astype("float64")
+        indices = lttb_indices(xs, df[y].to_numpy(dtype="float64"), max_points)
+    return df.iloc[indices]
+
+
+def downsample_groups(df, x, y, by, max_points=None, method="lttb", window=None):
+    """Downsample each `by` group (one plotly express trace) independently."""
+    groups = [downsample(group, x, y, max_points, method, window) for _, group in df.groupby(by, sort=False)]
+    return pd.concat(groups) if groups else df
+
+
+def downsample_columns(df, x, columns, max_points=None, method="lttb", window=None):
+    """Downsample each column of a wide frame independently, returned long (x, "measurement", "value")."""
+    groups = [
+        downsample(pd.DataFrame({x: df[x], "measurement": column, "value": df[column]}), x, "value", max_points, method, window)
+        for column in columns
+        if column in df.columns
+    ]
+    return pd.concat(groups, ignore_index=True) if groups else pd.DataFrame(columns=[x, "measurement", "value"])
+
+
+def time_series_trace(df, x, y, max_points=None, method="lttb", window=None, **kwargs):
+    """A downsampled Scatter trace, switching to Scattergl for large traces."""
+    df = downsample(df, x, y, max_points, method, window)
+    trace = go.Scattergl if len(df) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=df[x], y=df[y], **kwargs)
@@ -0,0 +1,227 @@
+"""Append-only log of alarm events, written by the alarm worker.
+
+Events live in a local SQLite file next to the data so the worker
+(``alarm_worker.py``) and any number of Streamlit sessions can share it:
+the worker appends, the pages only read. Each event records the rule, the
+site, the reading time, the value compared with the threshold and the
+threshold itself, so changing a rule's threshold appends new events
+instead of rewriting old ones. A corrected reading updates its event, or
+removes it once it no longer exceeds the threshold. Readers filter on the
+rule's current threshold through the indexes below, which keeps page
+reruns cheap.
+"""
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from dashboard.data_access import DATA_DIR, ingested_versions
+from dashboard.normalize import canonical_inputs
+
+EVENTS_PATH = DATA_DIR / "alarm_events.sqlite"
+
+EVENT_COLUMNS = ["rule", "site", "measurement", "timestamp", "value", "observed", "reference", "readings", "threshold"]
+EVENT_KEY = ["rule", "threshold", "site", "measurement", "timestamp"]
+
+# Text form of event timestamps, part of the unique key
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Bump when the stored form of events changes so the worker re-evaluates every rule
+LOG_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    rule TEXT NOT NULL,
+    site TEXT NOT NULL,
+    measurement TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    value REAL NOT NULL,
+    observed REAL,
+    reference REAL,
+    readings INTEGER,
+    threshold REAL NOT NULL,
+    detected_at TEXT NOT NULL,
+    UNIQUE (rule, threshold, site, measurement, timestamp)
+);
+CREATE INDEX IF NOT EXISTS events_by_value ON events (rule, threshold, value);
+CREATE INDEX IF NOT EXISTS events_by_time ON events (rule, threshold, timestamp);
+CREATE TABLE IF NOT EXISTS rules (rule TEXT PRIMARY KEY, params TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def connect(path=EVENTS_PATH):
+    """Open the event log for writing, creating it if needed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    # WAL lets the pages read while the worker appends
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _reader(path):
+    return closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True))
+
+
+def _records(events, columns):
+    # One fixed format, so a reading's key is the same whichever batch it comes in
+    events = events[columns].assign(timestamp=events["timestamp"].dt.strftime(TIMESTAMP_FORMAT)).astype(object)
+    return list(events.where(events.notna(), None).itertuples(index=False, name=None))
+
+
+def _upsert(conn, events):
+    # An event already logged for the same reading takes the corrected values; returns the number of new events
+    detected_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    before = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    conn.executemany(
+        f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}, detected_at) "
+        f"VALUES ({', '.join('?' * len(EVENT_COLUMNS))}, ?) "
+        f"ON CONFLICT ({', '.join(EVENT_KEY)}) DO UPDATE SET "
+        "value = excluded.value, observed = excluded.observed, reference = excluded.reference, "
+        "readings = excluded.readings, detected_at = excluded.detected_at "
+        "WHERE events.value IS NOT excluded.value OR events.observed IS NOT excluded.observed "
+        "OR events.reference IS NOT excluded.reference OR events.readings IS NOT excluded.readings",
+        [(*row, detected_at) for row in _records(events, EVENT_COLUMNS)],
+    )
+    return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] - before
+
+
+def append_events(conn, events, stale=None):
+    """Log rows with EVENT_COLUMNS; returns the number of new events.
+
+    `stale` holds the EVENT_KEY of readings that were corrected and no
+    longer exceed the threshold; their events are removed.
+    """
+    with conn:
+        if stale is not None and not stale.empty:
+            conn.executemany(
+                f"DELETE FROM events WHERE {' AND '.join(f'{column} = ?' for column in EVENT_KEY)}",
+                _records(stale, EVENT_KEY),
+            )
+        return _upsert(conn, events) if not events.empty else 0
+
+
+def replace_events(conn, rule, threshold, events, sites=None):
+    """Make the `rule` events at `threshold` for `sites` (default: every site) equal to `events`.
+
+    Events not in `events` are removed; the others are logged as by append_events.
+    """
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS current_events (site TEXT, measurement TEXT, timestamp TEXT)")
+        conn.execute("DELETE FROM current_events")
+        conn.executemany("INSERT INTO current_events VALUES (?, ?, ?)", _records(events, ["site", "measurement", "timestamp"]))
+        scope = "" if sites is None else f" AND site IN ({', '.join('?' * len(sites))})"
+        conn.execute(
+            f"DELETE FROM events WHERE rule = ? AND threshold = ?{scope} AND NOT EXISTS ("
+            "SELECT 1 FROM current_events AS current WHERE current.site = events.site "
+            "AND current.measurement = events.measurement AND current.timestamp = events.timestamp)",
+            (rule, threshold, *(sites or ())),
+        )
+        return _upsert(conn, events) if not events.empty else 0
+
+
+def get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+    return default if row is None else json.loads(row[0])
+
+
+def set_state(conn, key, value):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+
+def set_rules(conn, rules):
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO rules (rule, params) VALUES (?, ?)",
+            [(rule, json.dumps(params)) for rule, params in rules.items()],
+        )
+
+
+def current_inputs():
+    """Versions of the data the rules read: source digests and each source's ingested batches."""
+    return {
+        "inputs": canonical_inputs(),
+        "batches": {source: list(batches) for source, batches in ingested_versions().items()},
+    }
+
+
+def evaluated_inputs(path=EVENTS_PATH):
+    """`current_inputs()` as of the worker's last completed evaluation, or None."""
+    if not path.exists():
+        return None
+    with _reader(path) as conn:
+        state = get_state(conn, "evaluated")
+    return None if state is None else {"inputs": state.get("inputs"), "batches": state.get("batches")}
+
+
+def logged_rules(path=EVENTS_PATH):
+    """Rule -> parameters the worker currently evaluates; empty if it has never run."""
+    if not path.exists():
+        return {}
+    with _reader(path) as conn:
+        rows = conn.execute("SELECT rule, params FROM rules").fetchall()
+        last_run = conn.execute("SELECT value FROM state WHERE key = 'last_run'").fetchone()
+    # Rules only count once a full evaluation has completed
+    if last_run is None:
+        return {}
+    return {rule: json.loads(params) for rule, params in rows}
+
+
+def last_run(path=EVENTS_PATH):
+    """UTC time of the worker's last completed evaluation, or None."""
+    if not path.exists():
+        return None
+    with _reader(path) as conn:
+        row = conn.execute("SELECT value FROM state WHERE key = 'last_run'").fetchone()
+    return None if row is None else pd.Timestamp(json.loads(row[0]))
+
+
+def _current(conn, rule):
+    row = conn.execute("SELECT params FROM rules WHERE rule = ?", (rule,)).fetchone()
+    return None if row is None else json.loads(row[0])["threshold"]
+
+
+def count_events(rule, above, path=EVENTS_PATH):
+    """Number of `rule` events whose value is above `above`."""
+    if not path.exists():
+        return 0
+    with _reader(path) as conn:
+        threshold = _current(conn, rule)
+        return conn.execute(
+            "SELECT COUNT(*) FROM events WHERE rule = ? AND threshold = ? AND value > ?", (rule, threshold, above)
+        ).fetchone()[0]
+
+
+def recent_events(rule, above, limit, path=EVENTS_PATH):
+    """The `limit` most recent `rule` events whose value is above `above`."""
+    if not path.exists():
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    with _reader(path) as conn:
+        threshold = _current(conn, rule)
+        events = pd.read_sql_query(
+            f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE rule = ? AND threshold = ? AND value > ? "
+            "ORDER BY timestamp DESC LIMIT ?",
+            conn, params=(rule, threshold, above, limit),
+        )
+    events["timestamp"] = pd.to_datetime(events["timestamp"])
+    return events
+
+
+def site_alarms(path=EVENTS_PATH):
+    """Site -> rules with at least one event at the rule's current threshold."""
+    if not path.exists():
+        return {}
+    with _reader(path) as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT events.site, events.rule FROM events JOIN rules ON events.rule = rules.rule "
+            "WHERE events.threshold = json_extract(rules.params, '$.threshold')"
+        ).fetchall()
+    alarms = {}
+    for site, rule in rows:
+        alarms.setdefault(site, set()).add(rule)
+    return alarms
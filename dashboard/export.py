@@ -0,0 +1,341 @@
+"""Report export for page 6, generated only when requested.
+
+A report is a list of sections (EcoDetection, Rainfall, Lab), optionally
+narrowed to some sites, measurements and a date range. The filter is
+applied while reading: only matching partitions of the shared stores are
+visited and each is cut to the date range by binary search, so a narrow
+export never touches the rest of the history.
+
+Sections are built one at a time and written out in chunks:
+
+* CSV and zipped CSV stream the report tables (daily EcoDetection means,
+  rainfall, lab results); the zip holds one CSV per section.
+* Excel is written with xlsxwriter's constant-memory mode, one sheet per
+  section.
+* Parquet and Arrow IPC hold every matching reading in the canonical long
+  format, compressed with zstd, one partition at a time.
+
+Exports run in a background thread that reports progress, so the page
+stays responsive and nothing is generated until someone asks for it.
+"""
+import io
+import threading
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from dashboard.data_access import CACHE_DIR
+from dashboard.normalize import CANONICAL_COLUMNS
+from dashboard.rollups import rollup_store
+from dashboard.schema import concat, widen
+from dashboard.store import canonical_store
+from dashboard.wide import wide_view
+
+EXPORT_DIR = CACHE_DIR / "exports"
+
+# Finished exports older than this are removed when a new one starts
+EXPORT_TTL_SECONDS = 3600
+
+# Rows converted and written per step
+CHUNK_ROWS = 50_000
+
+# Rows per Excel sheet, including the header row
+EXCEL_MAX_ROWS = 1_048_576
+
+# Codec for the columnar formats
+COMPRESSION = "zstd"
+
+# EcoDetection measurements included in the report
+ECO_MEASUREMENTS = [
+    "Chloride Concentration", "Fluoride Concentration", "Nitrate Concentration",
+    "Nitrite Concentration", "Phosphate Concentration", "Sulphate Concentration",
+    "Enclosure Temperature", "Conductivity", "Nephelo Turbidity", "Oxygen", "pH", "Temperature"
+]
+
+# Section -> (canonical source, measurements it covers; None for all)
+SOURCES = {
+    "EcoDetection": ("ecodetection", ECO_MEASUREMENTS),
+    "Rainfall": ("bom", ["Rainfall"]),
+    "Lab": ("lab", None),
+}
+
+# Format -> (label, file name, mime type)
+FORMATS = {
+    "csv": ("CSV", "report.csv", "text/csv"),
+    "xlsx": ("Excel", "report.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("Parquet", "report.parquet", "application/vnd.apache.parquet"),
+    "arrow": ("Arrow IPC", "report.arrow", "application/vnd.apache.arrow.file"),
+    "zip": ("Zipped CSV (one per source)", "report.zip", "application/zip"),
+}
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    """Rows to export; None means no restriction."""
+    sites: tuple = None
+    measurements: tuple = None
+    start: pd.Timestamp = None
+    end: pd.Timestamp = None
+
+
+def _keys(store, section, flt):
+    # Partitions of the section's source that pass the site and measurement filters
+    source, measurements = SOURCES[section]
+    return [
+        key for key in store.keys()
+        if key[0] == source
+        and (measurements is None or key[2] in measurements)
+        and (flt.sites is None or key[1] in flt.sites)
+        and (flt.measurements is None or key[2] in flt.measurements)
+    ]
+
+
+def _rows(store, section, flt):
+    """Matching rows of one section, read partition by partition."""
+    parts = [
+        store.slice(source, site, [measurement], flt.start, flt.end)
+        for source, site, measurement in _keys(store, section, flt)
+    ]
+    return concat(parts, ignore_index=True) if parts else store.rows(None)
+
+
+def available_options(sections):
+    """(sites, measurements, first timestamp, last timestamp) that can be exported for `sections`."""
+    store = canonical_store()
+    keys = [key for section in sections for key in _keys(store, section, ExportFilter())]
+    bounds = [store.time_bounds(source, site, [measurement]) for source, site, measurement in keys]
+    bounds = [bound for bound in bounds if bound[0] is not None]
+    return (
+        sorted({site for _, site, _ in keys}),
+        sorted({measurement for _, _, measurement in keys}),
+        min((first for first, _ in bounds), default=None),
+        max((last for _, last in bounds), default=None),
+    )
+
+
+def _eco_section(store, daily, wide, flt):
+    # Daily means per site and measurement, sliced from the daily wide view
+    columns = _section_columns("EcoDetection", daily, flt)
+    sites = sorted({site for _, site, _ in _keys(daily, "EcoDetection", flt)})
+    frames = [
+        wide.slice(site, flt.start, flt.end, columns[2:]).assign(location=site)
+        for site in sites
+    ]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True).rename(columns={"timestamp": "Date"})
+    return df.reindex(columns=columns).sort_values("Date", ascending=False, kind="stable")
+
+
+def _rainfall_section(store, daily, wide, flt):
+    rows = _rows(store, "Rainfall", flt)
+    return pd.DataFrame({
+        "Date": rows["timestamp"].dt.normalize(),
+        "station_number": rows["site"],
+        "Rainfall (mm)": rows["value"],
+    }).sort_values("Date", ascending=False, kind="stable")
+
+
+def _lab_section(store, daily, wide, flt):
+    rows = _rows(store, "Lab", flt)
+    return pd.DataFrame({
+        "Date": rows["timestamp"].dt.normalize(),
+        "Site": rows["site"],
+        "Measure": rows["measurement"],
+        "Result": rows["value"],
+        "Units": rows["unit"],
+    }).sort_values("Date", ascending=False, kind="stable")
+
+
+# Section name (also the Excel sheet and zipped CSV name) -> report table builder
+SECTIONS = {
+    "EcoDetection": _eco_section,
+    "Rainfall": _rainfall_section,
+    "Lab": _lab_section,
+}
+
+
+def _section_columns(name, daily, flt):
+    if name == "EcoDetection":
+        return ["Date", "location"] + sorted({measurement for _, _, measurement in _keys(daily, name, flt)})
+    if name == "Rainfall":
+        return ["Date", "station_number", "Rainfall (mm)"]
+    return ["Date", "Site", "Measure", "Result", "Units"]
+
+
+def _chunks(df):
+    for start in range(0, len(df), CHUNK_ROWS):
+        yield df.iloc[start:start + CHUNK_ROWS]
+
+
+def _write_csv_rows(f, df, columns, progress):
+    for written, chunk in enumerate(_chunks(df), start=1):
+        chunk.reindex(columns=columns).to_csv(f, header=False, index=False, date_format="%Y-%m-%d")
+        progress(min(written * CHUNK_ROWS / len(df), 1.0))
+
+
+def write_csv(path, sections, store, daily, wide, flt, progress=lambda fraction: None):
+    """Stream `sections` into one CSV; columns are the union of the sections' columns."""
+    columns = []
+    for name in sections:
+        columns += [column for column in _section_columns(name, daily, flt) if column not in columns]
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        f.write(",".join(columns) + "\n")
+        for i, name in enumerate(sections):
+            df = SECTIONS[name](store, daily, wide, flt)
+            _write_csv_rows(f, df, columns, lambda fraction: progress((i + fraction) / len(sections)))
+
+
+def write_zip(path, sections, store, daily, wide, flt, progress=lambda fraction: None):
+    """Stream each section into its own CSV inside one zip file."""
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i, name in enumerate(sections):
+            df = SECTIONS[name](store, daily, wide, flt)
+            with archive.open(f"{name}.csv", "w") as member, io.TextIOWrapper(member, encoding="utf-8", newline="") as f:
+                f.write(",".join(df.columns) + "\n")
+                _write_csv_rows(f, df, list(df.columns), lambda fraction: progress((i + fraction) / len(sections)))
+
+
+def write_excel(path, sections, store, daily, wide, flt, progress=lambda fraction: None):
+    """Write one sheet per section with a constant-memory workbook."""
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd"})
+    try:
+        for i, name in enumerate(sections):
+            df = SECTIONS[name](store, daily, wide, flt)
+            header = list(df.columns)
+            sheet, row, part = None, EXCEL_MAX_ROWS, 1
+            for written, chunk in enumerate(_chunks(df), start=1):
+                # Missing values become blank cells
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                for values in chunk.itertuples(index=False, name=None):
+                    if row == EXCEL_MAX_ROWS:
+                        # Sections longer than a sheet continue on "<name> (2)", ...
+                        sheet = workbook.add_worksheet(name if part == 1 else f"{name} ({part})")
+                        sheet.write_row(0, 0, header)
+                        row, part = 1, part + 1
+                    sheet.write_row(row, 0, values)
+                    row += 1
+                progress((i + min(written * CHUNK_ROWS / len(df), 1.0)) / len(sections))
+            if sheet is None:
+                workbook.add_worksheet(name).write_row(0, 0, header)
+    finally:
+        workbook.close()
+
+
+def _long_tables(sections, store, flt, progress):
+    # Canonical rows of every matching partition, as Arrow tables
+    keys = [key for name in sections for key in _keys(store, name, flt)]
+    columns = CANONICAL_COLUMNS + ["outlier"]
+    # Categorical labels are written as plain strings; Arrow casts them far faster than pandas
+    schema = pa.Schema.from_pandas(widen(store.rows(None).reindex(columns=columns)), preserve_index=False)
+    for done, (source, site, measurement) in enumerate(keys, start=1):
+        rows = store.slice(source, site, [measurement], flt.start, flt.end)
+        if len(rows):
+            yield pa.Table.from_pandas(rows.reindex(columns=columns), preserve_index=False).cast(schema)
+        progress(done / len(keys))
+
+
+def _write_tables(open_writer, tables):
+    # Writers are opened with the schema of the first table; later tables are cast to it
+    writer = schema = None
+    try:
+        for table in tables:
+            if writer is None:
+                schema = table.schema
+                writer = open_writer(schema)
+            writer.write_table(table.cast(schema))
+        if writer is None:
+            empty = pa.Table.from_pandas(pd.DataFrame(columns=CANONICAL_COLUMNS), preserve_index=False)
+            writer = open_writer(empty.schema)
+            writer.write_table(empty)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_parquet(path, sections, store, daily, wide, flt, progress=lambda fraction: None):
+    """Write every matching reading, one row group per partition."""
+    _write_tables(
+        lambda schema: pq.ParquetWriter(path, schema, compression=COMPRESSION),
+        _long_tables(sections, store, flt, progress),
+    )
+
+
+def write_arrow(path, sections, store, daily, wide, flt, progress=lambda fraction: None):
+    """Write every matching reading as an Arrow IPC file, one record batch per partition."""
+    options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+    _write_tables(
+        lambda schema: pa.ipc.new_file(path, schema, options=options),
+        _long_tables(sections, store, flt, progress),
+    )
+
+
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_excel,
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+    "zip": write_zip,
+}
+
+
+class ExportJob:
+    """An export running in a background thread."""
+
+    def __init__(self, fmt, sections, flt, store, daily, wide):
+        self.fmt = fmt
+        self.sections = list(sections)
+        self.filter = flt
+        self.path = EXPORT_DIR / f"{uuid.uuid4().hex}.{fmt}"
+        self.progress = 0.0
+        self.error = None
+        # The stores and the daily wide view are resolved by the caller on the script thread, so this thread never
+        # touches Streamlit's caches
+        self._thread = threading.Thread(target=self._run, args=(store, daily, wide), daemon=True)
+
+    def _set_progress(self, fraction):
+        self.progress = min(fraction, 1.0)
+
+    def _run(self, store, daily, wide):
+        try:
+            WRITERS[self.fmt](self.path, self.sections, store, daily, wide, self.filter, self._set_progress)
+            self.progress = 1.0
+        except Exception as error:  # Reported on the page instead of ending the thread silently
+            self.error = error
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def file_name(self):
+        return FORMATS[self.fmt][1]
+
+    @property
+    def mime(self):
+        return FORMATS[self.fmt][2]
+
+
+def _remove_old_exports():
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    for path in EXPORT_DIR.glob("*.*"):
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+
+
+def start_export(fmt, sections, flt=ExportFilter()):
+    """Start writing a report of `sections` restricted to `flt` in format `fmt` (a FORMATS key)."""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    _remove_old_exports()
+    return ExportJob(fmt, sections, flt, canonical_store(), rollup_store("daily"), wide_view("daily")).start()
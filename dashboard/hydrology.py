@@ -0,0 +1,155 @@
+"""Storm events and the streamflow response to rainfall.
+
+Storm events are runs of consecutive days with rainfall above a threshold.
+They are found with one run-length encoding pass over the daily rainfall
+of every BOM station at once; a run ends at a dry day, a missing day or the
+next station. The delay between rain and streamflow is estimated from the
+cross-correlation of the daily series, computed with FFTs for every
+rainfall x streamflow station pair and every lag in one broadcast. Missing
+days are masked out rather than treated as zero, so each lag is correlated
+over the days both stations actually reported.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from dashboard.data_access import ingested_versions
+from dashboard.rollups import rollup_parquet, rollup_store
+
+# Daily rainfall (mm) above which a day belongs to a storm event
+STORM_THRESHOLD = 10
+
+# Longest delay (days) between rainfall and streamflow that is tested
+MAX_LAG_DAYS = 14
+
+# Fewest days two stations must share before a lag's correlation is reported
+MIN_OVERLAP_DAYS = 30
+
+
+def daily_series():
+    """Daily rainfall totals (BOM) and daily mean streamflow (WIMS) as canonical-style rows."""
+    daily = rollup_store("daily")
+    rainfall = daily.rows("bom", ["Rainfall"])
+    # Rollup buckets hold means; a day's rainfall is the total of its readings
+    rainfall = rainfall.assign(value=rainfall["mean"] * rainfall["count"])
+    streamflow = daily.rows("wims", ["Streamflow"])
+    return rainfall[["site", "timestamp", "value"]], streamflow[["site", "timestamp", "value"]]
+
+
+def storm_events(rainfall, threshold=STORM_THRESHOLD):
+    """Storm events in daily rainfall rows (site, timestamp, value) of any number of stations."""
+    rainfall = rainfall.sort_values(["site", "timestamp"], kind="stable")
+    sites = rainfall["site"].to_numpy(dtype=object)
+    days = rainfall["timestamp"].to_numpy(dtype="datetime64[D]")
+    values = rainfall["value"].to_numpy(dtype="float64")
+
+    # A wet day continues the run of the row before it if that row is the previous day, same station, also wet
+    above = values > threshold
+    continues = np.zeros(len(values), dtype=bool)
+    continues[1:] = above[:-1] & (sites[1:] == sites[:-1]) & (days[1:] - days[:-1] == np.timedelta64(1, "D"))
+
+    wet = np.flatnonzero(above)
+    starts = np.flatnonzero(~continues[wet])
+    lengths = np.diff(np.append(starts, len(wet)))
+    first, last = wet[starts], wet[starts + lengths - 1]
+    return pd.DataFrame({
+        "site": sites[first],
+        "start": pd.to_datetime(days[first]),
+        "end": pd.to_datetime(days[last]),
+        "days": lengths,
+        "total_mm": np.add.reduceat(values[wet], starts) if len(wet) else np.empty(0),
+        "peak_mm": np.maximum.reduceat(values[wet], starts) if len(wet) else np.empty(0),
+    })
+
+
+def _matrix(rows, days):
+    # Stations x days, NaN where a station has no reading
+    wide = rows.pivot_table(index="site", columns="timestamp", values="value", observed=True)
+    return wide.reindex(columns=days).to_numpy(dtype="float64"), wide.index.to_list()
+
+
+def _standardize(values):
+    mask = ~np.isnan(values)
+    mean = np.nanmean(values, axis=1, keepdims=True)
+    std = np.nanstd(values, axis=1, keepdims=True)
+    return np.where(mask, (values - mean) / np.where(std > 0, std, 1), 0.0), mask.astype("float64")
+
+
+def lag_correlation(rainfall, streamflow, max_lag=MAX_LAG_DAYS):
+    """Correlation of streamflow with the rainfall `lag_days` earlier, for every station pair and lag.
+
+    `rainfall` and `streamflow` are daily rows (site, timestamp, value).
+    Returns rainfall_station, streamflow_station, lag_days, correlation and
+    overlap_days; correlation is NaN where the stations share too few days.
+    """
+    columns = ["rainfall_station", "streamflow_station", "lag_days", "correlation", "overlap_days"]
+    if rainfall.empty or streamflow.empty:
+        return pd.DataFrame(columns=columns)
+    days = pd.date_range(
+        min(rainfall["timestamp"].min(), streamflow["timestamp"].min()),
+        max(rainfall["timestamp"].max(), streamflow["timestamp"].max()),
+        freq="D",
+    )
+    rain, rain_stations = _matrix(rainfall, days)
+    flow, flow_stations = _matrix(streamflow, days)
+    rain, rain_mask = _standardize(rain)
+    flow, flow_mask = _standardize(flow)
+
+    # sum_t a[t] * b[t + lag] for all rainfall x streamflow pairs at once; zero padding avoids wrap-around
+    size = 1 << int(np.ceil(np.log2(len(days) + max_lag)))
+
+    def xcorr(a, b):
+        spectrum = np.conj(np.fft.rfft(a, size))[:, None, :] * np.fft.rfft(b, size)[None, :, :]
+        return np.fft.irfft(spectrum, size)[..., :max_lag + 1]
+
+    overlap = np.rint(xcorr(rain_mask, flow_mask))
+    # Normalize by the energy of each series over the days the pair shares at that lag
+    energy = xcorr(rain ** 2, flow_mask) * xcorr(rain_mask, flow ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = xcorr(rain, flow) / np.sqrt(energy)
+    correlation[(overlap < MIN_OVERLAP_DAYS) | ~(energy > 0)] = np.nan
+
+    rain_index, flow_index, lags = np.meshgrid(
+        np.arange(len(rain_stations)), np.arange(len(flow_stations)), np.arange(max_lag + 1), indexing="ij"
+    )
+    return pd.DataFrame({
+        "rainfall_station": np.asarray(rain_stations, dtype=object)[rain_index.ravel()],
+        "streamflow_station": np.asarray(flow_stations, dtype=object)[flow_index.ravel()],
+        "lag_days": lags.ravel(),
+        "correlation": np.clip(correlation.ravel(), -1, 1),
+        "overlap_days": overlap.ravel().astype("int64"),
+    })
+
+
+def best_lags(correlations):
+    """The lag with the strongest correlation for each station pair."""
+    ranked = correlations.dropna(subset=["correlation"]).sort_values("correlation", ascending=False, kind="stable")
+    return ranked.drop_duplicates(["rainfall_station", "streamflow_station"]).reset_index(drop=True)
+
+
+@st.cache_data(max_entries=16)
+def _storms(path, mtime_ns, batches, threshold):
+    # `batches` keys the cache, so uploads of BOM data refresh the events
+    rainfall, _ = daily_series()
+    return storm_events(rainfall, threshold)
+
+
+@st.cache_data(max_entries=4)
+def _lags(path, mtime_ns, batches, max_lag):
+    return lag_correlation(*daily_series(), max_lag)
+
+
+def _cache_key(*sources):
+    path = rollup_parquet("daily")
+    versions = ingested_versions()
+    return str(path), path.stat().st_mtime_ns, tuple(versions.get(source, ()) for source in sources)
+
+
+def load_storm_events(threshold=STORM_THRESHOLD):
+    """Storm events of every BOM station, cached until the rainfall data changes."""
+    return _storms(*_cache_key("bom"), threshold)
+
+
+def load_lag_correlation(max_lag=MAX_LAG_DAYS):
+    """`lag_correlation` over every BOM x WIMS station pair, cached until either changes."""
+    return _lags(*_cache_key("bom", "wims"), max_lag)
@@ -0,0 +1,124 @@
+"""Incremental ingest of uploaded data files.
+
+An upload is matched to one of the known layouts by its columns, typed and
+normalized like the shipped sources, de-duplicated on (site, measurement,
+timestamp) and stored as an append-only batch under ``data/ingested/<source>``.
+Stores and cached views pick up new batches per source and merge them into
+only the partitions they touch, so a daily drop never re-parses the history.
+"""
+import hashlib
+import io
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from dashboard.data_access import INGEST_DIR, coerce_raw
+from dashboard.normalize import normalize_bom, normalize_ecodetection, normalize_lab, normalize_wims
+
+DEDUP_KEYS = ["source", "site", "measurement", "timestamp"]
+
+# Layout -> columns that identify it
+SCHEMAS = {
+    "ecodetection": {"timestamp", "location", "measurement", "unit", "result"},
+    "bom": {"date", "station_number", "rainfall"},
+    "wims": {"datetime", "discharge_ml_day"},
+    "lab": {"Subsite_Code", "date_sampled", "Measure", "Result", "Units"},
+}
+
+
+@dataclass
+class IngestResult:
+    name: str  # File name, and sheet for Excel workbooks
+    schema: str  # None when the layout is not recognised
+    rows: int
+    partitions: list
+    batch: str = None  # None when the same data was already ingested, or when `error` is set
+    error: str = None  # Why no row of the table could be used
+
+
+def detect_schema(columns):
+    """Name of the layout whose identifying columns are all present, or None."""
+    columns = {str(column).strip().lstrip("\ufeff") for column in columns}
+    for schema, required in SCHEMAS.items():
+        if required <= columns:
+            return schema
+    return None
+
+
+def _wims_station(df, name):
+    # WIMS exports carry the station in the file name (clean_wims_406280.csv)
+    if "station" in df.columns:
+        return df["station"].astype("string")
+    match = re.search(r"(\d{6})", name)
+    if match is None:
+        raise ValueError("it has no station column; include the WIMS station number in the file name")
+    return match.group(1)
+
+
+def normalize_upload(df, schema, name=""):
+    df = coerce_raw(schema, df)
+    if schema == "ecodetection":
+        return normalize_ecodetection(df)
+    if schema == "bom":
+        return normalize_bom(df)
+    if schema == "lab":
+        return normalize_lab(df)
+    return normalize_wims(df, _wims_station(df, name))
+
+
+def read_upload(data, name):
+    """Raw tables in an uploaded CSV or Excel file, by name (one per sheet)."""
+    if name.lower().endswith(".xlsx"):
+        sheets = pd.read_excel(io.BytesIO(data), sheet_name=None)
+        return {f"{name} ({sheet})": df for sheet, df in sheets.items()}
+    # Keep identifiers such as BOM station numbers (088037) as text
+    return {name: pd.read_csv(io.BytesIO(data), encoding="utf-8-sig", dtype={"station_number": "string"})}
+
+
+def _write_batch(rows, source):
+    directory = INGEST_DIR / source
+    directory.mkdir(parents=True, exist_ok=True)
+
+    buffer = io.BytesIO()
+    rows.to_parquet(buffer, index=False)
+    digest = hashlib.sha256(buffer.getvalue()).hexdigest()[:12]
+    if any(directory.glob(f"*-{digest}.parquet")):
+        return None
+
+    # Batch names sort in ingest order, so later uploads win on duplicates
+    batch = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{digest}"
+    tmp = directory / f"{batch}.tmp"
+    tmp.write_bytes(buffer.getvalue())
+    os.replace(tmp, directory / f"{batch}.parquet")
+    return batch
+
+
+def ingest_table(df, name):
+    schema = detect_schema(df.columns)
+    if schema is None:
+        return IngestResult(name, None, 0, [], error="it does not look like EcoDetection, BOM, WIMS or lab data")
+    df = df.rename(columns=lambda column: str(column).strip().lstrip("\ufeff"))
+
+    # Layouts are named after the canonical source they normalize into
+    try:
+        rows = normalize_upload(df, schema, name).drop_duplicates(subset=DEDUP_KEYS, keep="last")
+    except ValueError as error:
+        return IngestResult(name, schema, 0, [], error=str(error))
+    if rows.empty:
+        # Rows whose timestamp or value cannot be parsed are dropped, e.g. ISO dates where Excel serial days are expected
+        return IngestResult(name, schema, 0, [], error=f"none of its {len(df):,} rows has a timestamp and value that could be read")
+    partitions = sorted(rows[["site", "measurement"]].drop_duplicates().itertuples(index=False, name=None))
+    batch = _write_batch(rows.reset_index(drop=True), schema)
+    return IngestResult(name, schema, len(rows), partitions, batch)
+
+
+def ingest_upload(data, name):
+    """Ingest every table of an uploaded file; returns one IngestResult per table.
+
+    A table that cannot be ingested gets a result with its `error` and does
+    not stop the others, so every sheet of a workbook is processed once.
+    """
+    return [ingest_table(df, table) for table, df in read_upload(data, name).items()]
@@ -0,0 +1,77 @@
+"""Latest reading of every series, for "current state" panels.
+
+The index holds the newest row of each (source, site, measurement)
+partition of the canonical store: its time, value, unit and outlier flag.
+It is built once per process from the last year of each partition, which
+is already time-sorted, and after an upload only the series the new rows
+touch are refreshed. Looking up a series or a site is a dict access and
+never scans the history.
+"""
+import threading
+from dataclasses import dataclass
+
+import pandas as pd
+import streamlit as st
+
+from dashboard.normalize import canonical_dataset
+from dashboard.store import PARTITION_KEYS, canonical_store, dataset_store, sync_ingested
+
+
+@dataclass(frozen=True)
+class Reading:
+    timestamp: pd.Timestamp
+    value: float
+    unit: str
+    outlier: bool  # True when the reading is flagged as a likely sensor failure
+
+
+class LatestIndex:
+    """(source, site, measurement) -> latest Reading, also grouped by (source, site)."""
+
+    def __init__(self, store):
+        self._sites = {}
+        self._lock = threading.Lock()
+        # The index starts out with whatever uploads the store has merged
+        self.versions = dict(store.versions)
+        for key in store.keys():
+            self.refresh(store, key)
+
+    def refresh(self, store, key):
+        """Re-read the latest row of partition `key` from `store`."""
+        row = store.last(key)
+        with self._lock:
+            readings = self._sites.setdefault(key[:2], {})
+            if row is None:
+                readings.pop(key[2], None)
+                return
+            outlier = bool(row["outlier"]) if "outlier" in row and pd.notna(row["outlier"]) else False
+            readings[key[2]] = Reading(row["timestamp"], float(row["value"]), row["unit"], outlier)
+
+    def get(self, source, site, measurement):
+        """Latest Reading of one series, or None."""
+        return self._sites.get((source, site), {}).get(measurement)
+
+    def site(self, source, site):
+        """Measurement -> latest Reading for every series of `site`."""
+        return dict(self._sites.get((source, site), {}))
+
+
+@st.cache_resource(max_entries=4)
+def _latest_index(path, mtime_ns):
+    # Shared by all sessions, like the store it is built from
+    return LatestIndex(dataset_store())
+
+
+def latest_index():
+    """Shared LatestIndex over the canonical store, including uploaded rows."""
+    path = canonical_dataset()
+    index = _latest_index(str(path), path.stat().st_mtime_ns)
+    store = canonical_store()
+
+    def apply(rows):
+        # The store has already merged (and flagged) these rows; refresh only the series they touch
+        for key in rows[PARTITION_KEYS].drop_duplicates().itertuples(index=False, name=None):
+            index.refresh(store, key)
+
+    sync_ingested(index, apply)
+    return index
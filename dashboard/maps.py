@@ -0,0 +1,89 @@
+"""Station map for the site mapping page.
+
+The map is one GeoJSON layer of circle markers built from the station
+registry, rendered to HTML once per station set and station-type filter and
+cached across reruns and sessions. Alarm colours change with every rerun,
+so they are not baked into the map: a short script appended to the cached
+HTML restyles the markers of alarmed stations in the browser.
+"""
+import json
+
+import folium
+import streamlit as st
+
+from dashboard.stations import LAB, RAINFALL, STATIONS_PATH, STREAMFLOW, TEMPERATURE, WEATHER_TYPES, _load_stations
+
+# Default marker colour per station type
+TYPE_COLORS = {RAINFALL: "blue", TEMPERATURE: "black", LAB: "pink", STREAMFLOW: "blue"}
+DEFAULT_COLOR = "green"
+
+MAP_CENTER = [-37.268, 144.442]
+MAP_ZOOM = 9
+MAP_WIDTH = 700
+MAP_HEIGHT = 500
+
+# Replaced by the alarm colours (a JSON object) on every render
+ALARM_PLACEHOLDER = "__ALARM_COLORS__"
+
+ALARM_SCRIPT = """
+<script>
+(function () {
+    var colors = %s;
+    %s.eachLayer(function (layer) {
+        var color = colors[layer.feature.properties.alarm_key];
+        if (color) {
+            layer.setStyle({color: color, fillColor: color});
+        }
+    });
+})();
+</script>
+"""
+
+
+def station_features(stations):
+    """GeoJSON FeatureCollection of `stations` with popup text and colours as properties."""
+    # Alarms are logged per site, except weather stations which are keyed by station number
+    alarm_keys = stations["site"].where(~stations["type"].isin(WEATHER_TYPES), stations["key"])
+    features = [
+        {
+            "type": "Feature",
+            "id": str(index),
+            "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+            "properties": {
+                "label": f"{name} - {station_type}",
+                "color": TYPE_COLORS.get(station_type, DEFAULT_COLOR),
+                "alarm_key": str(alarm_key),
+            },
+        }
+        for index, name, station_type, lat, lon, alarm_key in zip(
+            stations.index, stations["station_name"], stations["type"], stations["latitude"], stations["longitude"], alarm_keys
+        )
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+@st.cache_data(max_entries=32)
+def _map_html(path, mtime_ns, station_type):
+    stations = _load_stations(path, mtime_ns)
+    if station_type is not None:
+        stations = stations[stations["type"] == station_type]
+
+    m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM)
+    layer = folium.GeoJson(
+        station_features(stations),
+        marker=folium.CircleMarker(radius=8, weight=2, fill=True, fill_opacity=0.8),
+        style_function=lambda feature: {"color": feature["properties"]["color"], "fillColor": feature["properties"]["color"]},
+        popup=folium.GeoJsonPopup(fields=["label"], labels=False),
+    ).add_to(m)
+
+    html = folium.Figure().add_child(m).render()
+    script = ALARM_SCRIPT % (ALARM_PLACEHOLDER, layer.get_name())
+    return html.replace("</body>", script + "</body>")
+
+
+def station_map_html(station_type=None, alarm_colors=None, path=STATIONS_PATH):
+    """HTML of the station map, optionally only one station type, with alarm colours per site / station key."""
+    html = _map_html(str(path), path.stat().st_mtime_ns, station_type)
+    # Inside <script>, a "</" in a site name would end the script; "<\/" is the same JSON string
+    colors = json.dumps(alarm_colors or {}).replace("</", "<\\/")
+    return html.replace(ALARM_PLACEHOLDER, colors)
@@ -0,0 +1,109 @@
+"""Site-aware matching of lab samples to EcoDetection readings.
+
+Each lab sample is paired only with sensor readings from the same site and
+parameter taken within a time tolerance of it. The readings in that window
+are aggregated (mean, min, max, count) along with the nearest reading, so
+every sample yields exactly one row instead of a cross join with every
+reading of the day. Windows are found by binary search in the store's
+time-sorted partitions, and sums come from prefix sums, so a match costs
+O((samples + readings) log readings).
+
+Most lab samples carry only a date, which parses to midnight. Their window
+is centred on midday of the sampling day instead and excludes its upper
+end, so the default tolerance of 12 hours covers exactly that calendar
+day, [date, date + 1 day).
+"""
+import numpy as np
+import pandas as pd
+
+from dashboard.normalize import PARAMETERS
+from dashboard.store import canonical_store
+
+# Sensor readings within this distance of a lab sample are matched to it
+DEFAULT_TOLERANCE = pd.Timedelta(hours=12)
+
+# Where in its day a sample with only a date is taken to be
+DATE_ONLY_CENTRE = pd.Timedelta(hours=12)
+
+MATCH_COLUMNS = [
+    "site", "parameter", "timestamp", "lab_value", "eco_mean", "eco_min", "eco_max", "eco_count",
+    "eco_nearest", "difference_pct",
+]
+
+
+def match_window(eco, lab, tolerance=DEFAULT_TOLERANCE):
+    """Aggregate the time-sorted readings `eco` around each sample in `lab` (one site).
+
+    Returns one row per lab sample; samples with no reading in the window
+    have a count of 0 and NaN aggregates.
+    """
+    times = eco["timestamp"].to_numpy()
+    values = eco["value"].to_numpy(dtype="float64")
+    samples = lab["timestamp"].to_numpy()
+    tolerance = pd.Timedelta(tolerance).to_timedelta64()
+
+    # Date-only samples (at midnight) are centred on midday, their window open at the top
+    date_only = samples == samples.astype("datetime64[D]")
+    centres = samples + np.where(date_only, DATE_ONLY_CENTRE.to_timedelta64(), np.timedelta64(0, "ns"))
+    upper = centres + tolerance - np.where(date_only, np.timedelta64(1, "ns"), np.timedelta64(0, "ns"))
+
+    lo = np.searchsorted(times, (centres - tolerance).astype(times.dtype), side="left")
+    hi = np.searchsorted(times, upper.astype(times.dtype), side="right")
+    count = hi - lo
+
+    # Window sums from prefix sums; min/max only over the windows that have readings
+    prefix = np.concatenate([[0.0], np.cumsum(values)])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (prefix[hi] - prefix[lo]) / count
+    minimum = np.full(len(samples), np.nan)
+    maximum = np.full(len(samples), np.nan)
+    for i in np.flatnonzero(count):
+        window = values[lo[i]:hi[i]]
+        minimum[i], maximum[i] = window.min(), window.max()
+
+    # Nearest reading to the centre within the tolerance, as merge_asof(direction="nearest") would pick
+    nearest = pd.merge_asof(
+        pd.DataFrame({"timestamp": centres.astype(times.dtype)}).reset_index().sort_values("timestamp", kind="stable"),
+        pd.DataFrame({"timestamp": times, "eco_nearest": values}),
+        on="timestamp", direction="nearest", tolerance=pd.Timedelta(tolerance),
+    ).sort_values("index")["eco_nearest"].to_numpy()
+
+    lab_value = lab["value"].to_numpy(dtype="float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        difference = np.abs(mean - lab_value) / lab_value * 100
+    return pd.DataFrame({
+        "timestamp": lab["timestamp"].to_numpy(),
+        "lab_value": lab_value,
+        "eco_mean": mean,
+        "eco_min": minimum,
+        "eco_max": maximum,
+        "eco_count": count,
+        "eco_nearest": nearest,
+        "difference_pct": difference,
+    })
+
+
+def match_lab_samples(parameter, sites, tolerance=DEFAULT_TOLERANCE, start=None, end=None):
+    """Lab samples of `parameter` at `sites` in [start, end], each with its sensor window.
+
+    Samples without any sensor reading in the window are dropped.
+    """
+    store = canonical_store()
+    names = PARAMETERS[parameter]
+    frames = []
+    for site in sites:
+        lab = store.slice("lab", site, [names["lab"]], start, end)
+        if lab.empty:
+            continue
+        # Readings just outside [start, end] still count towards a sample's window
+        eco = store.slice(
+            "ecodetection", site, [names["ecodetection"]],
+            None if start is None else pd.Timestamp(start) - pd.Timedelta(tolerance),
+            None if end is None else pd.Timestamp(end) + DATE_ONLY_CENTRE + pd.Timedelta(tolerance),
+        )
+        matched = match_window(eco, lab, tolerance)
+        frames.append(matched[matched["eco_count"] > 0].assign(site=site, parameter=parameter))
+
+    if not frames:
+        return pd.DataFrame({column: [] for column in MATCH_COLUMNS})
+    return pd.concat(frames, ignore_index=True)[MATCH_COLUMNS]
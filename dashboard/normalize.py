@@ -0,0 +1,344 @@
+"""Canonical long-format table shared by every page.
+
+All sources are normalized once, at ingest, into the same columns:
+
+    source       ecodetection / lab / bom / wims
+    site         canonical site name, or the BOM / WIMS station number
+    measurement  measurement name as reported by the source
+    parameter    shared parameter name used to compare sources (may be NA)
+    timestamp    datetime64
+    value        result, converted to the canonical unit (ppb -> mg/L)
+    unit         canonical unit
+    outlier      rolling median/MAD outlier flag (see dashboard.outliers)
+
+The result is persisted next to the source Parquet cache, so pages only
+filter this table and never run per-row conversions on a rerun. It is also
+laid out as a hive-partitioned dataset (source=/site=/measurement=/year=),
+so a loader asking for one site and year opens only that directory.
+"""
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import streamlit as st
+
+from dashboard.data_access import (
+    INGEST_DIR, SHARED_FRAMES, available_sources, derived_dataset, derived_parquet, ingested_rows, ingested_versions,
+    load_parquet, read_source, scan_dataset, scan_parquet, shared_view, source_digest,
+)
+from dashboard import schema
+from dashboard.schema import CANONICAL_SCHEMA, compact
+from dashboard.outliers import flag_outliers
+from dashboard.profiling import span
+
+# Bump when the normalization below changes so the persisted table is rebuilt
+NORMALIZE_VERSION = 3
+
+CANONICAL_COLUMNS = ["source", "site", "measurement", "parameter", "timestamp", "value", "unit"]
+
+# Directory levels of the partitioned canonical dataset, outermost first
+DATASET_PARTITIONING = ds.partitioning(pa.schema([
+    ("source", pa.string()),
+    ("site", pa.string()),
+    ("measurement", pa.string()),
+    ("year", pa.int16()),
+]), flavor="hive")
+DATASET_KEYS = ["source", "site", "measurement"]
+
+# EcoDetection sensor sites, in the order the pages list them
+SITES = [
+    "Kangaroo Creek",
+    "Little Coliban River",
+    "Five Mile Creek - Woodend RWP Site 1",
+    "Five Mile Creek - Woodend RWP Site 2",
+]
+
+# Lab subsite codes and short names used elsewhere -> canonical site name
+SITE_ALIASES = {
+    "SITE2": "Little Coliban River",
+    "SITE17": "Kangaroo Creek",
+    "Five Mile Creek - Site 1": "Five Mile Creek - Woodend RWP Site 1",
+    "Five Mile Creek - Site 2": "Five Mile Creek - Woodend RWP Site 2",
+}
+
+# Raw unit -> (canonical unit, multiplier)
+UNIT_CONVERSIONS = {
+    "ppb": ("mg/L", 0.001),
+    "ug/L": ("mg/L", 0.001),
+    "µg/L": ("mg/L", 0.001),
+}
+
+# Parameters measured by more than one source: parameter -> {source: measurement}
+PARAMETERS = {
+    "Turbidity": {"ecodetection": "Nephelo Turbidity", "lab": "Turbidity"},
+    "Nitrate": {"ecodetection": "Nitrate Concentration", "lab": "Nitrate - Nitrogen"},
+    "Nitrite": {"ecodetection": "Nitrite Concentration", "lab": "Nitrite - Nitrogen"},
+    "Phosphate": {"ecodetection": "Phosphate Concentration", "lab": "Phosphate"},
+    "Conductivity": {"ecodetection": "Conductivity", "lab": "Electrical Conductivity"},
+    "Rainfall": {"bom": "Rainfall"},
+    "Streamflow": {"wims": "Streamflow"},
+}
+
+# BOM column -> (measurement, unit)
+BOM_MEASUREMENTS = {
+    "rainfall": ("Rainfall", "mm"),
+    "max_temp": ("Maximum Temperature", "°C"),
+    "min_temp": ("Minimum Temperature", "°C"),
+}
+
+_PARAMETER_LOOKUP = {
+    (source, measurement): parameter
+    for parameter, names in PARAMETERS.items()
+    for source, measurement in names.items()
+}
+
+
+def canonical_site(names):
+    # Categoricals cannot take new values through replace, so the aliases are applied to strings
+    return names.astype("string").replace(SITE_ALIASES)
+
+
+def _finish(df, source):
+    # Convert units and attach the shared parameter name, all vectorized
+    factors = {unit: factor for unit, (_, factor) in UNIT_CONVERSIONS.items()}
+    targets = {unit: target for unit, (target, _) in UNIT_CONVERSIONS.items()}
+    df["value"] = df["value"].astype("float64") * df["unit"].map(factors).astype("float64").fillna(1.0)
+    df["unit"] = df["unit"].astype("string").replace(targets)
+
+    df["source"] = source
+    keys = pd.MultiIndex.from_arrays([df["source"], df["measurement"]])
+    df["parameter"] = pd.Series(_PARAMETER_LOOKUP, dtype="string").reindex(keys).to_numpy()
+
+    df = df.dropna(subset=["timestamp", "value"])
+    return compact(df[CANONICAL_COLUMNS].astype({"value": "float64"}), CANONICAL_SCHEMA)
+
+
+def normalize_ecodetection(df):
+    # Timestamps are Excel serial days; round away floating point noise
+    timestamp = pd.to_datetime(df["timestamp"], unit="D", origin="1899-12-30").dt.round("s")
+    return _finish(pd.DataFrame({
+        "site": canonical_site(df["location"]),
+        "measurement": df["measurement"],
+        "timestamp": timestamp,
+        "value": df["result"],
+        "unit": df["unit"],
+    }), "ecodetection")
+
+
+def normalize_lab(df):
+    df = df.dropna(subset=["Measure"])
+    return _finish(pd.DataFrame({
+        "site": canonical_site(df["Subsite_Code"]),
+        "measurement": df["Measure"],
+        "timestamp": df["date_sampled"],
+        "value": df["Result"],
+        "unit": df["Units"],
+    }), "lab")
+
+
+def normalize_bom(df):
+    frames = [
+        pd.DataFrame({
+            "site": df["station_number"],
+            "measurement": measurement,
+            "timestamp": df["date"],
+            # Widened from float32 and rounded back to the 0.1 the BOM reports
+            "value": df[column].astype("float64").round(1),
+            "unit": unit,
+        })
+        for column, (measurement, unit) in BOM_MEASUREMENTS.items()
+        if column in df
+    ]
+    return _finish(schema.concat(frames, ignore_index=True), "bom")
+
+
+def normalize_wims(df, station):
+    return _finish(pd.DataFrame({
+        "site": station,
+        "measurement": "Streamflow",
+        "timestamp": df["datetime"],
+        "value": df["discharge_ml_day"],
+        "unit": "ML/day",
+    }), "wims")
+
+
+def _canonical_sources():
+    # The full lab export is a superset of the filtered xlsx, so only it is normalized
+    return [name for name in available_sources() if name != "lab"]
+
+
+def _normalize(name):
+    # Read once per rebuild, so not held among the shared frames
+    df = read_source(name)
+    if name == "ecodetection":
+        return normalize_ecodetection(df)
+    if name == "lab_full":
+        return normalize_lab(df)
+    if name == "bom":
+        return normalize_bom(df)
+    return normalize_wims(df, name.removeprefix("wims_"))
+
+
+def build_canonical():
+    with span("normalize"):
+        frames = [_normalize(name) for name in _canonical_sources()]
+    if not frames:
+        df = compact(pd.DataFrame({column: pd.Series(dtype="string") for column in CANONICAL_COLUMNS}), CANONICAL_SCHEMA)
+    else:
+        df = schema.concat(frames, ignore_index=True)
+    with span("flag outliers"):
+        df["outlier"] = flag_outliers(df)
+    return df
+
+
+def canonical_inputs():
+    """Cache key of the canonical table: the content hash of every source."""
+    return {name: source_digest(name) for name in _canonical_sources()}
+
+
+def canonical_parquet():
+    return derived_parquet("canonical", canonical_inputs(), NORMALIZE_VERSION, build_canonical)
+
+
+def _write_dataset(directory):
+    table = pq.read_table(canonical_parquet()).replace_schema_metadata(None)
+    table = table.cast(pa.schema([
+        pa.field(field.name, pa.string()) if field.name in DATASET_KEYS else field for field in table.schema
+    ]))
+    table = table.append_column("year", pc.year(table["timestamp"]).cast(pa.int16()))
+    table = table.sort_by([(column, "ascending") for column in DATASET_KEYS + ["timestamp"]])
+    ds.write_dataset(
+        table, directory, format="parquet",
+        partitioning=DATASET_PARTITIONING,
+        basename_template="part-{i}.parquet", max_partitions=1 << 20, preserve_order=True,
+    )
+
+
+def canonical_dataset():
+    """Directory of the canonical table partitioned as source=/site=/measurement=/year=."""
+    return derived_dataset("canonical_dataset", canonical_inputs(), NORMALIZE_VERSION, _write_dataset)
+
+
+def canonical_frame(df):
+    """Canonical column order and compact label dtypes for rows read back from the dataset."""
+    columns = [column for column in CANONICAL_COLUMNS + ["outlier"] if column in df.columns]
+    return compact(df[columns], CANONICAL_SCHEMA)
+
+
+def scan_canonical(source=None, site=None, measurements=None, start=None, end=None):
+    """Canonical rows matching the arguments, reading only the dataset directories that can hold them."""
+    filters = []
+    if source is not None:
+        filters.append(("source", "==", source))
+    if site is not None:
+        filters.append(("site", "==", site))
+    if measurements is not None:
+        filters.append(("measurement", "in", list(measurements)))
+    if start is not None:
+        filters.append(("year", ">=", pd.Timestamp(start).year))
+    if end is not None:
+        filters.append(("year", "<=", pd.Timestamp(end).year))
+    filters += _time_filters("timestamp", start, end)
+    return canonical_frame(scan_dataset(canonical_dataset(), DATASET_PARTITIONING, filters=filters))
+
+
+class _SourceRows:
+    """Canonical rows of one source and the ingested batches merged into them so far."""
+
+    def __init__(self, df):
+        self.frame = df
+        self.batches = ()
+        self.lock = threading.Lock()
+
+
+def _merge_uploaded(df, uploaded):
+    """`df` with `uploaded` rows merged in; only the series they touch are rebuilt and re-flagged."""
+    uploaded = compact(uploaded, CANONICAL_SCHEMA)
+    series = ["site", "measurement"]
+    touched = pd.MultiIndex.from_frame(df[series]).isin(pd.MultiIndex.from_frame(uploaded[series].drop_duplicates()))
+    merged = schema.concat([df[touched], uploaded], ignore_index=True)
+    merged = merged.drop_duplicates(subset=series + ["timestamp"], keep="last").reset_index(drop=True)
+    # Uploads can land anywhere in a series' history, so its flags are recomputed
+    merged["outlier"] = flag_outliers(merged)
+    return schema.concat([df[~touched], merged], ignore_index=True)
+
+
+@st.cache_resource(max_entries=SHARED_FRAMES)
+def _canonical_subset(path, mtime_ns, source):
+    # Keyed by the dataset only; batches are merged in as they arrive
+    return _SourceRows(scan_canonical(source).reset_index(drop=True))
+
+
+def load_canonical(source=None):
+    """Canonical long table including uploaded data, optionally restricted to one source."""
+    path = canonical_parquet()
+    versions = ingested_versions()
+    if source is None:
+        if not versions:
+            return load_parquet(path)
+        sources = load_parquet(path)["source"].unique().tolist()
+        sources += [name for name in versions if name not in sources]
+        return schema.concat([load_canonical(name) for name in sources], ignore_index=True)
+    dataset = canonical_dataset()
+    rows = _canonical_subset(str(dataset), dataset.stat().st_mtime_ns, source)
+    with rows.lock:
+        # Batches are append-only, so only the ones not merged yet are read
+        new = [batch for batch in versions.get(source, ()) if batch not in rows.batches]
+        if new:
+            rows.frame = _merge_uploaded(rows.frame, ingested_rows(source, new))
+            rows.batches += tuple(new)
+        return shared_view(rows.frame)
+
+
+def _time_filters(column, start, end):
+    filters = []
+    if start is not None:
+        filters.append((column, ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append((column, "<=", pd.Timestamp(end)))
+    return filters
+
+
+@st.cache_resource(max_entries=64)
+def _bom_series(path, mtime_ns, station, measurement, start, end, batches):
+    frames = [scan_canonical("bom", station, [measurement], start, end)[CANONICAL_COLUMNS]]
+
+    # Uploaded BOM rows are already canonical; push the same predicates down
+    for batch in batches:
+        frames.append(scan_parquet(
+            INGEST_DIR / "bom" / f"{batch}.parquet",
+            filters=[("site", "==", station), ("measurement", "==", measurement)]
+            + _time_filters("timestamp", start, end),
+        ))
+    df = schema.concat([compact(frame, CANONICAL_SCHEMA) for frame in frames], ignore_index=True).drop_duplicates(subset="timestamp", keep="last")
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def load_bom_series(station, measurement="Rainfall", start=None, end=None):
+    """Canonical rows of one BOM station and measurement in [start, end].
+
+    Only the station's directories for the requested years are read from
+    the partitioned dataset, so memory follows the query, not the archive.
+    """
+    path = canonical_dataset()
+    batches = ingested_versions().get("bom", ())
+    return shared_view(_bom_series(str(path), path.stat().st_mtime_ns, station, measurement, start, end, batches))
+
+
+@st.cache_data
+def _registry(path, mtime_ns):
+    return (
+        pd.read_parquet(path, columns=["source", "measurement", "parameter", "unit"])
+        .drop_duplicates()
+        .sort_values(["source", "measurement"])
+        .reset_index(drop=True)
+    )
+
+
+def measurement_registry():
+    """Distinct (source, measurement, parameter, unit) rows of the canonical table."""
+    path = canonical_parquet()
+    return _registry(str(path), path.stat().st_mtime_ns)
@@ -0,0 +1,55 @@
+"""Rolling robust outlier flags for the sensor series.
+
+A reading is flagged when it is more than THRESHOLD robust standard
+deviations away from the rolling median of the window ending at it (the
+reading itself and the WINDOW - 1 before it), where the spread is the
+rolling median absolute deviation (MAD) over the same kind of window. The
+windows only look back, so a reading's flag depends on its own history and
+never on the date range being viewed, and new readings can be flagged without touching
+older ones. Flags are computed once per site x measurement when the
+canonical table is built and stored in its ``outlier`` column.
+"""
+import pandas as pd
+
+# Sources whose series are continuous enough for a rolling detector
+OUTLIER_SOURCES = ["ecodetection"]
+
+# Readings per window (7 days of 15-minute readings), and fewest before flagging starts
+WINDOW = 672
+MIN_PERIODS = 96
+
+# Robust z-score above which a reading is flagged; 1.4826 scales a MAD to a standard deviation
+THRESHOLD = 3.5
+MAD_SCALE = 1.4826
+
+# Readings that can influence a flag: the deviation window reaches back over the median window
+HISTORY = 2 * WINDOW
+
+
+def flag_series(values):
+    """Outlier flags for one time-sorted series of values."""
+    median = values.rolling(WINDOW, min_periods=MIN_PERIODS).median()
+    deviation = (values - median).abs()
+    mad = deviation.rolling(WINDOW, min_periods=MIN_PERIODS).median()
+    # A flat window (MAD of 0) flags nothing rather than every small change
+    score = deviation / (MAD_SCALE * mad.where(mad > 0))
+    return (score > THRESHOLD).fillna(False).astype(bool)
+
+
+def flag_outliers(df, keys=("source", "site", "measurement")):
+    """Outlier flags for a canonical table, computed per series in time order."""
+    flags = pd.Series(False, index=df.index)
+    rows = df[df["source"].isin(OUTLIER_SOURCES)].sort_values("timestamp", kind="stable")
+    for _, series in rows.groupby(list(keys), sort=False, observed=True)["value"]:
+        flags.loc[series.index] = flag_series(series.reset_index(drop=True)).to_numpy()
+    return flags
+
+
+def update_flags(partition, first_new):
+    """Re-flag a time-sorted partition from position `first_new` on, reading only the history it needs."""
+    if partition.empty or partition["source"].iloc[0] not in OUTLIER_SOURCES:
+        return partition.assign(outlier=partition["outlier"].fillna(False).astype(bool))
+    start = max(0, first_new - HISTORY)
+    flags = partition["outlier"].fillna(False).to_numpy(dtype=bool)
+    flags[first_new:] = flag_series(partition["value"].iloc[start:].reset_index(drop=True)).to_numpy()[first_new - start:]
+    return partition.assign(outlier=flags)
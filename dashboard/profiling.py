@@ -0,0 +1,150 @@
+"""Per-rerun timings of the stages of a page.
+
+A page calls `start_trace` at the top and `finish_trace` at the bottom,
+and wraps its stages (load, normalize, filter, build figure, render) in
+`span`. Spans nest: a span opened inside another is recorded under its
+path, e.g. ``load/normalize`` when a cache miss rebuilds the canonical
+table while the page loads it. Outside a traced rerun (the alarm worker,
+background exports, benchmarks) a span does nothing.
+
+Open a page with ``?debug=1`` to show the timings in the sidebar. Set
+DASHBOARD_METRICS_JSONL to append one JSON line per rerun to that file,
+and DASHBOARD_METRICS_PROM to keep a Prometheus text file with the totals
+of every page and span since the app started, for a textfile scraper.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+METRICS_JSONL = os.environ.get("DASHBOARD_METRICS_JSONL")
+METRICS_PROM = os.environ.get("DASHBOARD_METRICS_PROM")
+
+# The trace of the rerun running on this thread; Streamlit runs each rerun of a session on one script thread
+_current = threading.local()
+
+# (page, span) -> [total seconds, count] across all sessions, for the Prometheus file
+_totals = {}
+_export_lock = threading.Lock()
+
+
+class Trace:
+    """Span timings of one rerun of one page."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.timestamp = pd.Timestamp.now(tz="UTC")
+        self.spans = {}  # path -> [seconds, calls], in the order first opened
+        self.stack = []
+
+    def add(self, path, seconds):
+        entry = self.spans.setdefault(path, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def top_level(self):
+        """Seconds spent in spans that are not inside another span."""
+        return sum(seconds for path, (seconds, _) in self.spans.items() if "/" not in path)
+
+
+def start_trace(page):
+    """Start timing a rerun of `page`; any unfinished trace on this thread is dropped."""
+    _current.trace = Trace(page)
+    return _current.trace
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as stage `name` of the current rerun."""
+    trace = getattr(_current, "trace", None)
+    if trace is None:
+        yield
+        return
+    trace.stack.append(name)
+    path = "/".join(trace.stack)
+    # Listed where the span opens, so nested spans follow the span they are in
+    trace.spans.setdefault(path, [0.0, 0])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(path, time.perf_counter() - start)
+        trace.stack.pop()
+
+
+def _debug_enabled():
+    return st.query_params.get("debug") == "1"
+
+
+def _show_panel(trace, seconds):
+    with st.sidebar.expander("⏱️ Rerun timings", expanded=True):
+        rows = [(path, spent * 1000, calls) for path, (spent, calls) in trace.spans.items()]
+        rows.append(("(outside spans)", (seconds - trace.top_level()) * 1000, 1))
+        st.dataframe(
+            pd.DataFrame(rows, columns=["span", "ms", "calls"]),
+            hide_index=True,
+            column_config={"ms": st.column_config.NumberColumn(format="%.1f")},
+        )
+        st.caption(f"Rerun took {seconds * 1000:.0f} ms.")
+
+
+def _write_jsonl(path, trace, seconds):
+    record = {
+        "time": trace.timestamp.isoformat(),
+        "page": trace.page,
+        "seconds": round(seconds, 6),
+        "spans": {name: {"seconds": round(spent, 6), "calls": calls} for name, (spent, calls) in trace.spans.items()},
+    }
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(record) + "\n")
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_prometheus(path):
+    lines = [
+        "# HELP dashboard_span_seconds Time spent in each stage of a page rerun.",
+        "# TYPE dashboard_span_seconds summary",
+    ]
+    for (page, name), (spent, calls) in sorted(_totals.items()):
+        labels = f'page="{_label(page)}",span="{_label(name)}"'
+        lines.append(f"dashboard_span_seconds_sum{{{labels}}} {spent:.6f}")
+        lines.append(f"dashboard_span_seconds_count{{{labels}}} {calls}")
+    # Written next to the target and renamed, so a scraper never reads half a file
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def finish_trace():
+    """End the current rerun's trace: show the debug panel and export the timings."""
+    trace = getattr(_current, "trace", None)
+    if trace is None:
+        return None
+    _current.trace = None
+    seconds = time.perf_counter() - trace.started
+
+    if _debug_enabled():
+        _show_panel(trace, seconds)
+
+    if METRICS_JSONL or METRICS_PROM:
+        with _export_lock:
+            if METRICS_JSONL:
+                _write_jsonl(METRICS_JSONL, trace, seconds)
+            if METRICS_PROM:
+                # The whole rerun is reported as the "rerun" span
+                for name, (spent, calls) in [*trace.spans.items(), ("rerun", (seconds, 1))]:
+                    entry = _totals.setdefault((trace.page, name), [0.0, 0])
+                    entry[0] += spent
+                    entry[1] += calls
+                _write_prometheus(METRICS_PROM)
+    return trace
@@ -0,0 +1,129 @@
+"""Hourly, daily and monthly rollups of the continuous series.
+
+For every source x site x measurement of the EcoDetection, BOM and WIMS
+series the rollups hold min / max / mean / count / last per bucket, with
+``value`` set to the bucket mean.
+
+`query` reads raw rows while a chart can downsample them itself (LTTB and
+min/max keep the spikes, see dashboard.downsample). Only when the window
+holds more raw rows than that does it pick the coarsest level that still
+leaves enough points, so a multi-year view reads a few thousand rollup
+rows instead of every 15-minute reading. Rollup rows are then returned as
+each bucket's min followed by its max, so a line chart still reaches
+every peak and trough; a mean would flatten them.
+"""
+import pandas as pd
+
+from dashboard.data_access import derived_parquet, ingested_versions
+from dashboard.normalize import canonical_inputs, load_canonical
+from dashboard.store import PARTITION_KEYS, canonical_store, load_store, sync_ingested
+
+# Bump when the rollup layout changes so persisted rollups are rebuilt
+ROLLUP_VERSION = 1
+
+ROLLUP_SOURCES = ["ecodetection", "bom", "wims"]
+
+# Level -> (bucket size used by the planner, how to bucket a timestamp), coarsest first
+LEVELS = {
+    "monthly": (pd.Timedelta(days=30.44), lambda ts: ts.dt.to_period("M").dt.to_timestamp()),
+    "daily": (pd.Timedelta(days=1), lambda ts: ts.dt.floor("D")),
+    "hourly": (pd.Timedelta(hours=1), lambda ts: ts.dt.floor("h")),
+}
+
+# Fewest points a chart should get before a finer level is used
+MIN_POINTS = 200
+
+# Raw rows per series a chart downsamples itself before rollups are used
+RAW_POINT_BUDGET = 50_000
+
+KEYS = ["source", "site", "measurement", "unit"]
+
+
+def aggregate(df, level):
+    """Roll canonical rows `df` up into `level` buckets."""
+    df = df.sort_values("timestamp", kind="stable")
+    _, bucket = LEVELS[level]
+    rollup = (
+        df.assign(timestamp=bucket(df["timestamp"]))
+        .groupby(KEYS + ["timestamp"], observed=True)["value"]
+        .agg(["min", "max", "mean", "count", "last"])
+        .reset_index()
+    )
+    rollup["value"] = rollup["mean"]
+    return rollup
+
+
+def build_rollup(level):
+    df = load_canonical()
+    return aggregate(df[df["source"].isin(ROLLUP_SOURCES)], level)
+
+
+def rollup_inputs():
+    """Cache key of the rollups: the sources and the ingested batches they are built from."""
+    # Lists, as the key reads back from its JSON file
+    ingested = {source: list(batches) for source, batches in ingested_versions().items()}
+    return {"sources": canonical_inputs(), "ingested": ingested}
+
+
+def rollup_parquet(level):
+    return derived_parquet(
+        f"rollup_{level}", rollup_inputs(), ROLLUP_VERSION, lambda: build_rollup(level)
+    )
+
+
+def rollup_store(level):
+    """SeriesStore over one rollup level, with uploaded rows rolled in."""
+    store = load_store(rollup_parquet(level))
+
+    def apply(rows):
+        # Re-aggregate only the partitions the new rows touch, from the merged raw rows
+        raw = canonical_store()
+        rows = rows[rows["source"].isin(ROLLUP_SOURCES)]
+        for key in rows[PARTITION_KEYS].drop_duplicates().itertuples(index=False, name=None):
+            store.replace(key, aggregate(raw.partition(key), level))
+
+    sync_ingested(store, apply)
+    return store
+
+
+def raw_points(source, site, start, end, measurements=None):
+    """Raw rows in [start, end] of the largest of `site`'s series, counted from the daily rollup.
+
+    Days cut by the window count in full, which errs towards rollups.
+    """
+    if source not in ROLLUP_SOURCES:
+        return 0
+    start = None if start is None else pd.Timestamp(start).floor("D")
+    days = rollup_store("daily").slice(source, site, measurements, start, end)
+    if days.empty:
+        return 0
+    return int(days.groupby("measurement", observed=True)["count"].sum().max())
+
+
+def plan_resolution(start, end, raw_points=None, min_points=MIN_POINTS):
+    """"raw" while `raw_points` fit RAW_POINT_BUDGET, else the coarsest level with `min_points` buckets.
+
+    Without `raw_points` only the window decides. Windows too short for any
+    level's buckets use hourly rollups, the finest.
+    """
+    if raw_points is not None and raw_points <= RAW_POINT_BUDGET:
+        return "raw"
+    window = pd.Timestamp(end) - pd.Timestamp(start)
+    for level, (bucket_size, _) in LEVELS.items():
+        if window / bucket_size >= min_points:
+            return level
+    return "raw" if raw_points is None else "hourly"
+
+
+def envelope(rows):
+    """Rollup rows as two rows per bucket, `value` the bucket's min and then its max."""
+    pairs = pd.concat([rows.assign(value=rows["min"]), rows.assign(value=rows["max"])])
+    return pairs.sort_index(kind="stable").reset_index(drop=True)
+
+
+def query(source, site, start, end, measurements=None, min_points=MIN_POINTS):
+    """Rows of `site` in [start, end]: raw, or rollup min/max pairs at the level `plan_resolution` picks."""
+    level = plan_resolution(start, end, raw_points(source, site, start, end, measurements), min_points)
+    if level == "raw":
+        return canonical_store().slice(source, site, measurements, start, end)
+    return envelope(rollup_store(level).slice(source, site, measurements, start, end))
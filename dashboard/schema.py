@@ -0,0 +1,99 @@
+"""Compact in-memory column types of the raw and canonical tables.
+
+Labels that repeat on every row (sites, measurements, units, station and
+lab codes) are categoricals, one small integer code per row instead of a
+string; codes from a known set have fixed categories. Free text is kept
+as Arrow strings and day counts as nullable small integers. BOM
+observations are float32: the BOM reports them to 0.1, and
+`normalize_bom` rounds them back exactly when it widens them. Sensor and
+lab results stay float64, because they are compared with lab results and
+exported as reported.
+
+pandas concatenates categoricals with different categories into plain
+strings, so frames of these types are combined with `concat`, which
+unions the categories first. `footprint_report` compares the memory of
+each table with the string and float64 layout it had before.
+"""
+import pandas as pd
+
+LABEL = "category"
+TEXT = pd.StringDtype("pyarrow")
+# BOM quality flags: Y quality controlled, N not yet. Fixed, so every chunk
+# and upload of BOM data has the same categories, even one without any flags
+QUALITY = pd.CategoricalDtype(["N", "Y"])
+
+# Raw layout -> compact column types of its Parquet cache
+RAW_SCHEMAS = {
+    "ecodetection": {"location": LABEL, "measurement": LABEL, "unit": LABEL},
+    "bom": {
+        "station_number": LABEL,
+        "rain_quality": QUALITY,
+        "rainfall": "float32",
+        "rain_period": "UInt16",
+        "max_temp": "float32",
+        "max_temp_days": "UInt16",
+        "min_temp": "float32",
+        "min_temp_days": "UInt16",
+    },
+    "lab": {
+        "Subsite_Code": LABEL,
+        "Subsite_Name": LABEL,
+        "Subsite_Type": LABEL,
+        "System": LABEL,
+        "Zone": LABEL,
+        "Measure": LABEL,
+        "Units": LABEL,
+        "Result_Qualifier": LABEL,
+        "Sample_No": "UInt32",
+        "Result_Text": TEXT,
+    },
+    "wims": {},
+}
+
+# Label columns of canonical rows; timestamp, value and outlier keep their types
+CANONICAL_SCHEMA = {"source": LABEL, "site": LABEL, "measurement": LABEL, "parameter": LABEL, "unit": LABEL}
+
+
+def compact(df, schema):
+    """`df` with the columns named in `schema` cast to their compact types."""
+    return df.astype({column: dtype for column, dtype in schema.items() if column in df.columns})
+
+
+def concat(frames, **kwargs):
+    """pd.concat that keeps categorical columns categorical when their categories differ."""
+    frames = list(frames)
+    if len(frames) > 1:
+        for column in frames[0].columns:
+            columns = [frame[column] for frame in frames if column in frame.columns]
+            if len(columns) < len(frames) or not all(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+                continue
+            if any(c.dtype != columns[0].dtype for c in columns):
+                # Recode every frame onto the sorted union of the categories; only the codes change
+                dtype = pd.CategoricalDtype(sorted(set().union(*(c.cat.categories for c in columns))))
+                frames = [frame.astype({column: dtype}) for frame in frames]
+    return pd.concat(frames, **kwargs)
+
+
+def widen(df):
+    """`df` in the layout the tables had before: strings, float64 and float64 counts."""
+    types = {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            types[column] = "string"
+        elif dtype == "float32" or isinstance(dtype, (pd.UInt16Dtype, pd.UInt32Dtype)):
+            types[column] = "float64"
+    return df.astype(types)
+
+
+def footprint(df):
+    """Bytes held by `df`, including the string data."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def footprint_report(frames):
+    """Rows, memory before and after (MB) and saving for each named frame in `frames`."""
+    rows = []
+    for name, df in frames.items():
+        before, after = footprint(widen(df)), footprint(df)
+        rows.append((name, len(df), before / 2**20, after / 2**20, 1 - after / before if before else 0.0))
+    return pd.DataFrame(rows, columns=["table", "rows", "before_mb", "after_mb", "saving"])
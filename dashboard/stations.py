@@ -0,0 +1,116 @@
+"""Registry of monitoring stations and nearest-station lookup.
+
+Stations are read from ``data/monitoring_stations.xlsx`` (owner, reference,
+name, type and coordinates). Each station gets the key its readings carry in
+the canonical table: the canonical site name for water quality sensors and
+lab sampling points, the WIMS station number for stream gauges and the
+zero-padded BOM station number for weather stations. A sensor site's
+rainfall and streamflow stations are the nearest stations of that type by
+great-circle (haversine) distance, resolved for all sites in one vectorized
+pass, so adding sites or stations to the spreadsheet is all it takes.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from dashboard.data_access import DATA_DIR
+from dashboard.normalize import canonical_site
+
+STATIONS_PATH = DATA_DIR / "monitoring_stations.xlsx"
+
+SENSOR = "Water Quality (sensor)"
+LAB = "Water Quality (lab)"
+RAINFALL = "Rainfall"
+TEMPERATURE = "Temperature"
+STREAMFLOW = "Stream flow"
+
+# Station types whose readings are keyed by BOM station number
+WEATHER_TYPES = [RAINFALL, TEMPERATURE]
+
+# Stations further away than this are not linked to a site
+MAX_DISTANCE_KM = 25
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@st.cache_data
+def _load_stations(path, mtime_ns):
+    df = pd.read_excel(path).rename(columns={"lattitude": "latitude"})
+    df["reference"] = df["reference"].astype("string").str.strip()
+    df["station_name"] = df["station_name"].astype("string").str.strip()
+    # Site the station belongs to, and the key its readings carry in the canonical table
+    df["site"] = canonical_site(df["station_name"])
+    df["key"] = df["site"]
+    df.loc[df["type"] == STREAMFLOW, "key"] = df["reference"]
+    weather = df["type"].isin(WEATHER_TYPES)
+    df.loc[weather, "key"] = df.loc[weather, "reference"].str.zfill(6)
+    return df
+
+
+def load_stations(path=STATIONS_PATH):
+    """All monitoring stations, with canonical `site` and data `key` columns."""
+    return _load_stations(str(path), path.stat().st_mtime_ns)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; arguments broadcast like numpy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype="float64")) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def nearest_stations(points, candidates, max_km=MAX_DISTANCE_KM):
+    """Key and distance of the nearest row of `candidates` for each row of `points`.
+
+    Both frames need latitude and longitude columns; the result is indexed
+    like `points`, with a missing key where nothing lies within `max_km`.
+    """
+    result = pd.DataFrame({"key": pd.Series(pd.NA, index=points.index, dtype="string"), "distance_km": np.nan})
+    if points.empty or candidates.empty:
+        return result
+    # Sites x candidates distance matrix, then the closest candidate per site
+    distances = haversine_km(
+        points["latitude"].to_numpy()[:, None], points["longitude"].to_numpy()[:, None],
+        candidates["latitude"].to_numpy()[None, :], candidates["longitude"].to_numpy()[None, :],
+    )
+    nearest = distances.argmin(axis=1)
+    result["distance_km"] = distances[np.arange(len(points)), nearest]
+    result["key"] = pd.Series(candidates["key"].to_numpy()[nearest], index=points.index, dtype="string")
+    result.loc[result["distance_km"] > max_km, "key"] = pd.NA
+    return result
+
+
+@st.cache_data
+def _station_links(path, mtime_ns):
+    stations = _load_stations(path, mtime_ns)
+    sites = stations[stations["type"] == SENSOR].drop_duplicates("site").set_index("site")
+    links = {}
+    for kind, station_type in (("rainfall", RAINFALL), ("streamflow", STREAMFLOW)):
+        nearest = nearest_stations(sites, stations[stations["type"] == station_type])
+        links[f"{kind}_station"] = nearest["key"]
+        links[f"{kind}_km"] = nearest["distance_km"]
+    return pd.DataFrame(links, index=sites.index)
+
+
+def station_links(path=STATIONS_PATH):
+    """Sensor site -> nearest rainfall and streamflow station keys and distances."""
+    return _station_links(str(path), path.stat().st_mtime_ns)
+
+
+def site_stations(site):
+    """{"rainfall": key, "streamflow": key} for a sensor site; None where no station is near."""
+    links = station_links()
+    if site not in links.index:
+        return {"rainfall": None, "streamflow": None}
+    row = links.loc[site]
+    return {
+        kind: None if pd.isna(row[f"{kind}_station"]) else row[f"{kind}_station"]
+        for kind in ("rainfall", "streamflow")
+    }
+
+
+def station_name(key):
+    """Display name of the station with data key `key`."""
+    stations = load_stations()
+    names = stations.loc[stations["key"] == key, "station_name"]
+    return key if names.empty else names.iloc[0]
@@ -0,0 +1,282 @@
+"""Time-sorted, partitioned view of a canonical-style table.
+
+Rows are split once into (source, site, measurement) partitions, each kept
+sorted by timestamp. A date-range filter is then two binary searches inside
+one partition and the rows come back as a positional slice of that
+partition, instead of a boolean-mask copy of the whole table. Newly
+ingested rows are merged into only the partitions they touch.
+"""
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+
+from dashboard.data_access import hive_directories, ingested_rows, ingested_versions
+from dashboard.normalize import canonical_dataset, canonical_frame, canonical_parquet, measurement_registry
+from dashboard.outliers import update_flags
+from dashboard.schema import concat
+
+PARTITION_KEYS = ["source", "site", "measurement"]
+
+# Held while ingested batches are applied to a store, so none is applied twice.
+# Re-entrant: applying to a derived store first brings the stores it reads up to date
+_sync_lock = threading.RLock()
+
+
+class SeriesStore:
+    """Rows partitioned by (source, site, measurement), each partition sorted by time."""
+
+    def __init__(self, df):
+        self._partitions = {}
+        self._timestamps = {}
+        self._measurements = defaultdict(list)
+        self._empty = df.iloc[0:0]
+        self._lock = threading.Lock()
+        # Source -> ingested batches already merged in
+        self.versions = {}
+
+        df = df.sort_values(PARTITION_KEYS + ["timestamp"], kind="stable")
+        for key, partition in df.groupby(PARTITION_KEYS, sort=False, observed=True):
+            self._set(key, partition.reset_index(drop=True))
+
+    def _set(self, key, partition):
+        if key[2] not in self._measurements[key[:2]]:
+            self._measurements[key[:2]].append(key[2])
+        self._timestamps[key] = partition["timestamp"].to_numpy()
+        self._partitions[key] = partition
+
+    def keys(self):
+        return list(self._partitions)
+
+    def measurements(self, source, site):
+        return list(self._measurements.get((source, site), []))
+
+    def partition(self, key):
+        return self._partitions.get(key, self._empty)
+
+    def last(self, key):
+        """Latest row of partition `key`, or None if it is empty."""
+        partition = self._partitions.get(key, self._empty)
+        return None if partition.empty else partition.iloc[-1]
+
+    def replace(self, key, partition):
+        """Swap in a new, time-sorted frame for one partition."""
+        with self._lock:
+            self._set(key, partition.reset_index(drop=True))
+
+    def merge(self, rows):
+        """Merge new rows into their partitions; new rows win on equal timestamps."""
+        for key, new in rows.groupby(PARTITION_KEYS, sort=False, observed=True):
+            merged = (
+                concat([self.partition(key), new], ignore_index=True)
+                .drop_duplicates(subset="timestamp", keep="last")
+                .sort_values("timestamp", kind="stable")
+                .reset_index(drop=True)
+            )
+            if "outlier" in merged:
+                # Only readings from the earliest new one on can change flag
+                first_new = int(np.searchsorted(merged["timestamp"].to_numpy(), new["timestamp"].min().to_datetime64()))
+                merged = update_flags(merged, first_new)
+            self.replace(key, merged)
+
+    def _range(self, key, start, end):
+        timestamps = self._timestamps[key]
+        first = 0 if start is None else int(np.searchsorted(timestamps, _as_datetime64(start, timestamps), "left"))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, _as_datetime64(end, timestamps), "right"))
+        return first, max(first, last)
+
+    def slice(self, source, site, measurements=None, start=None, end=None):
+        """Rows of `site` (optionally only `measurements`) with start <= timestamp <= end."""
+        if measurements is None:
+            measurements = self.measurements(source, site)
+        parts = []
+        for measurement in measurements:
+            key = (source, site, measurement)
+            if key in self._partitions:
+                lo, hi = self._range(key, start, end)
+                if hi > lo:
+                    parts.append(self._partitions[key].iloc[lo:hi])
+
+        if not parts:
+            return self._empty
+        if len(parts) == 1:
+            return parts[0]
+        return concat(parts, ignore_index=True)
+
+    def rows(self, source, measurements=None):
+        """All rows of `source` across its sites, optionally only `measurements`."""
+        parts = [
+            partition
+            for (key_source, _, measurement), partition in self._partitions.items()
+            if key_source == source and (measurements is None or measurement in measurements)
+        ]
+        return concat(parts, ignore_index=True) if parts else self._empty
+
+    def time_bounds(self, source, site, measurements=None):
+        """(first, last) timestamp of `site`, or (None, None) if it has no rows."""
+        if measurements is None:
+            measurements = self.measurements(source, site)
+        series = [
+            self._timestamps[(source, site, measurement)]
+            for measurement in measurements
+            if len(self._timestamps.get((source, site, measurement), ()))
+        ]
+        if not series:
+            return None, None
+        return pd.Timestamp(min(ts[0] for ts in series)), pd.Timestamp(max(ts[-1] for ts in series))
+
+
+class DatasetStore(SeriesStore):
+    """SeriesStore over a source=/site=/measurement=/year= dataset, read lazily.
+
+    Only the directory listing is read up front. A partition's years are read
+    the first time a slice overlaps them, so a page showing one site and one
+    year opens only that directory, and memory grows with what is viewed.
+    """
+
+    def __init__(self, root, empty):
+        super().__init__(empty)
+        self._root = root
+        # Partition key -> {year: directory}, and the years already read
+        self._years = defaultdict(dict)
+        self._loaded = defaultdict(set)
+        self._load_lock = threading.Lock()
+        for (source, site, measurement, year), directory in hive_directories(root).items():
+            self._years[(source, site, measurement)][int(year)] = directory
+            if measurement not in self._measurements[(source, site)]:
+                self._measurements[(source, site)].append(measurement)
+
+    def _ensure(self, key, start=None, end=None):
+        # Read the years of `key` overlapping [start, end] that are not loaded yet
+        first = None if start is None else pd.Timestamp(start).year
+        last = None if end is None else pd.Timestamp(end).year
+        with self._load_lock:
+            years = [
+                year for year in self._years.get(key, {})
+                if year not in self._loaded[key] and (first is None or year >= first) and (last is None or year <= last)
+            ]
+            if not years:
+                return
+            frames = [self._read(key, self._years[key][year]) for year in years]
+            if key in self._partitions:
+                frames.append(self._partitions[key])
+            partition = concat(frames, ignore_index=True).sort_values("timestamp", kind="stable")
+            self.replace(key, partition)
+            self._loaded[key].update(years)
+
+    def _read(self, key, directory):
+        # The partition columns come from the key rather than from the directory names
+        frame = pq.read_table(sorted(str(path) for path in directory.glob("*.parquet")), partitioning=None).to_pandas()
+        values = dict(zip(PARTITION_KEYS, key))
+        return pd.DataFrame({
+            column: _constant(values[column], len(frame), dtype) if column in values else frame[column].astype(dtype)
+            for column, dtype in self._empty.dtypes.items()
+        })
+
+    def keys(self):
+        return list(dict.fromkeys([*self._years, *self._partitions]))
+
+    def partition(self, key):
+        self._ensure(key)
+        return super().partition(key)
+
+    def last(self, key):
+        years = self._years.get(key)
+        if years:
+            self._ensure(key, start=pd.Timestamp(year=max(years), month=1, day=1))
+        return super().last(key)
+
+    def slice(self, source, site, measurements=None, start=None, end=None):
+        if measurements is None:
+            measurements = self.measurements(source, site)
+        for measurement in measurements:
+            self._ensure((source, site, measurement), start, end)
+        return super().slice(source, site, measurements, start, end)
+
+    def rows(self, source, measurements=None):
+        for key in self.keys():
+            if key[0] == source and (measurements is None or key[2] in measurements):
+                self._ensure(key)
+        return super().rows(source, measurements)
+
+    def time_bounds(self, source, site, measurements=None):
+        if measurements is None:
+            measurements = self.measurements(source, site)
+        # The first and last year hold the bounds
+        for measurement in measurements:
+            years = self._years.get((source, site, measurement))
+            if years:
+                self._ensure((source, site, measurement), end=pd.Timestamp(year=min(years), month=12, day=31))
+                self._ensure((source, site, measurement), start=pd.Timestamp(year=max(years), month=1, day=1))
+        return super().time_bounds(source, site, measurements)
+
+
+def _constant(value, n, dtype):
+    # One code repeated, instead of n strings that are then looked up in the categories
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(np.full(n, dtype.categories.get_loc(value)), dtype=dtype, validate=False)
+    return pd.Series([value] * n, dtype=dtype)
+
+
+def _as_datetime64(value, timestamps):
+    return pd.Timestamp(value).to_datetime64().astype(timestamps.dtype)
+
+
+def sync_ingested(store, apply=None):
+    """Bring `store` up to date with batches ingested since it was built.
+
+    Only batches not seen before are read; `apply(rows)` defaults to
+    merging their rows into the partitions they touch. Batches count as
+    seen once applied, so if `apply` fails the next call tries them again.
+    """
+    for source, batches in ingested_versions().items():
+        with _sync_lock:
+            applied = store.versions.get(source, ())
+            new = [batch for batch in batches if batch not in applied]
+            if not new:
+                continue
+            (apply or store.merge)(ingested_rows(source, new))
+            with store._lock:
+                store.versions[source] = batches
+
+
+@st.cache_resource(max_entries=8)
+def _store(path, mtime_ns):
+    # Shared by all sessions; callers only take slices of it
+    return SeriesStore(pd.read_parquet(path))
+
+
+def load_store(path):
+    return _store(str(path), path.stat().st_mtime_ns)
+
+
+def _label_types(root):
+    # Every label of the dataset, so all partitions share one categorical type and concatenate without recoding
+    registry = measurement_registry()
+    labels = {column: registry[column].dropna().unique() for column in ["source", "measurement", "parameter", "unit"]}
+    labels["site"] = [site for _, site, _, _ in hive_directories(root)]
+    return {column: pd.CategoricalDtype(sorted(set(values))) for column, values in labels.items()}
+
+
+@st.cache_resource(max_entries=2)
+def _dataset_store(path, mtime_ns, parquet):
+    # Column types come from the canonical table, rows from the dataset on demand
+    empty = canonical_frame(pq.read_schema(parquet).empty_table().to_pandas())
+    return DatasetStore(Path(path), empty.astype(_label_types(Path(path))))
+
+
+def dataset_store():
+    """DatasetStore over the partitioned canonical dataset, without uploads."""
+    root = canonical_dataset()
+    return _dataset_store(str(root), root.stat().st_mtime_ns, str(canonical_parquet()))
+
+
+def canonical_store():
+    """SeriesStore over the canonical dataset plus every ingested upload."""
+    store = dataset_store()
+    sync_ingested(store)
+    return store
@@ -0,0 +1,152 @@
+"""Shared cache of the derived views the pages draw.
+
+A view is what a page computes from the shared stores for one choice of
+parameters, e.g. the downsampled chart data of one site, date range and
+parameter. Functions decorated with `cached_view` are computed once per
+distinct arguments and served to every session that asks for the same
+view, until the data changes.
+
+The cache is one LRU per process, bounded by the memory of the frames it
+holds (DASHBOARD_VIEW_CACHE_MB, 256 by default) and by age
+(DASHBOARD_VIEW_CACHE_TTL seconds, 900 by default). The key includes the
+version of the canonical dataset and the ingested batches, so an upload
+makes the next request recompute, and the views of older data age out.
+Callers get shallow copies and must not modify the frames in place.
+"""
+import functools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from dashboard.data_access import ingested_versions, shared_view
+from dashboard.normalize import canonical_dataset
+from dashboard.profiling import span
+from dashboard.schema import footprint
+
+VIEW_CACHE_BYTES = int(float(os.environ.get("DASHBOARD_VIEW_CACHE_MB", 256)) * 2**20)
+VIEW_CACHE_TTL = float(os.environ.get("DASHBOARD_VIEW_CACHE_TTL", 900))
+
+
+def _size(value):
+    # Bytes held by a view: frames and series deeply, containers by their items
+    if isinstance(value, pd.DataFrame):
+        return footprint(value)
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True, index=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _shared(value):
+    # A frame per caller, so renaming or adding columns cannot reach the cached one
+    if isinstance(value, pd.DataFrame):
+        return shared_view(value)
+    if isinstance(value, pd.Series):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return {key: _shared(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_shared(item) for item in value)
+    return value
+
+
+class ViewCache:
+    """Least recently used views, bounded by total bytes and by age."""
+
+    def __init__(self, max_bytes=VIEW_CACHE_BYTES, ttl=VIEW_CACHE_TTL, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, bytes, expires), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, compute):
+        """The view under `key`, computed with `compute()` if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+
+        # Computed outside the lock so other views are served meanwhile
+        value = compute()
+        size = _size(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            # A view larger than the whole cache is returned without being kept
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size, self._clock() + self.ttl)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Entries, bytes held and hit / miss / eviction counts since the process started."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@st.cache_resource
+def view_cache():
+    """The ViewCache shared by all sessions."""
+    return ViewCache()
+
+
+def data_version():
+    """Changes whenever the canonical dataset is rebuilt or a batch is ingested."""
+    dataset = canonical_dataset()
+    return dataset.stat().st_mtime_ns, tuple(ingested_versions().items())
+
+
+def cached_view(func):
+    """Decorator: serve `func(*args)` from the shared view cache.
+
+    The arguments must be hashable: site names, timestamps, thresholds.
+    """
+    # Page scripts all run as __main__, so the file tells same-named views apart
+    name = (func.__code__.co_filename, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (name, data_version(), args, tuple(sorted(kwargs.items())))
+
+        def compute():
+            with span("compute view"):
+                return func(*args, **kwargs)
+
+        return _shared(view_cache().get(key, compute))
+
+    return wrapper
@@ -0,0 +1,149 @@
+"""Materialized wide view of the EcoDetection series.
+
+The long canonical rows are pivoted once into one table per resolution
+(raw readings and the hourly / daily / monthly rollups) with a row per
+site and timestamp and a float32 column per measurement. The tables are
+persisted next to the canonical table, held once per process and split by
+site with sorted timestamps, so a chart or report takes a positional slice
+instead of filtering and pivoting the long table on every rerun. Uploaded
+rows are pivoted on their own and merged into only the sites they touch.
+
+The rollup views hold bucket means, for reports. Charts go through
+`wide_query`, which reads the raw view while the window's readings can be
+downsampled directly and otherwise pivots the rollup buckets' min and max
+(see dashboard.rollups), so peaks are drawn at every level.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from dashboard.data_access import derived_parquet
+from dashboard.normalize import canonical_inputs, canonical_parquet
+from dashboard.rollups import LEVELS, MIN_POINTS, plan_resolution, raw_points, rollup_inputs, rollup_parquet, rollup_store
+from dashboard.store import sync_ingested
+
+# Bump when the wide layout changes so persisted views are rebuilt
+WIDE_VERSION = 1
+
+WIDE_SOURCE = "ecodetection"
+
+
+def pivot_wide(df):
+    """Long canonical rows -> site, timestamp and one float32 column per measurement."""
+    if df.empty:
+        return pd.DataFrame({"site": pd.Series(dtype="category"), "timestamp": pd.Series(dtype="datetime64[us]")})
+    wide = df.pivot_table(
+        index=["site", "timestamp"], columns="measurement", values="value", aggfunc="last", observed=True
+    )
+    wide = wide.astype("float32").rename_axis(columns=None).reset_index()
+    wide["site"] = wide["site"].astype("category")
+    return wide
+
+
+class WideView:
+    """Wide rows split by site, each site sorted by timestamp."""
+
+    def __init__(self, df):
+        self._sites = {}
+        self._timestamps = {}
+        self._lock = threading.Lock()
+        # Source -> ingested batches already merged in (see sync_ingested)
+        self.versions = {}
+        for site, frame in df.groupby("site", sort=False, observed=True):
+            self._set(site, frame.drop(columns="site").dropna(axis=1, how="all"))
+
+    def _set(self, site, frame):
+        frame = frame.sort_values("timestamp", kind="stable").reset_index(drop=True)
+        self._timestamps[site] = frame["timestamp"].to_numpy()
+        self._sites[site] = frame
+
+    def sites(self):
+        return list(self._sites)
+
+    def measurements(self, site):
+        return [column for column in self._sites.get(site, pd.DataFrame()).columns if column != "timestamp"]
+
+    def replace(self, site, frame):
+        """Swap in a new wide frame (timestamp and measurement columns) for one site."""
+        with self._lock:
+            self._set(site, frame)
+
+    def merge(self, site, new):
+        """Merge wide rows into one site; new values win, gaps keep the existing values."""
+        existing = self._sites.get(site)
+        if existing is not None:
+            new = new.set_index("timestamp").combine_first(existing.set_index("timestamp")).reset_index()
+        self.replace(site, new.astype({column: "float32" for column in new.columns if column != "timestamp"}))
+
+    def slice(self, site, start=None, end=None, measurements=None):
+        """Rows of `site` with start <= timestamp <= end, optionally only some measurement columns."""
+        frame = self._sites.get(site)
+        if frame is None:
+            return pd.DataFrame({"timestamp": pd.Series(dtype="datetime64[us]")})
+        timestamps = self._timestamps[site]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, _as_datetime64(start, timestamps), "left"))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, _as_datetime64(end, timestamps), "right"))
+        if measurements is not None:
+            frame = frame[["timestamp"] + [column for column in measurements if column in frame.columns]]
+        return frame.iloc[lo:max(lo, hi)]
+
+
+def _as_datetime64(value, timestamps):
+    return pd.Timestamp(value).to_datetime64().astype(timestamps.dtype)
+
+
+def _build_wide(level):
+    if level == "raw":
+        rows = pd.read_parquet(canonical_parquet(), filters=[("source", "==", WIDE_SOURCE)])
+    else:
+        rows = pd.read_parquet(rollup_parquet(level), filters=[("source", "==", WIDE_SOURCE)])
+    return pivot_wide(rows)
+
+
+def wide_parquet(level="raw"):
+    # Rollup levels are built from a rollup, so they follow its key
+    inputs = canonical_inputs() if level == "raw" else rollup_inputs()
+    return derived_parquet(f"wide_{level}", inputs, WIDE_VERSION, lambda: _build_wide(level))
+
+
+@st.cache_resource(max_entries=len(LEVELS) + 1)
+def _wide(path, mtime_ns):
+    # Shared by all sessions; callers only take slices of it
+    return WideView(pd.read_parquet(path))
+
+
+def wide_view(level="raw"):
+    """Shared WideView at `level` ("raw" or a rollup level), with uploaded rows merged in."""
+    path = wide_parquet(level)
+    view = _wide(str(path), path.stat().st_mtime_ns)
+
+    def apply(rows):
+        rows = rows[rows["source"] == WIDE_SOURCE]
+        for site, site_rows in rows.groupby("site", sort=False, observed=True):
+            if level == "raw":
+                # Raw readings: pivot just the new rows
+                view.merge(site, pivot_wide(site_rows).drop(columns="site"))
+            else:
+                # Rollups: re-pivot the site's buckets, which the rollup store has already updated
+                buckets = rollup_store(level).slice(WIDE_SOURCE, site)
+                view.replace(site, pivot_wide(buckets).drop(columns="site"))
+
+    sync_ingested(view, apply)
+    return view
+
+
+def pivot_envelope(rows):
+    """Rollup rows -> timestamp and a float32 column per measurement, each bucket's min row then its max row."""
+    low, high = pivot_wide(rows.assign(value=rows["min"])), pivot_wide(rows.assign(value=rows["max"]))
+    wide = pd.concat([low, high], ignore_index=True)
+    return wide.sort_values("timestamp", kind="stable").drop(columns="site").reset_index(drop=True)
+
+
+def wide_query(site, start, end, measurements=None, min_points=MIN_POINTS):
+    """Wide rows of `site` in [start, end]: raw readings, or rollup min/max rows at the level `plan_resolution` picks."""
+    level = plan_resolution(start, end, raw_points(WIDE_SOURCE, site, start, end, measurements), min_points)
+    if level == "raw":
+        return wide_view("raw").slice(site, start, end, measurements)
+    return pivot_envelope(rollup_store(level).slice(WIDE_SOURCE, site, measurements, start, end))
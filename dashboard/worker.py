@@ -0,0 +1,159 @@
+"""Background evaluation of the alarm rules into the event log.
+
+Run with ``python alarm_worker.py``. The worker polls for new data and
+evaluates each rule incrementally: only rows from newly ingested upload
+batches are checked, and the eco-vs-lab rule re-matches only the sites
+those rows touch. A full evaluation happens on the first run, when a
+shipped source file changes or when a rule's parameters change. The
+versions it evaluated are kept in the log, so the pages only read it while
+it is up to date.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from dashboard.data_access import ingested_rows
+from dashboard.events import (
+    EVENTS_PATH, LOG_VERSION, append_events, connect, current_inputs, get_state, replace_events, set_rules, set_state,
+)
+from dashboard.matching import match_lab_samples
+from dashboard.normalize import PARAMETERS, load_canonical
+from dashboard.store import canonical_store
+
+log = logging.getLogger("alarm_worker")
+
+# Rule -> parameters; thresholds match the page 4 slider defaults
+DEFAULT_RULES = {
+    "turbidity": {"source": "ecodetection", "measurement": PARAMETERS["Turbidity"]["ecodetection"], "threshold": 10},
+    "rainfall": {"source": "bom", "measurement": "Rainfall", "threshold": 20},
+    "eco_lab": {"parameter": "Turbidity", "threshold": 5, "tolerance_hours": 12},
+}
+
+
+def threshold_events(rule, params, rows):
+    """Events for `rows` (canonical) above a fixed threshold."""
+    rows = rows[(rows["measurement"] == params["measurement"]) & (rows["value"] > params["threshold"])]
+    return pd.DataFrame({
+        "rule": rule,
+        "site": rows["site"],
+        "measurement": rows["measurement"],
+        "timestamp": rows["timestamp"],
+        "value": rows["value"],
+        "observed": rows["value"],
+        "reference": None,
+        "readings": 1,
+        "threshold": params["threshold"],
+    })
+
+
+def log_threshold_events(conn, rule, params, rows, full=False):
+    """Log the events of a threshold rule for canonical `rows`; returns the number of new events.
+
+    With `full`, `rows` are every reading of the source and replace the rule's
+    events. Otherwise they are newly ingested readings, which win over the
+    logged ones: readings corrected to at most the threshold lose their events.
+    """
+    events = threshold_events(rule, params, rows)
+    if full:
+        return replace_events(conn, rule, params["threshold"], events)
+    stale = rows[(rows["measurement"] == params["measurement"]) & (rows["value"] <= params["threshold"])]
+    return append_events(conn, events, stale.assign(rule=rule, threshold=params["threshold"]))
+
+
+def eco_lab_events(rule, params, sites):
+    """Events for lab samples at `sites` whose matched sensor mean differs by more than the threshold."""
+    matched = match_lab_samples(params["parameter"], sites, pd.Timedelta(hours=params["tolerance_hours"]))
+    matched = matched[matched["difference_pct"] > params["threshold"]]
+    return pd.DataFrame({
+        "rule": rule,
+        "site": matched["site"],
+        "measurement": params["parameter"],
+        "timestamp": matched["timestamp"],
+        "value": matched["difference_pct"],
+        "observed": matched["eco_mean"],
+        "reference": matched["lab_value"],
+        "readings": matched["eco_count"],
+        "threshold": params["threshold"],
+    })
+
+
+def _lab_sites(parameter):
+    measurement = PARAMETERS[parameter]["lab"]
+    return sorted({site for source, site, name in canonical_store().keys() if source == "lab" and name == measurement})
+
+
+def evaluate(conn, rules):
+    """Evaluate `rules` against data not yet evaluated; returns the number of new events."""
+    current = current_inputs()
+    state = get_state(conn, "evaluated", {})
+    full = state.get("inputs") != current["inputs"] or state.get("version") != LOG_VERSION
+    seen = {} if full else state.get("batches", {})
+
+    # Rows of upload batches this worker has not evaluated yet, per source
+    new_rows = {}
+    for source, batches in current["batches"].items():
+        new = [batch for batch in batches if batch not in seen.get(source, [])]
+        if new:
+            new_rows[source] = ingested_rows(source, new)
+
+    added = 0
+    for rule, params in rules.items():
+        rerun = full or state.get("rules", {}).get(rule) != params
+        if "parameter" in params:
+            if rerun:
+                added += replace_events(conn, rule, params["threshold"], eco_lab_events(rule, params, _lab_sites(params["parameter"])))
+                continue
+            touched = [rows["site"] for source, rows in new_rows.items() if source in ("ecodetection", "lab")]
+            sites = sorted(set(pd.concat(touched))) if touched else []
+            if sites:
+                # Samples re-matched below the threshold lose their events
+                added += replace_events(conn, rule, params["threshold"], eco_lab_events(rule, params, sites), sites)
+        elif rerun:
+            added += log_threshold_events(conn, rule, params, load_canonical(params["source"]), full=True)
+        elif params["source"] in new_rows:
+            added += log_threshold_events(conn, rule, params, new_rows[params["source"]])
+
+    set_rules(conn, rules)
+    set_state(conn, "evaluated", {**current, "rules": rules, "version": LOG_VERSION})
+    set_state(conn, "last_run", datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate dashboard alarm rules into the alarm event log.")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between checks for new data")
+    parser.add_argument("--once", action="store_true", help="evaluate once and exit")
+    parser.add_argument("--turbidity", type=float, default=DEFAULT_RULES["turbidity"]["threshold"], help="NTU")
+    parser.add_argument("--rainfall", type=float, default=DEFAULT_RULES["rainfall"]["threshold"], help="mm")
+    parser.add_argument("--eco-lab", type=float, default=DEFAULT_RULES["eco_lab"]["threshold"], help="%% difference")
+    parser.add_argument(
+        "--tolerance-hours", type=float, default=DEFAULT_RULES["eco_lab"]["tolerance_hours"],
+        help="sensor readings within this many hours of a lab sample are compared with it",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    rules = {
+        "turbidity": {**DEFAULT_RULES["turbidity"], "threshold": args.turbidity},
+        "rainfall": {**DEFAULT_RULES["rainfall"], "threshold": args.rainfall},
+        "eco_lab": {**DEFAULT_RULES["eco_lab"], "threshold": args.eco_lab, "tolerance_hours": args.tolerance_hours},
+    }
+    conn = connect()
+    log.info("Writing alarm events to %s", EVENTS_PATH)
+    while True:
+        try:
+            added = evaluate(conn, rules)
+        except Exception:
+            # Keep polling; the next run retries everything not recorded as evaluated
+            log.exception("Evaluating the alarm rules failed")
+            if args.once:
+                return 1
+        else:
+            log.info("Evaluated alarm rules, %d new events", added)
+            if args.once:
+                return 0
+        time.sleep(args.interval)
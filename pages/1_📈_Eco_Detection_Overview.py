@@ -2,11 +2,16 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-from pathlib import Path
+from dashboard.downsample import downsample_columns, time_series_trace
+from dashboard.normalize import SITES
+from dashboard.profiling import finish_trace, span, start_trace
+from dashboard.store import canonical_store
+from dashboard.viewcache import cached_view
+from dashboard.wide import wide_query
 
 # Set page title and icon
 st.set_page_config(page_title="Eco Detection Site Overview", page_icon="📈")
+start_trace("Eco Detection Overview")
 
 # Page title
 st.title("📈 Eco Detection Site Overview")
@@ -15,12 +20,7 @@ st.title("📈 Eco Detection Site Overview")
 st.sidebar.header("Site Selection")
 
 # Updated monitoring site options
-site_options = [
-    "Kangaroo Creek", 
-    "Little Coliban River", 
-    "Five Mile Creek - Woodend RWP Site 1", 
-    "Five Mile Creek - Woodend RWP Site 2"
-]
+site_options = SITES
 selected_site = st.sidebar.selectbox("Choose a site to view data", site_options)
 
 st.sidebar.success(f"Viewing data for: {selected_site}")
@@ -30,134 +30,148 @@ st.sidebar.markdown("### Secondary Axis Settings")
 use_secondary_axis_conductivity = True
 use_secondary_axis_chloride = st.sidebar.checkbox("Move Chloride Concentration to Secondary Axis", value=True)
 
-# Load EcoDetection data using st.cache_data
-@st.cache_data
-def load_ecodetection_data():
-    # Load the EcoDetection data from the correct CSV path
-    return pd.read_csv(Path(__file__).parent.parent / 'data' / "ecodetection_clean_data.csv")
+# Load the normalized EcoDetection data (datetime timestamps, ppb already converted to mg/L),
+# partitioned by site and measurement with sorted timestamps
+with span("load"):
+    store = canonical_store()
 
-# Load the data
-ecodetection_data = load_ecodetection_data()
-
-# Convert the 'timestamp' column to proper datetime format
-ecodetection_data['timestamp'] = pd.to_datetime(ecodetection_data['timestamp'], origin='1899-12-30', unit='D')
-
-# Filter the data based on the selected site
-site_data_eco = ecodetection_data[ecodetection_data["location"] == selected_site]
-
-# Convert units (e.g., ppb to mg/L if necessary) and process data as needed
-site_data_eco["result_mg_L"] = site_data_eco.apply(
-    lambda row: row["result"] * 0.001 if row["unit"] == "ppb" else row["result"], axis=1
-)
-
-# Get the minimum and maximum dates from the filtered dataset
-min_date = site_data_eco['timestamp'].min().to_pydatetime()  # Convert to datetime
-max_date = site_data_eco['timestamp'].max().to_pydatetime()  # Convert to datetime
+    # Get the minimum and maximum dates for the selected site
+    min_date, max_date = store.time_bounds("ecodetection", selected_site)
+min_date = min_date.to_pydatetime()  # Convert to datetime
+max_date = max_date.to_pydatetime()  # Convert to datetime
 
 # Move the date range slider to the left-hand sidebar
 st.sidebar.markdown("### Select Date Range to Zoom In")
 selected_dates = st.sidebar.slider("Date Range", min_value=min_date, max_value=max_date, value=(min_date, max_date), format="YYYY-MM-DD")
 
-# Filter the data based on the selected date range
-site_data_eco_filtered = site_data_eco[(site_data_eco['timestamp'] >= selected_dates[0]) & (site_data_eco['timestamp'] <= selected_dates[1])]
+# Slice the selected date range from the wide view (ranges with too many readings are served as the min and max
+# of hourly/daily/monthly rollups) and downsample each measurement for its chart; shared by every session viewing
+# the same range
+@cached_view
+def load_chart_data(site, start, end):
+    wide = wide_query(site, start, end)
+    # Min/max downsampling keeps every bucket's extremes, like the rollup min/max pairs
+    return {
+        measurement: downsample_columns(wide, "timestamp", [measurement], method="minmax", window=(start, end))
+        for measurement in wide.columns if measurement != "timestamp"
+    }
+
+# Long rows (timestamp, measurement, value) of some measurements, for plotly express
+def chart_rows(measurements):
+    frames = [chart_data[measurement] for measurement in measurements if measurement in chart_data]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["timestamp", "measurement", "value"])
+
+with span("filter"):
+    chart_data = load_chart_data(selected_site, selected_dates[0], selected_dates[1])
 
 # Group 1: Inorganic Chemicals
 st.subheader("Inorganic Chemicals")
-fig_inorganic = make_subplots(specs=[[{"secondary_y": True}]])
-
-# Plot Chloride on primary or secondary axis
-inorganic_chemicals = ["Chloride Concentration", "Fluoride Concentration", "Sulphate Concentration"]
-for chemical in inorganic_chemicals:
-    filtered_data = site_data_eco_filtered[site_data_eco_filtered["measurement"] == chemical]
-    
-    fig_inorganic.add_trace(
-        go.Scatter(x=filtered_data['timestamp'], y=filtered_data['result_mg_L'], name=chemical),
-        secondary_y=use_secondary_axis_chloride if chemical == "Chloride Concentration" else False
+with span("build figure"):
+    fig_inorganic = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Plot Chloride on primary or secondary axis
+    inorganic_chemicals = ["Chloride Concentration", "Fluoride Concentration", "Sulphate Concentration"]
+    for chemical in inorganic_chemicals:
+        if chemical not in chart_data:
+            continue
+
+        fig_inorganic.add_trace(
+            time_series_trace(chart_data[chemical], 'timestamp', 'value', window=selected_dates, name=chemical),
+            secondary_y=use_secondary_axis_chloride if chemical == "Chloride Concentration" else False
+        )
+
+    # Update layout for inorganic chemicals chart
+    fig_inorganic.update_layout(
+        title="Inorganic Chemicals Concentration",
+        xaxis_title="Date",
+        yaxis_title="Concentration (mg/L)",
+        yaxis2_title="Chloride Concentration (mg/L)" if use_secondary_axis_chloride else None,
+        legend_title="Measurements",
+        height=600,
     )
 
-# Update layout for inorganic chemicals chart
-fig_inorganic.update_layout(
-    title="Inorganic Chemicals Concentration",
-    xaxis_title="Date",
-    yaxis_title="Concentration (mg/L)",
-    yaxis2_title="Chloride Concentration (mg/L)" if use_secondary_axis_chloride else None,
-    legend_title="Measurements",
-    height=600,
-)
-
-st.plotly_chart(fig_inorganic)
+with span("render"):
+    st.plotly_chart(fig_inorganic)
 
 # Group 2: Nutrients
 st.subheader("Nutrients")
-fig_nutrients = px.line(
-    site_data_eco_filtered[site_data_eco_filtered["measurement"].isin(["Nitrate Concentration", "Nitrite Concentration", "Phosphate Concentration"])],
-    x="timestamp", y="result_mg_L", color="measurement",
-    title="Nutrient Concentrations",
-    labels={"result_mg_L": "Concentration (mg/L)", "timestamp": "Date"}
-)
-st.plotly_chart(fig_nutrients)
+with span("build figure"):
+    fig_nutrients = px.line(
+        chart_rows(["Nitrate Concentration", "Nitrite Concentration", "Phosphate Concentration"]),
+        x="timestamp", y="value", color="measurement",
+        title="Nutrient Concentrations",
+        labels={"value": "Concentration (mg/L)", "timestamp": "Date"}
+    )
+with span("render"):
+    st.plotly_chart(fig_nutrients)
 
 # Group 3: Physical Properties
 st.subheader("Physical Properties")
-fig_physical1 = make_subplots(specs=[[{"secondary_y": True}]])
-fig_physical2 = make_subplots(specs=[[{"secondary_y": True}]])
-
-# Plot Conductivity on primary or secondary axis
-physical_properties1 = ["Conductivity", "Nephelo Turbidity"]
-physical_properties2 = ["Oxygen", "pH"]
-
-for property in physical_properties1:
-    filtered_data = site_data_eco_filtered[site_data_eco_filtered["measurement"] == property]
-    
-    fig_physical1.add_trace(
-        go.Scatter(x=filtered_data['timestamp'], y=filtered_data['result_mg_L'], name=property),
-        secondary_y=use_secondary_axis_conductivity if property == "Conductivity" else False
+with span("build figure"):
+    fig_physical1 = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_physical2 = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Plot Conductivity on primary or secondary axis
+    physical_properties1 = ["Conductivity", "Nephelo Turbidity"]
+    physical_properties2 = ["Oxygen", "pH"]
+
+    for property in physical_properties1:
+        if property not in chart_data:
+            continue
+
+        fig_physical1.add_trace(
+            time_series_trace(chart_data[property], 'timestamp', 'value', window=selected_dates, name=property),
+            secondary_y=use_secondary_axis_conductivity if property == "Conductivity" else False
+        )
+
+    for property in physical_properties2:
+        if property not in chart_data:
+            continue
+
+        fig_physical2.add_trace(
+            time_series_trace(chart_data[property], 'timestamp', 'value', window=selected_dates, name=property),
+            secondary_y=use_secondary_axis_conductivity if property == "pH" else False
+        )
+
+    # Update layout for physical properties chart
+    fig_physical1.update_layout(
+        title="Physical Properties 1",
+        xaxis_title="Date",
+        yaxis_title="Nephelo Turbidity (NTU)",
+        yaxis2_title="Conductivity (μS/cm)",
+        legend_title="Measurements",
+        height=600,
     )
 
-for property in physical_properties2:
-    filtered_data = site_data_eco_filtered[site_data_eco_filtered["measurement"] == property]
-    
-    fig_physical2.add_trace(
-        go.Scatter(x=filtered_data['timestamp'], y=filtered_data['result_mg_L'], name=property),
-        secondary_y=use_secondary_axis_conductivity if property == "pH" else False
+    # Update layout for physical properties chart
+    fig_physical2.update_layout(
+        title="Physical Properties 2",
+        xaxis_title="Date",
+        yaxis_title="Oxygen (mg/L)",
+        yaxis2_title="pH",
+        legend_title="Measurements",
+        height=600,
     )
 
-# Update layout for physical properties chart
-fig_physical1.update_layout(
-    title="Physical Properties 1",
-    xaxis_title="Date",
-    yaxis_title="Nephelo Turbidity (NTU)",
-    yaxis2_title="Conductivity (μS/cm)",
-    legend_title="Measurements",
-    height=600,
-)
-
-# Update layout for physical properties chart
-fig_physical2.update_layout(
-    title="Physical Properties 2",
-    xaxis_title="Date",
-    yaxis_title="Oxygen (mg/L)",
-    yaxis2_title="pH",
-    legend_title="Measurements",
-    height=600,
-)
-
-# Adjust line colors for clarity on secondary axis
-fig_physical1.update_traces(line=dict(color='green'), selector=dict(secondary_y=False))
-fig_physical1.update_traces(line=dict(color='red'), selector=dict(secondary_y=True))
-
-st.plotly_chart(fig_physical1)
-st.plotly_chart(fig_physical2)
+    # Adjust line colors for clarity on secondary axis
+    fig_physical1.update_traces(line=dict(color='green'), selector=dict(secondary_y=False))
+    fig_physical1.update_traces(line=dict(color='red'), selector=dict(secondary_y=True))
+
+with span("render"):
+    st.plotly_chart(fig_physical1)
+    st.plotly_chart(fig_physical2)
 
 # Group 4: Environmental Data
 st.subheader("Environmental Data")
-fig_environmental = px.line(
-    site_data_eco_filtered[site_data_eco_filtered["measurement"].isin(["Enclosure Temperature", "Temperature"])],
-    x="timestamp", y="result_mg_L", color="measurement",
-    title="Environmental Data",
-    labels={"result_mg_L": "Temperature (°C)", "timestamp": "Date"}
-)
-st.plotly_chart(fig_environmental)
+with span("build figure"):
+    fig_environmental = px.line(
+        chart_rows(["Enclosure Temperature", "Temperature"]),
+        x="timestamp", y="value", color="measurement",
+        title="Environmental Data",
+        labels={"value": "Temperature (°C)", "timestamp": "Date"}
+    )
+with span("render"):
+    st.plotly_chart(fig_environmental)
 
 # Explanation of the comparison
 st.markdown("""
@@ -165,3 +179,5 @@ In the charts above, you can choose to move **Conductivity** and **Chloride Conc
 **Physical Properties** and **Inorganic Chemicals** charts for better comparison with other parameters. 
 Use the checkboxes in the sidebar to toggle between the two options. The color and legend will adjust accordingly.
 """)
+
+finish_trace()
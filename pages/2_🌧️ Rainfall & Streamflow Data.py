@@ -1,11 +1,19 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from pathlib import Path
+from dashboard.downsample import downsample
+from dashboard.hydrology import STORM_THRESHOLD, best_lags, load_lag_correlation, load_storm_events
+from dashboard.normalize import SITES, load_bom_series
+from dashboard.profiling import finish_trace, span, start_trace
+from dashboard.rollups import query
+from dashboard.stations import site_stations, station_name
+from dashboard.store import canonical_store
+from dashboard.viewcache import cached_view
 from datetime import timedelta
 
 # Set page title and icon
 st.set_page_config(page_title="Rainfall & Streamflow Data", page_icon="🌧️")
+start_trace("Rainfall & Streamflow Data")
 
 # Page title
 st.title("🌧️ Rainfall & Streamflow Data")
@@ -14,76 +22,62 @@ st.title("🌧️ Rainfall & Streamflow Data")
 st.sidebar.header("Site Selection")
 
 # Site options for selecting a location
-site_options = [
-    "Kangaroo Creek", 
-    "Little Coliban River", 
-    "Five Mile Creek - Woodend RWP Site 1", 
-    "Five Mile Creek - Woodend RWP Site 2"
-]
+site_options = SITES
 selected_site = st.sidebar.selectbox("Choose a site to view data", site_options)
 
 st.sidebar.success(f"Viewing data for: {selected_site}")
 
-# Define file paths for the streamflow data
-streamflow_file_paths = {
-    "Kangaroo Creek": "clean_wims_406281.csv",
-    "Little Coliban River": "clean_wims_406280.csv",
-    "Five Mile Creek - Woodend RWP Site 1": "clean_wims_406266.csv",
-    "Five Mile Creek - Woodend RWP Site 2": "clean_wims_406266.csv"
-}
-
-# Load rainfall data
-@st.cache_data
-def load_rainfall_data():
-    rainfall_path = Path(__file__).parent.parent / 'data' / "clean_bom_data.csv"
-    return pd.read_csv(rainfall_path, parse_dates=['date'], dayfirst=True)  # dayfirst=True for DD/MM/YYYY format
-
-# Load streamflow data from the correct CSV file
-@st.cache_data
-def load_streamflow_data(selected_file):
-    streamflow_path = Path(__file__).parent.parent / 'data' / selected_file
-    # Handle date format in streamflow data with dayfirst=True
-    return pd.read_csv(streamflow_path, parse_dates=['datetime'], dayfirst=True)
-
-# Mapping site names to station numbers for both rainfall and streamflow
-station_mapping = {
-    "Kangaroo Creek": {"rainfall_station": None, "streamflow_station": "406281"},
-    "Little Coliban River": {"rainfall_station": 88037, "streamflow_station": "406280"},
-    "Five Mile Creek - Woodend RWP Site 1": {"rainfall_station": 88061, "streamflow_station": "406266"},
-    "Five Mile Creek - Woodend RWP Site 2": {"rainfall_station": 88061, "streamflow_station": "406266"}
-}
-
-# Get the station numbers and corresponding file based on the selected site
-selected_rainfall_station = station_mapping[selected_site]["rainfall_station"]
-selected_streamflow_file = streamflow_file_paths[selected_site]
-
-# Load and filter rainfall data if available
-if selected_rainfall_station:
-    site_rainfall = load_rainfall_data()
-    site_rainfall = site_rainfall[site_rainfall["station_number"] == selected_rainfall_station]
-else:
-    site_rainfall = pd.DataFrame()
-
-# Load streamflow data for the selected site
-site_streamflow = load_streamflow_data(selected_streamflow_file)
-
-# Ensure all dates are in datetime format
-if not site_rainfall.empty:
-    site_rainfall['date'] = pd.to_datetime(site_rainfall['date'], dayfirst=True)
-
-if not site_streamflow.empty:
-    site_streamflow['datetime'] = pd.to_datetime(site_streamflow['datetime'], dayfirst=True)
+# Load rainfall for one BOM station, reading only that station's rows of the BOM file
+def load_rainfall_data(station, start=None, end=None):
+    return load_bom_series(station, "Rainfall", start, end)
+
+# Load normalized streamflow data for a WIMS station
+def load_streamflow_data(station):
+    return canonical_store().slice("wims", station, ["Streamflow"])
+
+# Chart rows of a station in the selected date range, downsampled; shared by every session viewing the same range
+@cached_view
+def load_rainfall_chart(station, start, end):
+    rainfall = load_rainfall_data(station, start, end)
+    return downsample(rainfall, "timestamp", "value", method="minmax", window=(start, end))
+
+@cached_view
+def load_streamflow_chart(station, start, end):
+    # Long ranges are served from hourly/daily/monthly rollups
+    streamflow = query("wims", station, start, end)
+    return downsample(streamflow, "timestamp", "value", method="minmax", window=(start, end))
+
+# Nearest rainfall and streamflow stations to the selected site, from the station registry
+nearest = site_stations(selected_site)
+selected_rainfall_station = nearest["rainfall"]
+selected_streamflow_station = nearest["streamflow"]
+for label, station in (("Rainfall", selected_rainfall_station), ("Streamflow", selected_streamflow_station)):
+    if station:
+        st.sidebar.caption(f"{label} station: {station_name(station)} ({station})")
+
+with span("load"):
+    # Load and filter rainfall data if available
+    if selected_rainfall_station:
+        site_rainfall = load_rainfall_data(selected_rainfall_station)
+    else:
+        site_rainfall = pd.DataFrame()
+
+    # Load streamflow data for the selected site if a station is nearby
+    if selected_streamflow_station:
+        site_streamflow = load_streamflow_data(selected_streamflow_station)
+    else:
+        site_streamflow = pd.DataFrame()
 
 # Determine the minimum and maximum dates for both datasets
 if not site_rainfall.empty:
-    min_date_rainfall = site_rainfall['date'].min().to_pydatetime()  # Convert to datetime
-    max_date_rainfall = site_rainfall['date'].max().to_pydatetime()  # Convert to datetime
+    min_date_rainfall = site_rainfall['timestamp'].iloc[0].to_pydatetime()  # Rows are sorted by time
+    max_date_rainfall = site_rainfall['timestamp'].iloc[-1].to_pydatetime()  # Rows are sorted by time
 else:
     min_date_rainfall, max_date_rainfall = None, None
 
 if not site_streamflow.empty:
-    min_date_streamflow = site_streamflow['datetime'].min().to_pydatetime()  # Convert to datetime
-    max_date_streamflow = site_streamflow['datetime'].max().to_pydatetime()  # Convert to datetime
+    min_date_streamflow = site_streamflow['timestamp'].iloc[0].to_pydatetime()  # Rows are sorted by time
+    max_date_streamflow = site_streamflow['timestamp'].iloc[-1].to_pydatetime()  # Rows are sorted by time
 else:
     min_date_streamflow, max_date_streamflow = None, None
 
@@ -119,46 +113,97 @@ if min_date and max_date:
 else:
     st.warning("No valid date range available for the selected site.")
 
-# Filter the rainfall data based on the selected date range
-if not site_rainfall.empty and 'date_range' in st.session_state:
-    site_rainfall_filtered = site_rainfall[
-        (site_rainfall['date'] >= st.session_state.date_range[0]) & (site_rainfall['date'] <= st.session_state.date_range[1])
-    ]
-else:
-    site_rainfall_filtered = pd.DataFrame()
+with span("filter"):
+    # Filter the rainfall data based on the selected date range (pushed down into the read)
+    if not site_rainfall.empty and 'date_range' in st.session_state:
+        site_rainfall_filtered = load_rainfall_chart(selected_rainfall_station, *st.session_state.date_range)
+    else:
+        site_rainfall_filtered = pd.DataFrame()
 
-# Filter the streamflow data based on the selected date range
-if not site_streamflow.empty and 'date_range' in st.session_state:
-    site_streamflow_filtered = site_streamflow[
-        (site_streamflow['datetime'] >= st.session_state.date_range[0]) & (site_streamflow['datetime'] <= st.session_state.date_range[1])
-    ]
-else:
-    site_streamflow_filtered = pd.DataFrame()
+    # Filter the streamflow data based on the selected date range
+    if not site_streamflow.empty and 'date_range' in st.session_state:
+        site_streamflow_filtered = load_streamflow_chart(selected_streamflow_station, *st.session_state.date_range)
+    else:
+        site_streamflow_filtered = pd.DataFrame()
 
 # Plot Rainfall Data (if available)
 if not site_rainfall_filtered.empty:
     st.subheader(f"Rainfall Data for {selected_site}")
-    fig_rainfall = px.line(
-        site_rainfall_filtered,
-        x="date",
-        y="rainfall",
-        title=f"Rainfall at {selected_site}",
-        labels={"rainfall": "Rainfall (mm)", "date": "Date"}
-    )
-    st.plotly_chart(fig_rainfall)
+    with span("build figure"):
+        fig_rainfall = px.line(
+            site_rainfall_filtered,
+            x="timestamp",
+            y="value",
+            title=f"Rainfall at {selected_site}",
+            labels={"value": "Rainfall (mm)", "timestamp": "Date"}
+        )
+    with span("render"):
+        st.plotly_chart(fig_rainfall)
 else:
     st.warning(f"No rainfall data available for {selected_site}. Please upload it to the uploads page.")
 
 # Plot Streamflow Data (if available)
 if not site_streamflow_filtered.empty:
     st.subheader(f"Streamflow Data for {selected_site}")
-    fig_streamflow = px.line(
-        site_streamflow_filtered,
-        x="datetime",
-        y="discharge_ml_day",
-        title=f"Streamflow at {selected_site}",
-        labels={"discharge_ml_day": "Streamflow (ML/day)", "datetime": "Date"}
-    )
-    st.plotly_chart(fig_streamflow)
+    with span("build figure"):
+        fig_streamflow = px.line(
+            site_streamflow_filtered,
+            x="timestamp",
+            y="value",
+            title=f"Streamflow at {selected_site}",
+            labels={"value": "Streamflow (ML/day)", "timestamp": "Date"}
+        )
+    with span("render"):
+        st.plotly_chart(fig_streamflow)
 else:
     st.warning(f"No streamflow data available for {selected_site}. Please upload it to the uploads page.")
+
+# Storm events at the rainfall station and how quickly streamflow responds to rain
+st.subheader("Storm Events & Streamflow Response")
+storm_threshold = st.slider("Storm threshold (mm/day)", 1, 50, STORM_THRESHOLD)
+
+if selected_rainfall_station:
+    with span("load"):
+        storms = load_storm_events(storm_threshold)
+    storms = storms[storms["site"] == selected_rainfall_station]
+    if 'date_range' in st.session_state and st.session_state.date_range:
+        start, end = st.session_state.date_range
+        storms = storms[(storms["end"] >= pd.Timestamp(start)) & (storms["start"] <= pd.Timestamp(end))]
+    st.write(f"{len(storms)} storm events above {storm_threshold} mm/day at {station_name(selected_rainfall_station)}.")
+    st.dataframe(
+        storms.drop(columns="site").sort_values("start", ascending=False),
+        hide_index=True,
+        column_config={"total_mm": "Total (mm)", "peak_mm": "Peak day (mm)"},
+    )
+
+    # Cross-correlation of daily rainfall with the streamflow 0..MAX_LAG_DAYS days later
+    with span("load"):
+        correlations = load_lag_correlation()
+    if selected_streamflow_station:
+        pair = correlations[
+            (correlations["rainfall_station"] == selected_rainfall_station)
+            & (correlations["streamflow_station"] == selected_streamflow_station)
+        ]
+        if pair["correlation"].notna().any():
+            best = pair.loc[pair["correlation"].idxmax()]
+            with span("build figure"):
+                fig_lag = px.bar(
+                    pair, x="lag_days", y="correlation",
+                    title=f"Rainfall to streamflow correlation by lag at {selected_site}",
+                    labels={"lag_days": "Lag (days)", "correlation": "Correlation"},
+                )
+            with span("render"):
+                st.plotly_chart(fig_lag)
+            st.caption(
+                f"Streamflow follows rainfall most closely after {int(best['lag_days'])} days "
+                f"(r = {best['correlation']:.2f} over {best['overlap_days']} days)."
+            )
+        else:
+            st.info("Not enough overlapping rainfall and streamflow days to estimate the response lag.")
+
+    with st.expander("Strongest response lag for every rainfall and streamflow station pair"):
+        st.dataframe(best_lags(correlations), hide_index=True)
+else:
+    st.info(f"No rainfall station near {selected_site}.")
+
+finish_trace()
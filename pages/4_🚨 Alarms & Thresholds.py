@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from pathlib import Path
+from dashboard.alarms import alarm_index
+from dashboard.events import count_events, current_inputs, evaluated_inputs, last_run, logged_rules, recent_events
+from dashboard.matching import DEFAULT_TOLERANCE, match_lab_samples
+from dashboard.normalize import PARAMETERS
+from dashboard.profiling import finish_trace, span, start_trace
+from dashboard.viewcache import cached_view
 
 # Set page title
 st.set_page_config(page_title="Alarms & Thresholds", page_icon="🚨")
+start_trace("Alarms & Thresholds")
 st.title("🚨 Alarms & Thresholds")
 
 st.markdown("""
@@ -25,6 +30,10 @@ with col2:
 # Add a threshold for matching Eco and Lab data
 eco_lab_threshold = st.slider("Set Threshold for Eco vs Lab Data Matching (%)", 0, 100, 5)
 
+# Sensor readings within this many hours of a lab sample (of midday, for samples with only a date) are averaged
+# and compared with it
+eco_lab_tolerance = st.slider("Set Eco vs Lab Matching Window (± hours)", 1, 72, int(DEFAULT_TOLERANCE / pd.Timedelta(hours=1)))
+
 # Add an example alarm button
 if st.button("Trigger Example Alarm"):
     st.markdown(
@@ -40,96 +49,114 @@ if st.button("Trigger Example Alarm"):
         """, unsafe_allow_html=True
     )
 
-# Load water quality, rainfall, and lab data
-@st.cache_data
-def load_alarm_data():
-    water_quality_data = pd.read_csv(Path(__file__).parent.parent / 'data' / "ecodetection_clean_data.csv")
-    rainfall_data = pd.read_csv(Path(__file__).parent.parent / 'data' / "clean_bom_data.csv")
-    lab_data = pd.read_excel(Path(__file__).parent.parent / 'data' / 'cw_catchment_sampling_filtered.xlsx')
-    return water_quality_data, rainfall_data, lab_data
-
-# Convert Excel serial date to datetime (and only keep the date)
-def excel_serial_date_to_datetime(excel_date):
-    return (datetime(1899, 12, 30) + timedelta(days=excel_date)).date()
-
-# Load data
-water_quality_data, rainfall_data, lab_data = load_alarm_data()
-
-# Convert 'timestamp' in water quality data (turbidity) to proper datetime format (yyyy-mm-dd) and rename the column to 'Date'
-water_quality_data['Date'] = water_quality_data['timestamp'].apply(excel_serial_date_to_datetime)
-water_quality_data.drop(columns=['timestamp'], inplace=True)
-
-# Convert rainfall 'date' column to proper datetime format (yyyy-mm-dd) and rename the column to 'Date'
-rainfall_data['Date'] = pd.to_datetime(rainfall_data['date'], errors='coerce').dt.date
-rainfall_data.drop(columns=['date'], inplace=True)
-
-# Convert lab data date format
-lab_data['Date'] = pd.to_datetime(lab_data['date_sampled'], errors='coerce').dt.date
-
-# Filter water quality data for turbidity
-turbidity_data = water_quality_data[water_quality_data['measurement'] == 'Nephelo Turbidity']
-
-# Sort both datasets by the most recent date (descending order)
-turbidity_data = turbidity_data.sort_values(by='Date', ascending=False)
-rainfall_data = rainfall_data.sort_values(by='Date', ascending=False)
-
-# Add a new column with the unit name in the column header (Value (NTU))
-turbidity_data['Value (NTU)'] = turbidity_data['result']
-rainfall_data['Rainfall (mm)'] = rainfall_data['rainfall']
-
-# Remove unnecessary columns
-turbidity_data.drop(columns=['unit', 'result', 'measurement'], inplace=True)
-rainfall_data.drop(columns=['rainfall'], inplace=True)
-
-# Check for turbidity values exceeding the threshold
-exceeded_turbidity = turbidity_data[turbidity_data['Value (NTU)'] > turbidity_threshold]
-
-# Filter rainfall data based on the threshold
-exceeded_rainfall = rainfall_data[rainfall_data['Rainfall (mm)'] > rainfall_threshold]
-
-# Filter lab data to exclude Five Mile Creek stations (assuming 'SITE2' is for Little Coliban and 'SITE17' for Kangaroo Creek)
-valid_lab_sites = ['Little Coliban River', 'Kangaroo Creek']
-lab_data_filtered = lab_data[lab_data['Subsite_Code'].isin(valid_lab_sites)]
+# Number of most recent exceedances listed per measure
+RECENT_ALARMS = 500
+
+# Rules evaluated by the background alarm worker (python alarm_worker.py); empty if it has never run, or has not
+# yet evaluated the data and uploads as they are now
+with span("load"):
+    worker_rules = logged_rules() if evaluated_inputs() == current_inputs() else {}
+
+# The event log holds every event above the worker's threshold, so any higher threshold can be read from it
+def served_by_worker(rule, threshold, **params):
+    logged = worker_rules.get(rule)
+    return (
+        logged is not None
+        and threshold >= logged['threshold']
+        and all(logged.get(name) == value for name, value in params.items())
+    )
 
-# Check for mismatches between EcoDetection and Lab data for turbidity
-turbidity_lab_data = lab_data_filtered[lab_data_filtered['Measure'] == 'Turbidity']
-merged_data = pd.merge(turbidity_data, turbidity_lab_data, on='Date', suffixes=('_eco', '_lab'))
+# Read counts and recent exceedances from the event log, or from the shared alarm indexes (binary searches)
+def exceedances(rule, source, measurement, threshold):
+    if served_by_worker(rule, threshold):
+        return count_events(rule, threshold), recent_events(rule, threshold, RECENT_ALARMS)
+    index = alarm_index(source, measurement)
+    return index.count_above(threshold), index.recent_above(threshold, RECENT_ALARMS)
 
-# Calculate the difference between Eco and Lab values
-merged_data['Difference (%)'] = abs(merged_data['Value (NTU)'] - merged_data['Result']) / merged_data['Result'] * 100
+with span("filter"):
+    turbidity_count, recent_turbidity = exceedances(
+        "turbidity", "ecodetection", PARAMETERS['Turbidity']['ecodetection'], turbidity_threshold
+    )
+    rainfall_count, recent_rainfall = exceedances("rainfall", "bom", "Rainfall", rainfall_threshold)
+
+# Keep only the date (yyyy-mm-dd), with the unit name in the value column header
+exceeded_turbidity = pd.DataFrame({
+    'Date': recent_turbidity['timestamp'].dt.normalize(),
+    'location': recent_turbidity['site'],
+    'Value (NTU)': recent_turbidity['value'],
+})
+exceeded_rainfall = pd.DataFrame({
+    'Date': recent_rainfall['timestamp'].dt.normalize(),
+    'station_number': recent_rainfall['site'],
+    'Rainfall (mm)': recent_rainfall['value'],
+})
+
+# Match each lab turbidity sample to the EcoDetection readings around it at the same site
+# (lab site codes are mapped to site names at ingest; Five Mile Creek has no lab data)
+@cached_view
+def load_turbidity_pairs(tolerance_hours):
+    valid_lab_sites = ['Little Coliban River', 'Kangaroo Creek']
+    matched = match_lab_samples('Turbidity', valid_lab_sites, pd.Timedelta(hours=tolerance_hours))
+    return pd.DataFrame({
+        'Date': matched['timestamp'].dt.normalize(),
+        'location': matched['site'],
+        'Value (NTU)': matched['eco_mean'],
+        'Readings': matched['eco_count'],
+        'Result': matched['lab_value'],
+        'Difference (%)': matched['difference_pct'],
+    }).sort_values(by='Date', ascending=False)
 
 # Find mismatches where the difference exceeds the eco_lab_threshold
-mismatched_data = merged_data[merged_data['Difference (%)'] > eco_lab_threshold]
+with span("filter"):
+    if served_by_worker("eco_lab", eco_lab_threshold, tolerance_hours=eco_lab_tolerance):
+        mismatch_count = count_events("eco_lab", eco_lab_threshold)
+        logged = recent_events("eco_lab", eco_lab_threshold, RECENT_ALARMS)
+        mismatched_data = pd.DataFrame({
+            'Date': logged['timestamp'].dt.normalize(),
+            'location': logged['site'],
+            'Value (NTU)': logged['observed'],
+            'Readings': logged['readings'],
+            'Result': logged['reference'],
+            'Difference (%)': logged['value'],
+        })
+    else:
+        merged_data = load_turbidity_pairs(eco_lab_tolerance)
+        mismatched_data = merged_data[merged_data['Difference (%)'] > eco_lab_threshold]
+        mismatch_count = len(mismatched_data)
 
 # Display alarms
 st.subheader("Alarms")
 
-if not exceeded_turbidity.empty:
-    st.warning(f"Turbidity has exceeded the threshold at {len(exceeded_turbidity)} occurrences!")
+if turbidity_count:
+    st.warning(f"Turbidity has exceeded the threshold at {turbidity_count} occurrences!")
 
-if not exceeded_rainfall.empty:
-    st.warning(f"Rainfall has exceeded the threshold at {len(exceeded_rainfall)} occurrences!")
+if rainfall_count:
+    st.warning(f"Rainfall has exceeded the threshold at {rainfall_count} occurrences!")
 
-if not mismatched_data.empty:
-    st.error(f"EcoDetection turbidity does not match lab data at {len(mismatched_data)} occurrences!")
+if mismatch_count:
+    st.error(f"EcoDetection turbidity does not match lab data at {mismatch_count} occurrences!")
 
-if exceeded_turbidity.empty and exceeded_rainfall.empty and mismatched_data.empty:
+if not turbidity_count and not rainfall_count and not mismatch_count:
     st.success("All parameters are within the defined thresholds.")
 
+if worker_rules:
+    st.caption(f"Alarms at or above the worker's thresholds are read from the alarm event log (last evaluated {last_run():%Y-%m-%d %H:%M} UTC).")
+
 # Display details if there are any alarms
 st.subheader("Recent Data Sorted by Most Recent")
 
-if not exceeded_turbidity.empty:
-    st.write("Turbidity exceedances:")
-    st.dataframe(exceeded_turbidity[['Date', 'location', 'Value (NTU)']])
+with span("render"):
+    if not exceeded_turbidity.empty:
+        st.write(f"Turbidity exceedances (most recent {len(exceeded_turbidity)} of {turbidity_count}):")
+        st.dataframe(exceeded_turbidity[['Date', 'location', 'Value (NTU)']])
 
-if not exceeded_rainfall.empty:
-    st.write("Rainfall exceedances:")
-    st.dataframe(exceeded_rainfall[['Date', 'station_number', 'Rainfall (mm)']])
+    if not exceeded_rainfall.empty:
+        st.write(f"Rainfall exceedances (most recent {len(exceeded_rainfall)} of {rainfall_count}):")
+        st.dataframe(exceeded_rainfall[['Date', 'station_number', 'Rainfall (mm)']])
 
-if not mismatched_data.empty:
-    st.write("Eco vs Lab Mismatches:")
-    st.dataframe(mismatched_data[['Date', 'location', 'Value (NTU)', 'Result', 'Difference (%)']])
+    if not mismatched_data.empty:
+        st.write("Eco vs Lab Mismatches:")
+        st.dataframe(mismatched_data[['Date', 'location', 'Value (NTU)', 'Readings', 'Result', 'Difference (%)']])
 
 # Show warning for missing lab data for Five Mile Creek sites
 selected_site = st.sidebar.selectbox(
@@ -139,3 +166,5 @@ selected_site = st.sidebar.selectbox(
 
 if "Five Mile Creek" in selected_site:
     st.warning(f"Lab data for {selected_site} is missing. Please upload the lab data on the uploads page.")
+
+finish_trace()
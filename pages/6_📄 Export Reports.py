@@ -1,12 +1,12 @@
 import streamlit as st
 import pandas as pd
-from io import BytesIO
-from datetime import datetime, timedelta
-import xlsxwriter  # Importing xlsxwriter for Excel export
-from pathlib import Path
+import time
+from dashboard.export import FORMATS, ExportFilter, available_options, start_export
+from dashboard.profiling import finish_trace, span, start_trace
 
 # Set page title
 st.set_page_config(page_title="Report Export", page_icon="📄")
+start_trace("Report Export")
 st.title("📄 Export Reports")
 
 st.markdown("""
@@ -14,105 +14,77 @@ This page allows you to export a report of recent data, including all available
 You can customize the report to include any combination of data types.
 """)
 
-# Load all available data
-@st.cache_data
-def load_all_data():
-    water_quality_data = pd.read_csv(Path(__file__).parent.parent / 'data' / "ecodetection_clean_data.csv")
-    rainfall_data = pd.read_csv(Path(__file__).parent.parent / 'data' / "clean_bom_data.csv")
-    lab_data = pd.read_csv(Path(__file__).parent.parent / 'data' / "cw_catchment_sampling.csv")  # Load the lab data
-    return water_quality_data, rainfall_data, lab_data
-
-# Convert Excel serial date to datetime
-def excel_serial_date_to_datetime(excel_date):
-    return (datetime(1899, 12, 30) + timedelta(days=excel_date)).date()
-
-# Load data
-water_quality_data, rainfall_data, lab_data = load_all_data()
-
-# Convert timestamps to proper date format
-water_quality_data['Date'] = water_quality_data['timestamp'].apply(excel_serial_date_to_datetime)
-rainfall_data['Date'] = pd.to_datetime(rainfall_data['date'], errors='coerce').dt.date
-
-# Process water quality data (all EcoDetection measurements)
-eco_detection_measurements = [
-    "Chloride Concentration", "Fluoride Concentration", "Nitrate Concentration", 
-    "Nitrite Concentration", "Phosphate Concentration", "Sulphate Concentration", 
-    "Enclosure Temperature", "Conductivity", "Nephelo Turbidity", "Oxygen", "pH", "Temperature"
-]
-
-# Filter and pivot the data for export
-water_quality_data_filtered = water_quality_data[water_quality_data['measurement'].isin(eco_detection_measurements)]
-water_quality_data_filtered = water_quality_data_filtered.pivot_table(index=['Date', 'location'], columns='measurement', values='result')
-
-# Process rainfall data
-rainfall_data['Rainfall (mm)'] = rainfall_data['rainfall']
-
-# Process lab data
-lab_data['Date'] = pd.to_datetime(lab_data['date_sampled'], errors='coerce').dt.date
-lab_data_filtered = lab_data[['Date', 'Subsite_Name', 'Measure', 'Result', 'Units']].sort_values(by='Date', ascending=False)
-
-# Sort the data by most recent date
-water_quality_data_filtered = water_quality_data_filtered.reset_index().sort_values(by='Date', ascending=False)
-rainfall_data = rainfall_data[['Date', 'station_number', 'Rainfall (mm)']].sort_values(by='Date', ascending=False)
-
 # Allow selection of all available data for export
 st.subheader("Customize Your Report")
 include_eco_detection = st.checkbox("Include EcoDetection Data (All Parameters)", value=True)
 include_rainfall = st.checkbox("Include Rainfall Data", value=True)
 include_lab_data = st.checkbox("Include Lab Data", value=True)
 
-# Combine the selected data
-def generate_report():
-    report_data_list = []
-    
-    if include_eco_detection:
-        report_data_list.append(water_quality_data_filtered)
-        
-    if include_rainfall:
-        report_data_list.append(rainfall_data)
-        
-    if include_lab_data:
-        report_data_list.append(lab_data_filtered)
-    
-    if report_data_list:
-        return pd.concat(report_data_list, keys=["EcoDetection", "Rainfall", "Lab"])
-    else:
-        return pd.DataFrame()
-
-report_data = generate_report()
-
-# Export as CSV
-def convert_df_to_csv(df):
-    return df.to_csv(index=False).encode('utf-8')
+# Sections of the report, in order (one Excel sheet each)
+sections = [
+    name for name, included in [
+        ("EcoDetection", include_eco_detection),
+        ("Rainfall", include_rainfall),
+        ("Lab", include_lab_data),
+    ] if included
+]
 
-# Export as Excel
-def convert_df_to_excel(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False)
-    processed_data = output.getvalue()
-    return processed_data
+# Narrow the export down; the filters are applied while the data is read
+if sections:
+    with span("load"):
+        site_options, measurement_options, first_date, last_date = available_options(sections)
+
+    st.subheader("Filter Your Report")
+    selected_sites = st.multiselect("Sites and stations (all if empty)", site_options)
+    selected_measurements = st.multiselect("Measurements (all if empty)", measurement_options)
+    if first_date is not None:
+        selected_range = st.date_input(
+            "Date range",
+            value=(first_date.date(), last_date.date()),
+            min_value=first_date.date(),
+            max_value=last_date.date()
+        )
+    else:
+        selected_range = ()
+
+    # Dates cover whole days; an unfinished range selection exports everything
+    start_date, end_date = (selected_range if len(selected_range) == 2 else (None, None))
+    export_filter = ExportFilter(
+        sites=tuple(selected_sites) or None,
+        measurements=tuple(selected_measurements) or None,
+        start=None if start_date is None else pd.Timestamp(start_date),
+        end=None if end_date is None else pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1),
+    )
 
-# Generate download buttons if report data is available
-if not report_data.empty:
+# The report is only generated when requested, in the background, one section at a time
+if sections:
     st.subheader("Download Your Report")
-    
-    # Export as CSV
-    csv_data = convert_df_to_csv(report_data)
-    st.download_button(
-        label="Download CSV",
-        data=csv_data,
-        file_name='report.csv',
-        mime='text/csv'
+    st.caption(
+        "CSV, Excel and zipped CSV contain the report tables (daily EcoDetection means). "
+        "Parquet and Arrow IPC contain every matching reading in long format and load quickly in pandas, R or DuckDB."
     )
 
-    # Export as Excel
-    excel_data = convert_df_to_excel(report_data)
-    st.download_button(
-        label="Download Excel",
-        data=excel_data,
-        file_name='report.xlsx',
-        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    export_format = st.selectbox("Format", list(FORMATS), format_func=lambda fmt: FORMATS[fmt][0])
+    if st.button("Prepare Report"):
+        st.session_state.export_job = start_export(export_format, sections, export_filter)
+
+    job = st.session_state.get("export_job")
+    if job is not None and (job.fmt, job.sections, job.filter) == (export_format, sections, export_filter):
+        if job.running:
+            st.progress(job.progress, text=f"Preparing {job.file_name}...")
+            time.sleep(0.5)
+            st.rerun()
+        elif job.error is not None:
+            st.error(f"Could not prepare {job.file_name}: {job.error}")
+        else:
+            with open(job.path, "rb") as file:
+                st.download_button(
+                    label=f"Download {job.file_name}",
+                    data=file,
+                    file_name=job.file_name,
+                    mime=job.mime
+                )
 else:
     st.warning("Please select at least one data type to include in the report.")
+
+finish_trace()
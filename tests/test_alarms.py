@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.alarms import AlarmIndex
+
+
+def _readings(n=5_000, seed=1):
+    rng = np.random.default_rng(seed)
+    # Rounded so that many readings tie, some exactly on the thresholds tested
+    values = rng.exponential(8, n).round(0)
+    values[rng.choice(n, 50, replace=False)] = np.nan
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=n, freq="15min")[rng.permutation(n)],
+        "site": "Kangaroo Creek",
+        "value": values,
+    })
+
+
+@pytest.mark.parametrize("threshold", [-1, 0, 5, 10, 10.5, 25, 1e9])
+def test_count_above_matches_a_brute_force_count(threshold):
+    rows = _readings()
+    assert AlarmIndex(rows).count_above(threshold) == int((rows["value"] > threshold).sum())
+
+
+@pytest.mark.parametrize("threshold, n", [(0, 10), (5, 500), (30, 20), (30, 5_000), (1e9, 10)])
+def test_recent_above_matches_a_brute_force_filter(threshold, n):
+    rows = _readings()
+    expected = rows[rows["value"] > threshold].sort_values("timestamp", ascending=False).head(n)
+    recent = AlarmIndex(rows).recent_above(threshold, n)
+    assert recent["timestamp"].tolist() == expected["timestamp"].tolist()
+    assert recent["value"].tolist() == expected["value"].tolist()
+
+
+def test_empty_index():
+    index = AlarmIndex(_readings().iloc[0:0])
+    assert index.count_above(0) == 0
+    assert index.recent_above(0, 10).empty
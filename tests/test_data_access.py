@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+import dashboard.data_access as data_access
+
+BOM = """date,station_number,rainfall,rain_period,rain_quality,max_temp,max_temp_days,min_temp,min_temp_days
+1/01/2010 0:00,088061,NA,NA,NA,NA,NA,NA,NA
+1/01/2010 0:00,088051,NA,NA,NA,30,1,NA,NA
+2/01/2010 0:00,088061,NA,NA,NA,NA,NA,NA,NA
+2/01/2010 0:00,088037,25,1,Y,NA,NA,NA,NA
+3/01/2010 0:00,088037,3.2,1,N,NA,NA,12,1
+3/01/2010 0:00,088051,0,1,Y,22.5,1,NA,NA
+"""
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_access, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(data_access, "CACHE_DIR", tmp_path / ".cache")
+    return tmp_path
+
+
+@pytest.mark.parametrize("chunk_rows", [3, 100_000])
+def test_chunked_bom_matches_a_single_read(data_dir, monkeypatch, chunk_rows):
+    # The first chunk has no quality codes and no rainfall at all
+    (data_dir / "clean_bom_data.csv").write_text(BOM)
+    monkeypatch.setattr(data_access, "CHUNK_ROWS", chunk_rows)
+
+    cached = pd.read_parquet(data_access.cached_parquet("bom"))
+    # Row groups follow the chunks, so compare in station and date order
+    cached = cached.astype({"station_number": "string"}).sort_values(["station_number", "date"], ignore_index=True)
+    assert cached["station_number"].tolist() == ["088037", "088037", "088051", "088051", "088061", "088061"]
+    assert cached["date"].dt.day.tolist() == [2, 3, 1, 3, 1, 2]
+    assert cached["rain_quality"].astype("string").tolist() == ["Y", "N", pd.NA, "Y", pd.NA, pd.NA]
+    assert cached["rainfall"].tolist() == pytest.approx([25, 3.2, float("nan"), 0, float("nan"), float("nan")], nan_ok=True)
+    assert cached["rain_quality"].cat.categories.tolist() == ["N", "Y"]
+
+
+def test_later_chunk_with_more_stations_than_the_first(data_dir, monkeypatch):
+    # One station in the first chunk, 200 in the second: their codes no longer fit the first chunk's int8 indices
+    stations = ["088037"] * 200 + [f"{i:06d}" for i in range(200)]
+    rows = "".join(f"1/01/2010 0:00,{station},1.0,1,Y,NA,NA,NA,NA\n" for station in stations)
+    (data_dir / "clean_bom_data.csv").write_text(BOM.splitlines()[0] + "\n" + rows)
+    monkeypatch.setattr(data_access, "CHUNK_ROWS", 200)
+
+    cached = pd.read_parquet(data_access.cached_parquet("bom"))
+    assert sorted(cached["station_number"].astype("string")) == sorted(stations)
+    assert len(cached["station_number"].cat.categories) == 201
+
+
+def test_read_source_does_not_keep_a_shared_frame(data_dir, monkeypatch):
+    (data_dir / "clean_bom_data.csv").write_text(BOM)
+
+    def shared(path, mtime_ns):
+        raise AssertionError("read through the shared frames")
+
+    monkeypatch.setattr(data_access, "_load_parquet", shared)
+    assert len(data_access.read_source("bom")) == 6
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.downsample import downsample, lttb_indices, minmax_indices
+
+
+def _spiky(n=20_000, seed=0):
+    values = np.random.default_rng(seed).normal(5, 1, n)
+    values[7_321] = 900.0
+    values[12_345] = -400.0
+    return values
+
+
+def test_lttb_keeps_the_spikes_and_end_points():
+    values = _spiky()
+    indices = lttb_indices(np.arange(len(values), dtype="float64"), values, 500)
+    assert len(indices) == 500
+    assert np.all(np.diff(indices) > 0)
+    assert {0, 7_321, 12_345, len(values) - 1} <= set(indices)
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    values = _spiky()
+    n_out = 500
+    indices = minmax_indices(values, n_out)
+    assert len(indices) <= n_out
+    assert {0, 7_321, 12_345, len(values) - 1} <= set(indices)
+
+    n_buckets = (n_out - 2) // 2
+    bucket = np.arange(len(values)) * n_buckets // len(values)
+    kept = pd.Series(values[indices]).groupby(bucket[indices])
+    whole = pd.Series(values).groupby(bucket)
+    assert np.array_equal(kept.max(), whole.max())
+    assert np.array_equal(kept.min(), whole.min())
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_stays_within_the_budget_and_keeps_the_peak(method):
+    values = _spiky()
+    df = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=len(values), freq="15min"), "value": values})
+    reduced = downsample(df, "timestamp", "value", max_points=300, method=method)
+    assert len(reduced) <= 300
+    assert reduced["timestamp"].is_monotonic_increasing
+    assert reduced["value"].max() == values.max()
+    assert reduced["value"].min() == values.min()
+
+
+def test_downsample_leaves_short_series_alone():
+    df = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=50, freq="h"), "value": np.arange(50.0)})
+    assert downsample(df, "timestamp", "value", max_points=100).equals(df)
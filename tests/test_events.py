@@ -0,0 +1,91 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.alarms import AlarmIndex
+from dashboard.events import connect, count_events, recent_events, set_rules
+from dashboard.worker import log_threshold_events
+
+RULE = "turbidity"
+PARAMS = {"source": "ecodetection", "measurement": "Nephelo Turbidity", "threshold": 10}
+
+
+def _rows(timestamps, values):
+    return pd.DataFrame({
+        "source": "ecodetection",
+        "site": "Kangaroo Creek",
+        "measurement": "Nephelo Turbidity",
+        "timestamp": pd.DatetimeIndex(timestamps),
+        "value": np.asarray(values, dtype="float64"),
+    })
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "alarm_events.sqlite"
+    conn = connect(path)
+    set_rules(conn, {RULE: PARAMS})
+    yield conn, path
+    conn.close()
+
+
+@pytest.fixture
+def readings():
+    timestamps = pd.date_range("2023-09-01", "2023-09-08", freq="15min", inclusive="left")
+    values = np.random.default_rng(6).exponential(6, len(timestamps))
+    # Every midnight reading exceeds the threshold
+    values[timestamps == timestamps.normalize()] = 30.0
+    return _rows(timestamps, values)
+
+
+def _merged(*batches):
+    # Later batches win on equal timestamps, as in the stores
+    return pd.concat(batches, ignore_index=True).drop_duplicates(subset="timestamp", keep="last")
+
+
+def test_full_evaluation_matches_the_alarm_index(log, readings):
+    conn, path = log
+    added = log_threshold_events(conn, RULE, PARAMS, readings, full=True)
+    expected = AlarmIndex(readings).count_above(PARAMS["threshold"])
+    assert added == expected == count_events(RULE, PARAMS["threshold"], path)
+
+    # The same readings again add nothing
+    assert log_threshold_events(conn, RULE, PARAMS, readings, full=True) == 0
+    assert log_threshold_events(conn, RULE, PARAMS, readings) == 0
+    assert count_events(RULE, PARAMS["threshold"], path) == expected
+
+
+@pytest.mark.parametrize("with_daytime_reading", [False, True])
+def test_corrections_update_and_remove_events(log, readings, with_daytime_reading):
+    conn, path = log
+    log_threshold_events(conn, RULE, PARAMS, readings, full=True)
+
+    # A batch of midnight readings only (stored keys must not depend on the batch), optionally with one at 09:15
+    midnights = pd.date_range("2023-09-02", "2023-09-05", freq="D")
+    timestamps = list(midnights) + ([pd.Timestamp("2023-09-06 09:15")] if with_daytime_reading else [])
+    values = [1.0, 999.0, 1.0, 10.0] + ([50.0] if with_daytime_reading else [])
+    correction = _rows(timestamps, values)
+    log_threshold_events(conn, RULE, PARAMS, correction)
+
+    merged = _merged(readings, correction)
+    assert count_events(RULE, PARAMS["threshold"], path) == AlarmIndex(merged).count_above(PARAMS["threshold"])
+
+    logged = recent_events(RULE, PARAMS["threshold"], 10_000, path).set_index("timestamp")["value"]
+    assert logged.index.is_unique
+    assert logged[pd.Timestamp("2023-09-03")] == 999.0
+    assert pd.Timestamp("2023-09-02") not in logged.index
+    assert pd.Timestamp("2023-09-05") not in logged.index
+
+    # One row per reading in the file itself
+    stored = sqlite3.connect(path).execute("SELECT COUNT(*), COUNT(DISTINCT timestamp) FROM events").fetchone()
+    assert stored[0] == stored[1]
+
+
+def test_full_evaluation_removes_events_of_vanished_readings(log, readings):
+    conn, path = log
+    log_threshold_events(conn, RULE, PARAMS, readings, full=True)
+    fewer = readings[readings["timestamp"] >= "2023-09-04"]
+    log_threshold_events(conn, RULE, PARAMS, fewer, full=True)
+    assert count_events(RULE, PARAMS["threshold"], path) == AlarmIndex(fewer).count_above(PARAMS["threshold"])
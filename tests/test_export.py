@@ -0,0 +1,127 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import dashboard.export as export
+from dashboard.export import ExportFilter, write_arrow, write_csv, write_excel, write_parquet, write_zip
+from dashboard.normalize import CANONICAL_COLUMNS
+from dashboard.rollups import aggregate
+from dashboard.schema import CANONICAL_SCHEMA, compact
+from dashboard.store import SeriesStore
+from dashboard.wide import WideView, pivot_wide
+
+SECTIONS = ["EcoDetection", "Rainfall", "Lab"]
+FILTERS = [
+    ExportFilter(),
+    ExportFilter(sites=("Kangaroo Creek", "088037"), start=pd.Timestamp("2024-01-05"), end=pd.Timestamp("2024-01-12 23:59")),
+    # No lab measurement: an empty section
+    ExportFilter(measurements=("pH", "Rainfall")),
+]
+
+
+def _series(source, site, measurement, unit, timestamps, rng):
+    return pd.DataFrame({
+        "source": source, "site": site, "measurement": measurement, "parameter": measurement,
+        "timestamp": timestamps, "value": rng.normal(5, 1, len(timestamps)), "unit": unit,
+    })
+
+
+@pytest.fixture(scope="module")
+def canonical():
+    rng = np.random.default_rng(12)
+    frames = []
+    for site in ["Kangaroo Creek", "Little Coliban River"]:
+        for measurement, unit in [("Nephelo Turbidity", "NTU"), ("pH", "pH")]:
+            timestamps = pd.date_range("2024-01-01", "2024-01-20", freq="15min")
+            frames.append(_series("ecodetection", site, measurement, unit, timestamps[rng.random(len(timestamps)) > 0.3], rng))
+        frames.append(_series("lab", site, "Colour", "Pt/Co units", pd.date_range("2024-01-02", periods=6, freq="3D"), rng))
+    for station in ["088037", "088051"]:
+        frames.append(_series("bom", station, "Rainfall", "mm", pd.date_range("2024-01-01 09:00", periods=20, freq="D"), rng))
+    df = pd.concat(frames, ignore_index=True)
+    return compact(df.assign(outlier=False), CANONICAL_SCHEMA)
+
+
+@pytest.fixture(scope="module")
+def stores(canonical):
+    daily = aggregate(canonical[canonical["source"] == "ecodetection"], "daily")
+    return SeriesStore(canonical), SeriesStore(daily), WideView(pivot_wide(daily))
+
+
+def _matching(canonical, source, flt):
+    # Canonical rows of one source passing `flt`, by boolean mask
+    mask = canonical["source"] == source
+    if flt.sites is not None:
+        mask &= canonical["site"].isin(flt.sites)
+    if flt.measurements is not None:
+        mask &= canonical["measurement"].isin(flt.measurements)
+    if flt.start is not None:
+        mask &= canonical["timestamp"] >= flt.start
+    if flt.end is not None:
+        mask &= canonical["timestamp"] <= flt.end
+    return canonical[mask]
+
+
+def _expected_shapes(canonical, flt):
+    # Section -> (rows, columns) of its report table
+    eco = _matching(canonical, "ecodetection", flt)
+    days = eco.assign(day=eco["timestamp"].dt.floor("D"))[["site", "day"]].drop_duplicates()
+    return {
+        # One row per site and day, a column per measurement after Date and location
+        "EcoDetection": (len(days), 2 + eco["measurement"].nunique()),
+        "Rainfall": (len(_matching(canonical, "bom", flt)), 3),
+        "Lab": (len(_matching(canonical, "lab", flt)), 5),
+    }
+
+
+@pytest.mark.parametrize("flt", FILTERS)
+def test_csv_and_zip(tmp_path, canonical, stores, flt):
+    shapes = _expected_shapes(canonical, flt)
+
+    write_csv(tmp_path / "report.csv", SECTIONS, *stores, flt)
+    report = pd.read_csv(tmp_path / "report.csv")
+    assert len(report) == sum(rows for rows, _ in shapes.values())
+    # Columns are the union of the sections' columns; Date is shared by all three
+    assert len(report.columns) == sum(columns for _, columns in shapes.values()) - 2
+
+    write_zip(tmp_path / "report.zip", SECTIONS, *stores, flt)
+    with zipfile.ZipFile(tmp_path / "report.zip") as archive:
+        assert archive.namelist() == [f"{name}.csv" for name in SECTIONS]
+        for name in SECTIONS:
+            with archive.open(f"{name}.csv") as member:
+                assert pd.read_csv(member).shape == shapes[name]
+
+
+@pytest.mark.parametrize("flt", FILTERS)
+def test_excel_sheets_split_at_the_row_limit(tmp_path, monkeypatch, canonical, stores, flt):
+    shapes = _expected_shapes(canonical, flt)
+    monkeypatch.setattr(export, "EXCEL_MAX_ROWS", 21)
+    monkeypatch.setattr(export, "CHUNK_ROWS", 40)
+
+    write_excel(tmp_path / "report.xlsx", SECTIONS, *stores, flt)
+    sheets = pd.read_excel(tmp_path / "report.xlsx", sheet_name=None)
+    for name in SECTIONS:
+        rows, columns = shapes[name]
+        parts = [sheet for sheet_name, sheet in sheets.items() if sheet_name == name or sheet_name.startswith(f"{name} (")]
+        # 20 data rows per sheet, and a sheet with just the header for an empty section
+        assert len(parts) == max(1, -(-rows // 20))
+        assert sum(len(part) for part in parts) == rows
+        assert all(part.shape[1] == columns for part in parts)
+
+
+@pytest.mark.parametrize("flt", FILTERS)
+def test_columnar_formats_hold_every_matching_reading(tmp_path, canonical, stores, flt):
+    expected = sum(len(_matching(canonical, source, flt)) for source in ["ecodetection", "bom", "lab"])
+    columns = CANONICAL_COLUMNS + ["outlier"]
+
+    write_parquet(tmp_path / "report.parquet", SECTIONS, *stores, flt)
+    table = pq.read_table(tmp_path / "report.parquet")
+    assert (table.num_rows, table.column_names) == (expected, columns)
+
+    write_arrow(tmp_path / "report.arrow", SECTIONS, *stores, flt)
+    with pa.ipc.open_file(tmp_path / "report.arrow") as reader:
+        table = reader.read_all()
+    assert (table.num_rows, table.column_names) == (expected, columns)
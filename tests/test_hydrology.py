@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.hydrology import best_lags, lag_correlation, storm_events
+
+
+def _daily(site, start, values):
+    return pd.DataFrame({"site": site, "timestamp": pd.date_range(start, periods=len(values), freq="D"), "value": values})
+
+
+def test_storm_runs_end_at_dry_days_missing_days_and_the_next_station():
+    first = _daily("088037", "2024-01-01", [0, 12, 15, 0, 11, 30, 14])
+    # 2024-01-05 is missing, so the 11 mm day after it starts a new run
+    first = first[first["timestamp"] != "2024-01-05"]
+    second = _daily("088043", "2024-01-08", [20, 25, 0])
+    # Rows out of order, as uploads can leave them
+    rainfall = pd.concat([second, first]).sample(frac=1, random_state=3)
+
+    storms = storm_events(rainfall, threshold=10)
+    assert storms["site"].tolist() == ["088037", "088037", "088043"]
+    assert storms["start"].tolist() == pd.to_datetime(["2024-01-02", "2024-01-06", "2024-01-08"]).tolist()
+    assert storms["end"].tolist() == pd.to_datetime(["2024-01-03", "2024-01-07", "2024-01-09"]).tolist()
+    assert storms["days"].tolist() == [2, 2, 2]
+    assert storms["total_mm"].tolist() == [27, 44, 45]
+    assert storms["peak_mm"].tolist() == [15, 30, 25]
+
+
+def test_no_storms():
+    storms = storm_events(_daily("088037", "2024-01-01", [0, 1, 2]), threshold=10)
+    assert storms.empty
+
+
+def test_lag_of_a_delayed_copy():
+    rain = np.random.default_rng(4).exponential(5, 400)
+    rainfall = _daily("088037", "2023-01-01", rain)
+    # Streamflow follows rainfall 3 days later
+    streamflow = _daily("406280", "2023-01-04", 50 + 2 * rain)
+
+    correlations = lag_correlation(rainfall, streamflow, max_lag=7)
+    assert len(correlations) == 8
+    best = best_lags(correlations).iloc[0]
+    assert best["lag_days"] == 3
+    assert best["correlation"] == pytest.approx(1.0)
+    assert best["overlap_days"] == 400
+
+
+def test_lag_skips_missing_days_and_short_overlaps():
+    rain = np.random.default_rng(5).exponential(5, 200)
+    rainfall = _daily("088037", "2023-01-01", rain)
+    streamflow = _daily("406280", "2023-01-02", 10 + rain).iloc[::2]
+    correlations = lag_correlation(rainfall, streamflow, max_lag=3)
+    # Each series is standardized over all its days, so the overlap's correlation is close to, not exactly, 1
+    best = best_lags(correlations).iloc[0]
+    assert best["lag_days"] == 1
+    assert best["correlation"] == pytest.approx(1.0, abs=1e-3)
+    assert best["overlap_days"] == 100
+
+    short = lag_correlation(rainfall.head(20), streamflow.head(10), max_lag=3)
+    assert short["correlation"].isna().all()
@@ -0,0 +1,86 @@
+import io
+
+import pandas as pd
+import pytest
+
+import dashboard.ingest as ingest
+from dashboard.ingest import detect_schema, ingest_upload
+
+
+@pytest.fixture(autouse=True)
+def ingest_dir(tmp_path, monkeypatch):
+    # Batches go to a scratch directory instead of data/ingested
+    monkeypatch.setattr(ingest, "INGEST_DIR", tmp_path)
+    return tmp_path
+
+
+def _csv(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+@pytest.mark.parametrize("columns, schema", [
+    (["timestamp", "location", "measurement", "unit", "result"], "ecodetection"),
+    (["\ufeffdate", "station_number", "rainfall", "rain_quality"], "bom"),
+    ([" datetime ", "discharge_ml_day"], "wims"),
+    (["Subsite_Code", "date_sampled", "Measure", "Result", "Units", "Sample_No"], "lab"),
+    (["date", "station_number"], None),
+    (["a", "b"], None),
+])
+def test_detect_schema(columns, schema):
+    assert detect_schema(columns) == schema
+
+
+def test_unknown_layout_is_rejected(ingest_dir):
+    [result] = ingest_upload(_csv(pd.DataFrame({"a": [1], "b": [2]})), "notes.csv")
+    assert result.schema is None and result.batch is None
+    assert "does not look like" in result.error
+    assert not any(ingest_dir.rglob("*.parquet"))
+
+
+def test_wims_upload_without_a_station_is_rejected():
+    [result] = ingest_upload(_csv(pd.DataFrame({"datetime": ["01/02/2024 09:00"], "discharge_ml_day": [3.5]})), "flow.csv")
+    assert result.schema == "wims" and result.batch is None
+    assert "WIMS station" in result.error
+
+
+def test_upload_without_usable_rows_is_an_error_not_a_duplicate(ingest_dir):
+    # ISO timestamps where Excel serial days are expected: every row is dropped
+    eco = pd.DataFrame({
+        "timestamp": ["2024-02-01T09:00:00", "2024-02-01T09:15:00"],
+        "location": "Kangaroo Creek", "measurement": "Nephelo Turbidity", "unit": "NTU", "result": [1.0, 2.0],
+    })
+    [result] = ingest_upload(_csv(eco), "eco.csv")
+    assert result.schema == "ecodetection"
+    assert result.rows == 0 and result.batch is None
+    assert "none of its 2 rows" in result.error
+    assert not any(ingest_dir.rglob("*.parquet"))
+
+
+def test_minimal_bom_upload_and_duplicate(ingest_dir):
+    bom = pd.DataFrame({"date": ["01/02/2024 09:00", "02/02/2024 09:00"], "station_number": ["088037"] * 2, "rainfall": [1.2, 0.0]})
+    [first] = ingest_upload(_csv(bom), "bom.csv")
+    assert first.error is None and first.batch is not None
+    assert first.rows == 2
+    assert first.partitions == [("088037", "Rainfall")]
+
+    # The same data again is recognised as already ingested
+    [again] = ingest_upload(_csv(bom), "bom.csv")
+    assert again.error is None and again.batch is None
+    assert len(list((ingest_dir / "bom").glob("*.parquet"))) == 1
+
+
+def test_workbook_sheets_are_ingested_independently(ingest_dir):
+    bom = pd.DataFrame({"date": ["01/02/2024 09:00"], "station_number": ["088037"], "rainfall": [4.2]})
+    flow = pd.DataFrame({"datetime": ["01/02/2024 09:00"], "discharge_ml_day": [3.5]})
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        bom.to_excel(writer, sheet_name="rain", index=False)
+        pd.DataFrame({"a": [1]}).to_excel(writer, sheet_name="notes", index=False)
+        flow.to_excel(writer, sheet_name="406280", index=False)
+
+    # An unrecognised sheet in the middle does not stop the sheets after it; the extension is matched in any case
+    results = ingest_upload(buffer.getvalue(), "DROP.XLSX")
+    assert [result.name for result in results] == ["DROP.XLSX (rain)", "DROP.XLSX (notes)", "DROP.XLSX (406280)"]
+    assert [result.error is None for result in results] == [True, False, True]
+    assert results[2].partitions == [("406280", "Streamflow")]
+    assert len(list(ingest_dir.rglob("*.parquet"))) == 2
@@ -0,0 +1,12 @@
+import json
+import re
+
+from dashboard.maps import station_map_html
+
+
+def test_alarm_colours_cannot_end_the_script():
+    colors = {"Kangaroo Creek": "orange", "</script><script>alert(1)//": "red"}
+    html = station_map_html(alarm_colors=colors)
+    assert "</script><script>alert" not in html
+    # The browser still reads the same colours
+    assert json.loads(re.search(r"var colors = (.*);", html).group(1)) == colors
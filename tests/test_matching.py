@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.matching import match_window
+
+TOLERANCE = pd.Timedelta(hours=12)
+
+
+@pytest.fixture
+def eco():
+    timestamps = pd.date_range("2024-01-01", "2024-01-10", freq="15min")
+    values = np.random.default_rng(2).normal(5, 2, len(timestamps))
+    return pd.DataFrame({"timestamp": timestamps, "value": values})
+
+
+def _lab(*timestamps):
+    return pd.DataFrame({"timestamp": pd.to_datetime(list(timestamps)), "value": 5.0})
+
+
+def test_window_of_a_timed_sample_matches_a_direct_slice(eco):
+    matched = match_window(eco, _lab("2024-01-03 09:40", "2024-01-05 16:00"), TOLERANCE)
+    for sample, row in zip(pd.to_datetime(["2024-01-03 09:40", "2024-01-05 16:00"]), matched.itertuples()):
+        window = eco[(eco["timestamp"] >= sample - TOLERANCE) & (eco["timestamp"] <= sample + TOLERANCE)]["value"]
+        assert row.eco_count == len(window)
+        assert row.eco_mean == pytest.approx(window.mean())
+        assert row.eco_min == window.min() and row.eco_max == window.max()
+
+
+def test_window_of_a_date_only_sample_is_its_calendar_day(eco):
+    matched = match_window(eco, _lab("2024-01-04 00:00"), TOLERANCE)
+    day = eco[(eco["timestamp"] >= "2024-01-04") & (eco["timestamp"] < "2024-01-05")]["value"]
+    assert matched["eco_count"].iloc[0] == len(day) == 96
+    assert matched["eco_mean"].iloc[0] == pytest.approx(day.mean())
+    assert matched["timestamp"].iloc[0] == pd.Timestamp("2024-01-04")
+
+
+def test_sample_without_readings_has_no_aggregates(eco):
+    matched = match_window(eco, _lab("2024-02-01 12:00"), TOLERANCE)
+    assert matched["eco_count"].iloc[0] == 0
+    assert matched[["eco_mean", "eco_min", "eco_max", "eco_nearest"]].isna().all(axis=None)
+
+
+def test_rows_follow_the_sample_order(eco):
+    samples = ["2024-01-02 00:00", "2024-01-02 09:30", "2024-01-06 03:15"]
+    matched = match_window(eco, _lab(*samples), TOLERANCE)
+    assert matched["timestamp"].tolist() == pd.to_datetime(samples).tolist()
+    # The nearest reading to a date-only sample is the one at midday
+    assert matched["eco_nearest"].iloc[0] == eco.set_index("timestamp").loc["2024-01-02 12:00", "value"]
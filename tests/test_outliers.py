@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.outliers import HISTORY, flag_outliers, flag_series, update_flags
+from dashboard.schema import CANONICAL_SCHEMA, compact
+from dashboard.store import SeriesStore
+
+
+def _series(n=6_000, seed=9, start="2024-01-01", source="ecodetection"):
+    rng = np.random.default_rng(seed)
+    values = 5 + np.sin(np.arange(n) / 96) + rng.normal(0, 0.3, n)
+    # Sensor spikes, and a flat stretch where the MAD is 0
+    values[rng.choice(n, 60, replace=False)] += rng.choice([-1, 1], 60) * rng.uniform(5, 40, 60)
+    values[1_500:2_300] = 4.0
+    return pd.DataFrame({
+        "source": source,
+        "site": "Kangaroo Creek",
+        "measurement": "Nephelo Turbidity",
+        "timestamp": pd.date_range(start, periods=n, freq="15min"),
+        "value": values,
+    })
+
+
+@pytest.mark.parametrize("first_new", [0, 50, 700, HISTORY, 2_000, 5_990])
+def test_update_flags_matches_a_full_recompute(first_new):
+    partition = _series()
+    expected = flag_series(partition["value"])
+    assert expected.sum() > 0
+
+    # Flags are known up to first_new; later readings (here the tail) are new
+    known = flag_series(partition["value"].iloc[:first_new]).to_numpy()
+    partition = partition.assign(outlier=pd.Series(list(known) + [None] * (len(partition) - first_new), dtype="boolean"))
+    updated = update_flags(partition, first_new)
+    assert updated["outlier"].dtype == bool
+    assert updated["outlier"].tolist() == expected.tolist()
+
+
+def test_merged_corrections_match_flags_of_the_whole_table():
+    table = _series()
+    table = compact(table.assign(outlier=flag_outliers(table)), CANONICAL_SCHEMA)
+    store = SeriesStore(table)
+
+    # A correction in the middle that is a spike, and a day of new readings with one more
+    correction = table.iloc[[3_000]][["source", "site", "measurement", "timestamp"]].assign(value=60.0)
+    new = table.tail(96)[["source", "site", "measurement", "timestamp", "value"]].reset_index(drop=True)
+    new = new.assign(timestamp=new["timestamp"] + pd.Timedelta(days=1), value=np.r_[np.full(50, 5.0), 45.0, np.full(45, 5.2)])
+    store.merge(compact(pd.concat([correction, new], ignore_index=True), CANONICAL_SCHEMA))
+
+    merged = pd.concat([table.drop(columns="outlier"), new], ignore_index=True)
+    merged.loc[3_000, "value"] = 60.0
+    expected = flag_outliers(merged)
+    partition = store.partition(("ecodetection", "Kangaroo Creek", "Nephelo Turbidity"))
+    assert partition["value"].tolist() == merged["value"].tolist()
+    assert partition["outlier"].tolist() == expected.tolist()
+    assert partition["outlier"].iloc[3_000] and partition["outlier"].iloc[6_050]
+
+
+def test_sources_without_a_detector_are_never_flagged():
+    partition = _series(source="bom").assign(outlier=pd.Series([None] * 6_000, dtype="boolean"))
+    assert not update_flags(partition, 0)["outlier"].any()
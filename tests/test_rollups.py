@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.rollups import LEVELS, MIN_POINTS, RAW_POINT_BUDGET, aggregate, envelope, plan_resolution
+
+# pandas resample rule of each level
+RULES = {"hourly": "h", "daily": "D", "monthly": "MS"}
+
+
+def _readings():
+    rng = np.random.default_rng(7)
+    frames = []
+    for site, n in [("Kangaroo Creek", 9_000), ("Little Coliban River", 4_000)]:
+        timestamps = pd.date_range("2024-01-30 17:00", periods=n, freq="15min")
+        # Gaps of whole hours and days, and readings out of order
+        keep = rng.random(n) > 0.1
+        keep[2_000:2_400] = False
+        frames.append(pd.DataFrame({
+            "source": "ecodetection",
+            "site": site,
+            "measurement": "Nephelo Turbidity",
+            "unit": "NTU",
+            "timestamp": timestamps[keep],
+            "value": rng.exponential(5, keep.sum()),
+        }).sample(frac=1, random_state=1))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _resampled(df, level):
+    # One row per non-empty bucket of each series, straight from resample
+    parts = []
+    for site, rows in df.sort_values("timestamp", kind="stable").groupby("site"):
+        buckets = rows.set_index("timestamp")["value"].resample(RULES[level]).agg(["min", "max", "mean", "count", "last"])
+        parts.append(buckets[buckets["count"] > 0].assign(site=site).reset_index())
+    return pd.concat(parts, ignore_index=True)
+
+
+@pytest.mark.parametrize("level", list(LEVELS))
+def test_rollup_matches_a_direct_resample(level):
+    df = _readings()
+    rollup = aggregate(df, level).sort_values(["site", "timestamp"], ignore_index=True)
+    expected = _resampled(df, level)
+    assert rollup["timestamp"].tolist() == expected["timestamp"].tolist()
+    assert rollup["site"].tolist() == expected["site"].tolist()
+    for column in ["min", "max", "mean", "last"]:
+        assert rollup[column].to_numpy() == pytest.approx(expected[column].to_numpy()), column
+    assert rollup["count"].tolist() == expected["count"].tolist()
+    assert (rollup["value"] == rollup["mean"]).all()
+
+
+def test_envelope_keeps_every_buckets_extremes():
+    df = _readings()
+    rollup = aggregate(df, "hourly")
+    pairs = envelope(rollup)
+    assert len(pairs) == 2 * len(rollup)
+    # Each bucket becomes its min row followed by its max row, in bucket order
+    assert pairs["value"].iloc[0::2].tolist() == rollup["min"].tolist()
+    assert pairs["value"].iloc[1::2].tolist() == rollup["max"].tolist()
+    assert pairs["timestamp"].iloc[0::2].tolist() == rollup["timestamp"].tolist()
+
+    # So the chart's highest and lowest points per day are the raw ones
+    raw = df.assign(day=df["timestamp"].dt.floor("D")).groupby(["site", "day"])["value"].agg(["min", "max"])
+    charted = pairs.assign(day=pairs["timestamp"].dt.floor("D")).groupby(["site", "day"])["value"].agg(["min", "max"])
+    pd.testing.assert_frame_equal(charted, raw)
+
+
+@pytest.mark.parametrize("days, level", [(3, "hourly"), (40, "hourly"), (400, "daily"), (3_000, "daily"), (8_000, "monthly")])
+def test_plan_resolution_picks_the_coarsest_level_with_enough_buckets(days, level):
+    start = pd.Timestamp("2000-01-01")
+    end = start + pd.Timedelta(days=days)
+    assert plan_resolution(start, end, raw_points=RAW_POINT_BUDGET + 1) == level
+
+    # Counted on a resample of a reading every 15 minutes over the window
+    readings = pd.Series(1.0, index=pd.date_range(start, end, freq="15min"))
+    buckets = {name: len(readings.resample(rule).count()) for name, rule in RULES.items()}
+    coarser = list(LEVELS)[:list(LEVELS).index(level)]
+    assert all(buckets[name] < MIN_POINTS for name in coarser)
+    if level != "hourly":
+        assert buckets[level] >= MIN_POINTS
+
+
+def test_plan_resolution_reads_raw_rows_within_the_budget():
+    start, end = pd.Timestamp("2000-01-01"), pd.Timestamp("2020-01-01")
+    assert plan_resolution(start, end, raw_points=RAW_POINT_BUDGET) == "raw"
+    # Without a count, a window too short for any level is read raw
+    assert plan_resolution(start, start + pd.Timedelta(days=3)) == "raw"
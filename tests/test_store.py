@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard.store as store_module
+from dashboard.schema import CANONICAL_SCHEMA, compact, concat
+from dashboard.store import SeriesStore, sync_ingested
+
+
+def _rows(site, timestamps, values, source="ecodetection", measurement="Nephelo Turbidity"):
+    return pd.DataFrame({
+        "source": source,
+        "site": site,
+        "measurement": measurement,
+        "timestamp": pd.to_datetime(timestamps),
+        "value": values,
+    })
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    # Ingested batches by name, in place of data/ingested
+    ingested = {}
+    monkeypatch.setattr(store_module, "ingested_versions", lambda: {"ecodetection": tuple(ingested)})
+    monkeypatch.setattr(store_module, "ingested_rows", lambda source, names: pd.concat([ingested[name] for name in names]))
+    return ingested
+
+
+def test_sync_applies_each_batch_once_and_retries_a_failed_one(batches):
+    store = SeriesStore(_rows("Kangaroo Creek", ["2024-01-01 00:00"], [1.0]))
+    batches["b1"] = _rows("Kangaroo Creek", ["2024-01-01 00:15"], [2.0])
+
+    def failing(rows):
+        raise OSError("disk gone")
+
+    with pytest.raises(OSError):
+        sync_ingested(store, failing)
+    assert store.versions == {}
+
+    applied = []
+    sync_ingested(store, applied.append)
+    sync_ingested(store, applied.append)
+    assert len(applied) == 1 and store.versions == {"ecodetection": ("b1",)}
+
+    # Only the new batch is read; b1 went to `applied` above, not into the store
+    batches["b2"] = _rows("Kangaroo Creek", ["2024-01-01 00:30"], [3.0])
+    sync_ingested(store)
+    assert store.partition(("ecodetection", "Kangaroo Creek", "Nephelo Turbidity"))["value"].tolist() == [1.0, 3.0]
+
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(8)
+    frames = []
+    for site in ["Kangaroo Creek", "Little Coliban River"]:
+        for measurement in ["Nephelo Turbidity", "pH"]:
+            timestamps = pd.date_range("2024-01-01", periods=3_000, freq="15min")[rng.random(3_000) > 0.2]
+            frames.append(_rows(site, timestamps, rng.normal(5, 2, len(timestamps)), measurement=measurement))
+    # Compact labels as in the canonical table, rows out of order
+    return compact(pd.concat(frames, ignore_index=True), CANONICAL_SCHEMA).sample(frac=1, random_state=2)
+
+
+def _masked(df, site, measurements, start, end):
+    mask = (df["site"] == site) & df["measurement"].isin(measurements)
+    if start is not None:
+        mask &= df["timestamp"] >= start
+    if end is not None:
+        mask &= df["timestamp"] <= end
+    expected = df[mask].sort_values("timestamp", kind="stable")
+    # Measurements in the order asked for
+    order = expected["measurement"].map({measurement: i for i, measurement in enumerate(measurements)}).astype(int)
+    return expected.iloc[np.argsort(order.to_numpy(), kind="stable")].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("measurements, start, end", [
+    (["Nephelo Turbidity"], "2024-01-10 03:00", "2024-01-20 17:45"),
+    (["pH", "Nephelo Turbidity"], "2024-01-10 03:07", "2024-01-10 03:07"),
+    (["pH", "Nephelo Turbidity"], None, "2024-01-05"),
+    (["Nephelo Turbidity", "pH"], "2024-01-30", None),
+    (["pH"], "2023-01-01", "2023-12-31"),
+    (["Conductivity"], None, None),
+])
+def test_slice_matches_a_boolean_mask(table, measurements, start, end):
+    store = SeriesStore(table)
+    start, end = (None if t is None else pd.Timestamp(t) for t in (start, end))
+    sliced = store.slice("ecodetection", "Kangaroo Creek", measurements, start, end).reset_index(drop=True)
+    expected = _masked(table, "Kangaroo Creek", measurements, start, end)
+    assert sliced["measurement"].astype("string").tolist() == expected["measurement"].astype("string").tolist()
+    assert sliced["timestamp"].tolist() == expected["timestamp"].tolist()
+    assert sliced["value"].tolist() == expected["value"].tolist()
+
+
+def test_merge_matches_a_deduplicated_concat(table):
+    store = SeriesStore(table)
+    old = table[table["site"] == "Kangaroo Creek"].head(500)
+    new = pd.concat([
+        # Corrections of existing readings, readings at new times and a new series
+        old.assign(value=old["value"] + 100),
+        _rows("Kangaroo Creek", pd.date_range("2024-03-01", periods=50, freq="15min"), 1.0),
+        _rows("Five Mile Creek - Woodend RWP Site 1", pd.date_range("2024-01-01", periods=50, freq="h"), 2.0),
+    ], ignore_index=True)
+    store.merge(compact(new, CANONICAL_SCHEMA))
+
+    merged = concat([table, compact(new, CANONICAL_SCHEMA)], ignore_index=True)
+    merged = merged.drop_duplicates(subset=["source", "site", "measurement", "timestamp"], keep="last")
+    for site in merged["site"].unique():
+        for measurement in merged.loc[merged["site"] == site, "measurement"].unique():
+            expected = _masked(merged, site, [measurement], None, None)
+            sliced = store.slice("ecodetection", site, [measurement])
+            assert sliced["timestamp"].tolist() == expected["timestamp"].tolist()
+            assert sliced["value"].tolist() == expected["value"].tolist()
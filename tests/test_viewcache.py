@@ -0,0 +1,106 @@
+import pandas as pd
+import pytest
+
+from dashboard.schema import footprint
+from dashboard.viewcache import ViewCache
+
+
+class Clock:
+    """A clock the tests move by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _frame(rows):
+    return pd.DataFrame({"value": range(rows)}, dtype="float64")
+
+
+SIZE = footprint(_frame(1_000))
+
+
+def _compute(value, calls):
+    def compute():
+        calls.append(value)
+        return value
+    return compute
+
+
+def test_hits_serve_the_stored_view():
+    cache, calls = ViewCache(max_bytes=10 * SIZE, ttl=60), []
+    first = cache.get("a", _compute(_frame(1_000), calls))
+    assert cache.get("a", _compute(_frame(1_000), calls)) is first
+    assert len(calls) == 1
+    assert cache.stats() == {"entries": 1, "bytes": SIZE, "max_bytes": 10 * SIZE, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_views_are_evicted_first():
+    cache, calls = ViewCache(max_bytes=3 * SIZE, ttl=60), []
+    for key in "abc":
+        cache.get(key, _compute(_frame(1_000), calls))
+    # Using "a" makes "b" the least recently used
+    cache.get("a", _compute(_frame(1_000), calls))
+    cache.get("d", _compute(_frame(1_000), calls))
+    assert cache.stats()["evictions"] == 1
+
+    calls.clear()
+    for key in "acd":
+        cache.get(key, _compute(_frame(1_000), calls))
+    assert calls == []
+    cache.get("b", _compute(_frame(1_000), calls))
+    assert len(calls) == 1
+
+
+def test_byte_budget():
+    # Room for three frames, and the list holding two of them
+    cache = ViewCache(max_bytes=3 * SIZE + 1_000, ttl=60)
+    cache.get("one", lambda: _frame(1_000))
+    cache.get("pair", lambda: [_frame(1_000), _frame(1_000)])
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] > 3 * SIZE
+
+    # A fourth frame is over the budget and evicts the oldest view, "one"
+    calls = []
+    cache.get("next", lambda: _frame(1_000))
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] <= cache.max_bytes
+    cache.get("pair", _compute(None, calls))
+    assert calls == []
+    cache.get("one", _compute(_frame(1_000), calls))
+    assert len(calls) == 1
+
+    # A view larger than the whole cache is returned but not kept, and evicts nothing
+    huge = cache.get("huge", lambda: _frame(10_000))
+    assert len(huge) == 10_000
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 2 and stats["bytes"] <= cache.max_bytes
+
+
+def test_views_expire_after_the_ttl():
+    clock, calls = Clock(), []
+    cache = ViewCache(max_bytes=10 * SIZE, ttl=60, clock=clock)
+    cache.get("a", _compute(_frame(1_000), calls))
+    clock.now = 59.9
+    cache.get("a", _compute(_frame(1_000), calls))
+    assert len(calls) == 1
+
+    clock.now = 60.0
+    cache.get("a", _compute(_frame(1_000), calls))
+    assert len(calls) == 2
+    # The recomputed view gets a new lifetime and replaces the expired one
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] == SIZE
+    clock.now = 119.9
+    cache.get("a", _compute(_frame(1_000), calls))
+    assert len(calls) == 2
+
+
+def test_clear():
+    cache = ViewCache(max_bytes=10 * SIZE, ttl=60)
+    cache.get("a", lambda: _frame(1_000))
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    with pytest.raises(ZeroDivisionError):
+        # A failing computation leaves nothing behind
+        cache.get("a", lambda: 1 / 0)
+    assert cache.stats()["entries"] == 0
@@ -1,6 +1,6 @@
 import streamlit as st
-import pandas as pd
 from pathlib import Path
+from dashboard.ingest import ingest_upload
 
 # Define the path to the presentation file
 presentation_path = Path(__file__).parent / 'assets' / "Barwon Of A Kind.pptx"
@@ -58,19 +58,29 @@ st.markdown("Upload new data files to update the dashboard. You can upload **CSV
 # Allow multiple file uploads
 uploaded_files = st.file_uploader("Choose CSV or Excel files", type=["csv", "xlsx"], accept_multiple_files=True)
 
+# Files already ingested in this session, so a rerun does not ingest them again
+ingested_files = st.session_state.setdefault("ingested_files", {})
+
 if uploaded_files:
     for uploaded_file in uploaded_files:
-        # Check file extension and load data accordingly
-        if uploaded_file.name.endswith(".csv"):
-            data = pd.read_csv(uploaded_file)
-            st.success(f"Uploaded CSV file: {uploaded_file.name}")
-        elif uploaded_file.name.endswith(".xlsx"):
-            data = pd.read_excel(uploaded_file, sheet_name=None)  # Load all sheets if it's Excel
-            st.success(f"Uploaded Excel file: {uploaded_file.name}")
-        
-        # Display the uploaded data
-        st.write(f"**Data preview from {uploaded_file.name}:**")
-        st.write(data)
-        
-        # Here, you could add functionality to process, save, or update the dashboard with the new data
-        # For now, we're just showing the data as a preview
+        if uploaded_file.file_id not in ingested_files:
+            try:
+                # Recorded once every sheet has been processed; sheets that fail carry their own error
+                ingested_files[uploaded_file.file_id] = ingest_upload(uploaded_file.getvalue(), uploaded_file.name)
+            except ValueError as error:
+                # The file could not be read at all, so nothing was ingested
+                st.error(f"Could not read {uploaded_file.name}: {error}")
+                continue
+
+        # Report what was added; the pages pick up new data on their next run
+        for result in ingested_files[uploaded_file.file_id]:
+            if result.error is not None:
+                st.error(f"Could not ingest {result.name}: {result.error}.")
+            elif result.batch is None:
+                st.info(f"{result.name}: this {result.schema} data has already been ingested.")
+            else:
+                sites = sorted({site for site, _ in result.partitions})
+                st.success(
+                    f"Ingested {result.rows:,} {result.schema} rows from {result.name} "
+                    f"({len(result.partitions)} series across {', '.join(sites)})."
+                )